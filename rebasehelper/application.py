@@ -21,11 +21,15 @@
 #          Tomas Hozza <thozza@redhat.com>
 
 from __future__ import print_function
+import base64
 import fnmatch
+import multiprocessing
 import os
 import shutil
 import logging
 
+from multiprocessing.pool import ThreadPool
+
 import git
 import six
 
@@ -40,19 +44,40 @@ from rebasehelper.utils import PathHelper, GitHelper, KojiHelper, FileHelper, Ma
 from rebasehelper.utils import LookasideCacheHelper
 from rebasehelper.checker import checkers_runner
 from rebasehelper.build_helper import SRPMBuilder, Builder, SourcePackageBuildError, BinaryPackageBuildError
+from rebasehelper.build_cache import BuildCache
+from rebasehelper.checkpoint import CheckpointManifest
+from rebasehelper.source_cache import SourceCache
 from rebasehelper.patch_helper import Patcher
 from rebasehelper.exceptions import RebaseHelperError, CheckerNotFoundError
 from rebasehelper.results_store import results_store
+from rebasehelper.profiler import StageProfiler
+from rebasehelper.scheduler import Stage, StageScheduler, StageFailure
+from rebasehelper.timing import timings
 from rebasehelper.versioneer import versioneers_runner
 from rebasehelper.version import VERSION
 
 
+def _extract_archive(job):
+    # runs in a worker process, errors and timings are passed to the parent process
+    archive_path, destination = job
+    recorded = len(timings.get_events())
+    try:
+        Application.extract_archive(archive_path, destination)
+    except RebaseHelperError as e:
+        error = e.msg
+    else:
+        error = None
+    return error, timings.get_events()[recorded:]
+
+
 class Application(object):
     result_file = ""
     temp_dir = ""
     kwargs = {}
     old_sources = ""
     new_sources = ""
+    # new sources archive that was extracted while it was being downloaded
+    streamed_sources = None
     old_rest_sources = []
     new_rest_sources = []
     spec_file = None
@@ -63,6 +88,10 @@ class Application(object):
     report_log_file = None
     rebased_patches = {}
     rebased_repo = None
+    # identifier of mock buildroots, set when more rebases are running at the same time
+    buildroot_id = None
+    # whether results are reported by output tools, batch mode reports results of all packages at once
+    output_tools_enabled = True
 
     def __init__(self, cli_conf, execution_dir, results_dir, debug_log_file):
         """
@@ -72,6 +101,7 @@ class Application(object):
         :return:
         """
         results_store.clear()
+        timings.clear()
 
         self.conf = cli_conf
         self.execution_dir = execution_dir
@@ -95,25 +125,49 @@ class Application(object):
 
         logger.debug("Rebase-helper version: %s", VERSION)
 
-        if self.conf.build_tasks is None:
-            # check the workspace dir
-            if not self.conf.cont:
-                self._check_workspace_dir()
-
-            self._get_spec_file()
-            self._prepare_spec_objects()
-
-            if self.conf.update_sources:
-                sources = [os.path.basename(s) for s in self.spec_file.sources]
-                rebased_sources = [os.path.basename(s) for s in self.rebase_spec_file.sources]
-                uploaded = LookasideCacheHelper.update_sources('fedpkg', self.rebased_sources_dir,
-                                                               self.rebase_spec_file.get_package_name(),
-                                                               sources, rebased_sources)
-                self._update_gitignore(uploaded, self.rebased_sources_dir)
-
-            # TODO: Remove the value from kwargs and use only CLI attribute!
-            self.kwargs['continue'] = self.conf.cont
-            self._initialize_data()
+        # stages completed by a previous run are skipped when continuing,
+        # results of remote builds can't be restored, so there are no checkpoints for them
+        self.checkpoint = None
+        if self.conf.build_tasks is None and not self.conf.builds_nowait and not self.conf.comparepkgs:
+            self.checkpoint = CheckpointManifest(self.results_dir)
+            if self.conf.cont:
+                self.checkpoint.load()
+
+        self.build_cache = None
+        if self.conf.build_cache_dir and self.conf.build_tasks is None:
+            self.build_cache = BuildCache(os.path.abspath(os.path.expanduser(self.conf.build_cache_dir)),
+                                          int(self.conf.build_cache_size) * 1024 * 1024)
+        self.source_cache = None
+        if self.conf.source_cache_dir:
+            # sources are modified only by git, which replaces files instead of rewriting them,
+            # unless the user resolves conflicts or works with the kept workspace
+            hardlinks = self.conf.non_interactive and not self.conf.keep_workspace
+            self.source_cache = SourceCache(os.path.abspath(os.path.expanduser(self.conf.source_cache_dir)),
+                                            int(self.conf.source_cache_size) * 1024 * 1024, hardlinks)
+
+        self.profiler = StageProfiler(os.path.join(self.results_dir, constants.PROFILE_DIR),
+                                      enabled=bool(self.conf.profile))
+
+        with self.profiler.profile('initialization'):
+            if self.conf.build_tasks is None:
+                # check the workspace dir
+                if not self.conf.cont:
+                    self._check_workspace_dir()
+
+                self._get_spec_file()
+                self._prepare_spec_objects()
+
+                if self.conf.update_sources:
+                    sources = [os.path.basename(s) for s in self.spec_file.sources]
+                    rebased_sources = [os.path.basename(s) for s in self.rebase_spec_file.sources]
+                    uploaded = LookasideCacheHelper.update_sources('fedpkg', self.rebased_sources_dir,
+                                                                   self.rebase_spec_file.get_package_name(),
+                                                                   sources, rebased_sources)
+                    self._update_gitignore(uploaded, self.rebased_sources_dir)
+
+                # TODO: Remove the value from kwargs and use only CLI attribute!
+                self.kwargs['continue'] = self.conf.cont
+                self._initialize_data()
 
         if self.conf.cont or self.conf.build_only:
             self._delete_old_builds()
@@ -192,15 +246,16 @@ class Application(object):
                                                              self.rebased_sources_dir)
 
         # check if argument passed as new source is a file or just a version
-        if [True for ext in Archive.get_supported_archives() if self.conf.sources.endswith(ext)]:
-            logger.debug("argument passed as a new source is a file")
-            self.rebase_spec_file.set_version_using_archive(self.conf.sources)
-        else:
-            logger.debug("argument passed as a new source is a version")
-            version, extra_version, separator = SpecFile.split_version_string(self.conf.sources)
-            self.rebase_spec_file.set_version(version)
-            self.rebase_spec_file.set_extra_version_separator(separator)
-            self.rebase_spec_file.set_extra_version(extra_version)
+        with self.rebase_spec_file.edit():
+            if [True for ext in Archive.get_supported_archives() if self.conf.sources.endswith(ext)]:
+                logger.debug("argument passed as a new source is a file")
+                self.rebase_spec_file.set_version_using_archive(self.conf.sources)
+            else:
+                logger.debug("argument passed as a new source is a version")
+                version, extra_version, separator = SpecFile.split_version_string(self.conf.sources)
+                self.rebase_spec_file.set_version(version)
+                self.rebase_spec_file.set_extra_version_separator(separator)
+                self.rebase_spec_file.set_extra_version(extra_version)
 
         if not self.conf.skip_version_check and parse_version(self.rebase_spec_file.get_version()) \
                 <= parse_version(self.spec_file.get_version()):
@@ -212,7 +267,11 @@ class Application(object):
         # spec file object has been sanitized downloading can proceed
         for spec_file in [self.spec_file, self.rebase_spec_file]:
             if spec_file.download:
-                spec_file.download_remote_sources()
+                extract_archive_to = None
+                if spec_file is self.rebase_spec_file and self.conf.extract_while_downloading and not self.conf.cont:
+                    extract_archive_to = os.path.join(self.workspace_dir, constants.NEW_SOURCES_DIR)
+                if spec_file.download_remote_sources(extract_archive_to):
+                    self.streamed_sources = os.path.abspath(spec_file.get_sources()[0])
                 # parse spec again with sources downloaded to properly expand %prep section
                 spec_file._update_data()  # pylint: disable=protected-access
 
@@ -354,10 +413,58 @@ class Application(object):
             raise RebaseHelperError("Archive '%s' is damaged" % archive_path)
 
     @staticmethod
-    def extract_sources(archive_path, destination):
-        """Function extracts a given Archive and returns a full dirname to sources"""
-        Application.extract_archive(archive_path, destination)
+    def extract_archives(jobs, workers=0, cache=None):
+        """
+        Extracts archives concurrently in a pool of worker processes.
+
+        :param jobs: list of tuples (path to an archive, destination)
+        :param workers: maximal number of archives extracted at the same time, 0 means number of CPUs
+        :param cache: SourceCache instance to materialize cached trees from and store extracted ones in
+        :return:
+        """
+        if cache:
+            keys = {}
+            pending = []
+            for archive_path, destination in jobs:
+                key = cache.get_key(archive_path)
+                if cache.restore(key, destination):
+                    logger.debug("Restored '%s' from source cache", os.path.basename(archive_path))
+                else:
+                    # don't cache content that was in the destination before
+                    keys[destination] = None if os.path.lexists(destination) else key
+                    pending.append((archive_path, destination))
+            Application.extract_archives(pending, workers)
+            for _, destination in pending:
+                cache.store(keys[destination], destination)
+            return
+        if not jobs:
+            return
+        workers = min(workers or multiprocessing.cpu_count(), len(jobs))
+        # daemonic processes, e.g. workers of rebase-helper-batch, are not allowed to have children
+        if workers == 1 or multiprocessing.current_process().daemon:
+            for archive_path, destination in jobs:
+                Application.extract_archive(archive_path, destination)
+            return
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(_extract_archive, jobs, chunksize=1)
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+        for _, events in results:
+            for event in events:
+                timings.record(event['category'], event['name'], event['start'], event['duration'], event['args'])
+        errors = [error for error, _ in results if error]
+        if errors:
+            raise RebaseHelperError(errors[0])
 
+    @staticmethod
+    def get_sources_dir(destination):
+        """Function returns a full dirname to sources extracted into a given destination"""
         files = os.listdir(destination)
 
         if not files:
@@ -371,18 +478,63 @@ class Application(object):
         # archive without top-level directory
         return destination
 
+    @staticmethod
+    def extract_sources(archive_path, destination, cache=None):
+        """Function extracts a given Archive and returns a full dirname to sources"""
+        if cache:
+            Application.extract_archives([(archive_path, destination)], 1, cache)
+        else:
+            Application.extract_archive(archive_path, destination)
+        return Application.get_sources_dir(destination)
+
+    def _get_rest_archives(self):
+        """Returns list of tuples (version, spec file, sources dir, archive) of the rest of source archives."""
+        rest_sources = [self.old_rest_sources, self.new_rest_sources]
+        spec_files = [self.spec_file, self.rebase_spec_file]
+        sources_dirs = [
+            os.path.join(constants.WORKSPACE_DIR, constants.OLD_SOURCES_DIR),
+            os.path.join(constants.WORKSPACE_DIR, constants.NEW_SOURCES_DIR),
+        ]
+        result = []
+        for version, sources, spec_file, sources_dir in zip(['old', 'new'], rest_sources, spec_files, sources_dirs):
+            for rest in sources:
+                archive = [x for x in Archive.get_supported_archives() if rest.endswith(x)]
+                if archive:
+                    result.append((version, spec_file, sources_dir, rest))
+        return result
+
     def prepare_sources(self):
         """
         Function prepares a sources.
 
+        All archives are extracted at once in a pool of worker processes. The rest of source
+        archives is extracted aside, their target directories are known only after the top-level
+        directory of the new sources is determined. The new sources archive is skipped if it was
+        extracted while it was being downloaded.
+
         :return:
         """
 
         old_sources_dir = os.path.join(self.execution_dir, constants.WORKSPACE_DIR, constants.OLD_SOURCES_DIR)
         new_sources_dir = os.path.join(self.execution_dir, constants.WORKSPACE_DIR, constants.NEW_SOURCES_DIR)
+        rest_sources_dir = os.path.join(self.execution_dir, constants.WORKSPACE_DIR, constants.REST_SOURCES_DIR)
 
-        old_dir = Application.extract_sources(self.old_sources, old_sources_dir)
-        new_dir = Application.extract_sources(self.new_sources, new_sources_dir)
+        jobs = [(self.old_sources, old_sources_dir)]
+        if self.streamed_sources == self.new_sources and os.path.isdir(new_sources_dir):
+            logger.debug("New sources were extracted while they were being downloaded")
+            if self.source_cache:
+                self.source_cache.store(SourceCache.get_key(self.new_sources), new_sources_dir)
+        else:
+            jobs.append((self.new_sources, new_sources_dir))
+        extracted = {}
+        for index, (version, spec_file, _, rest) in enumerate(self._get_rest_archives()):
+            if spec_file.find_archive_target_in_prep(rest):
+                extracted[(version, rest)] = os.path.join(rest_sources_dir, str(index))
+                jobs.append((rest, extracted[(version, rest)]))
+        Application.extract_archives(jobs, self.conf.extraction_workers, self.source_cache)
+
+        old_dir = Application.get_sources_dir(old_sources_dir)
+        new_dir = Application.get_sources_dir(new_sources_dir)
 
         old_tld = os.path.relpath(old_dir, old_sources_dir)
         new_tld = os.path.relpath(new_dir, new_sources_dir)
@@ -396,40 +548,76 @@ class Application(object):
             if new_tld == dirs[0]:
                 new_dir = os.path.join(new_dir, *dirs[1:])
 
+        self._update_setup_dirname(new_dir)
+
+        # move rest of source archives to correct paths
+        for version, spec_file, sources_dir, rest in self._get_rest_archives():
+            dest_dir = spec_file.find_archive_target_in_prep(rest)
+            if dest_dir:
+                destination = os.path.join(self.execution_dir, sources_dir, dest_dir)
+                if (version, rest) not in extracted:
+                    # extract aside as well, files materialized from the source cache must be replaced,
+                    # not rewritten in place
+                    extracted[(version, rest)] = os.path.join(rest_sources_dir,
+                                                              '{}-{}'.format(version, os.path.basename(rest)))
+                    Application.extract_archives([(rest, extracted[(version, rest)])], 1, self.source_cache)
+                FileHelper.move_tree(extracted[(version, rest)], destination)
+                # fails if nothing was extracted
+                Application.get_sources_dir(destination)
+        if os.path.isdir(rest_sources_dir):
+            shutil.rmtree(rest_sources_dir)
+
+        return [old_dir, new_dir]
+
+    def _copy_sources_for_checkers(self, sources, replace=False):
+        """
+        Copies extracted sources for checkers inspecting them, so that the checkers can run
+        while the original sources are being patched.
+
+        :param sources: dict with paths to old and new sources
+        :param replace: whether to replace copies made by a previous run
+        :return: dict with paths to the copies or to the original sources if no checker inspects them
+        """
+        checkers = [c for c in self.conf.pkgcomparetool or []
+                    if any(t.get_category() == 'SOURCE' and t.match(c)
+                           for t in six.itervalues(checkers_runner.plugin_classes))]
+        if not checkers:
+            return dict(sources)
+        copies = {}
+        for version in ['old', 'new']:
+            copies[version] = os.path.join(self.execution_dir, constants.WORKSPACE_DIR,
+                                           constants.CHECKED_SOURCES_DIR, version)
+            if replace and os.path.isdir(copies[version]):
+                shutil.rmtree(copies[version])
+            if not os.path.isdir(copies[version]):
+                shutil.copytree(sources[version], copies[version], symlinks=True)
+        return copies
+
+    def _update_setup_dirname(self, new_dir):
+        """Updates name of the top-level directory of the new sources in the rebased SPEC file."""
+        new_sources_dir = os.path.join(self.execution_dir, constants.WORKSPACE_DIR, constants.NEW_SOURCES_DIR)
         new_dirname = os.path.relpath(new_dir, new_sources_dir)
 
         if new_dirname != '.':
             self.rebase_spec_file.update_setup_dirname(new_dirname)
 
-        # extract rest of source archives to correct paths
-        rest_sources = [self.old_rest_sources, self.new_rest_sources]
-        spec_files = [self.spec_file, self.rebase_spec_file]
-        sources_dirs = [
-            os.path.join(constants.WORKSPACE_DIR, constants.OLD_SOURCES_DIR),
-            os.path.join(constants.WORKSPACE_DIR, constants.NEW_SOURCES_DIR),
-        ]
-        for sources, spec_file, sources_dir in zip(rest_sources, spec_files, sources_dirs):
-            for rest in sources:
-                archive = [x for x in Archive.get_supported_archives() if rest.endswith(x)]
-                if archive:
-                    dest_dir = spec_file.find_archive_target_in_prep(rest)
-                    if dest_dir:
-                        Application.extract_sources(rest, os.path.join(self.execution_dir, sources_dir, dest_dir))
-
-        return [old_dir, new_dir]
-
     def patch_sources(self, sources):
         # Patch sources
         patch = Patcher('git')
         self.rebase_spec_file.update_changelog(self.rebase_spec_file.get_new_log())
         try:
-            self.rebased_patches = patch.patch(sources[0],
-                                               sources[1],
-                                               self.old_rest_sources,
-                                               self.spec_file.get_applied_patches(),
-                                               **self.kwargs)
+            rebased_patches = patch.patch(sources[0],
+                                          sources[1],
+                                          self.old_rest_sources,
+                                          self.spec_file.get_applied_patches(),
+                                          **self.kwargs)
         except RuntimeError:
             raise RebaseHelperError('Patching failed')
+        self._set_rebased_patches(rebased_patches)
+
+    def _set_rebased_patches(self, rebased_patches):
+        """Updates the rebased SPEC file according to results of patching."""
+        self.rebased_patches = rebased_patches
         self.rebase_spec_file.write_updated_patches(self.rebased_patches,
                                                     self.conf.disable_inapplicable_patches)
         results_store.set_patches_results(self.rebased_patches)
@@ -515,45 +703,305 @@ class Application(object):
         ]
         return {k: v for k, v in six.iteritems(build_dict) if k not in blacklist}
 
-    def build_source_packages(self):
+    def _get_buildroot_ext(self, version, concurrent=False):
+        """
+        Gets unique extension of the mock buildroot used for building the given version.
+
+        Builds running at the same time must not share a buildroot, because mock
+        would make them wait for each other.
+
+        :param version: 'old' or 'new'
+        :param concurrent: whether the other version is being built at the same time
+        :return: buildroot extension or None if the default buildroot can be used
+        """
+        if concurrent:
+            return '{}-{}'.format(self.buildroot_id or 'rebase-helper', version)
+        return self.buildroot_id
+
+    def _get_build_cache_key(self, *options):
+        """
+        Computes key of the old build in the build cache.
+
+        :param options: values of options affecting the build
+        :return: key of the build cache entry
+        """
+        files = self.spec_file.get_sources() + [p.get_path() for p in self.spec_file.get_patches()]
+        return self.build_cache.get_key([''.join(self.spec_file.spec_content)] + list(options), files)
+
+    def _build_source_package(self, builder, version, concurrent=False):
+        """
+        Builds SRPM of the given version and stores the build data.
+
+        :param builder: SRPMBuilder instance
+        :param version: 'old' or 'new'
+        :param concurrent: whether the other version is being built at the same time
+        :return: None
+        """
+        results_dir = '{}-build'.format(os.path.join(self.results_dir, version))
+        spec = self.spec_file if version == 'old' else self.rebase_spec_file
+        package_name = spec.get_package_name()
+        package_version = spec.get_version()
+        package_full_version = spec.get_full_version()
+        cache_key = None
+        if version == 'old' and self.build_cache:
+            cache_key = self._get_build_cache_key('SRPM', self.conf.srpm_buildtool, self.conf.srpm_builder_options)
+            build_dict = self.build_cache.restore(cache_key, results_dir, 'SRPM')
+            if build_dict:
+                logger.info('Using cached source package for %s version %s', package_name, package_full_version)
+                results_store.set_build_data(version, build_dict)
+                return
+        logger.info('Building source package for %s version %s', package_name, package_full_version)
+        build_dict = dict(
+            name=package_name,
+            version=package_version,
+            srpm_buildtool=self.conf.srpm_buildtool,
+            srpm_builder_options=self.conf.srpm_builder_options)
+        build_kwargs = dict(build_dict)
+        uniqueext = self._get_buildroot_ext(version, concurrent)
+        if uniqueext:
+            build_kwargs['uniqueext'] = uniqueext
+        try:
+            build_dict.update(builder.build(spec, results_dir, **build_kwargs))
+            build_dict = self._sanitize_build_dict(build_dict)
+            results_store.set_build_data(version, build_dict)
+            if cache_key:
+                self.build_cache.store(cache_key, results_dir, 'SRPM', build_dict)
+        except RebaseHelperError:
+            raise
+        except SourcePackageBuildError as e:
+            if concurrent:
+                # logs stored in the build tool class could belong to the other build
+                logs = dict(logs=PathHelper.find_all_files(os.path.join(results_dir, 'SRPM'), '*.log'))
+            else:
+                logs = builder.get_logs()
+            build_dict.update(logs)
+            build_dict['source_package_build_error'] = six.text_type(e)
+            build_dict = self._sanitize_build_dict(build_dict)
+            results_store.set_build_data(version, build_dict)
+            if e.logfile:
+                msg = 'Building {} SRPM packages failed; see {} for more information'.format(version, e.logfile)
+            else:
+                msg = 'Building {} SRPM packages failed; see logs in {} for more information'.format(
+                    version, os.path.join(results_dir, 'SRPM'))
+            raise RebaseHelperError(msg, logfiles=logs.get('logs'))
+        except Exception:
+            raise RebaseHelperError('Building package failed with unknown reason. '
+                                    'Check all available log files.')
+
+    def _get_srpm_builder(self):
         try:
-            builder = SRPMBuilder(self.conf.srpm_buildtool)
+            return SRPMBuilder(self.conf.srpm_buildtool)
         except NotImplementedError as e:
             raise RebaseHelperError('{}. Supported SRPM build tools are {}'.format(
                 six.text_type(e), SRPMBuilder.get_supported_tools()))
 
-        for version in ['old', 'new']:
-            results_dir = '{}-build'.format(os.path.join(self.results_dir, version))
+    def build_source_packages(self):
+        builder = self._get_srpm_builder()
+        versions = ['old', 'new']
+        if not self.conf.parallel_builds:
+            for version in versions:
+                self._build_source_package(builder, version)
+            return
+
+        def build(version):
+            try:
+                self._build_source_package(builder, version, concurrent=True)
+            except RebaseHelperError as e:
+                return e
+            return None
+
+        pool = ThreadPool(len(versions))
+        try:
+            errors = pool.map(build, versions)
+        finally:
+            pool.close()
+            pool.join()
+        # report failures in the same order as the sequential build would
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def _prepare_binary_build(self, builder, version):
+        """
+        Gathers build data of the given version and prepares the builder.
+
+        :param builder: Builder instance
+        :param version: 'old' or 'new'
+        :return: tuple (spec, build_dict, task_id, koji_build_id)
+        """
+        spec = None
+        task_id = None
+        koji_build_id = None
+        build_dict = {}
+
+        if self.conf.build_tasks is None:
             spec = self.spec_file if version == 'old' else self.rebase_spec_file
             package_name = spec.get_package_name()
             package_version = spec.get_version()
             package_full_version = spec.get_full_version()
-            logger.info('Building source package for %s version %s', package_name, package_full_version)
+
+            if version == 'old' and self.conf.get_old_build_from_koji:
+                if KojiHelper.functional:
+                    session = KojiHelper.create_session()
+                    koji_version, koji_build_id = KojiHelper.get_latest_build(session, package_name)
+                    if koji_version:
+                        if koji_version != package_version:
+                            logger.warning('Version of the latest Koji build (%s) with id (%s) '
+                                           'differs from version in SPEC file (%s)!',
+                                           koji_version, koji_build_id, package_version)
+                        package_version = package_full_version = koji_version
+                    else:
+                        logger.warning('Unable to find the latest Koji build!')
+                else:
+                    logger.warning('Unable to get the latest Koji build!')
+
             build_dict = dict(
                 name=package_name,
                 version=package_version,
-                srpm_buildtool=self.conf.srpm_buildtool,
-                srpm_builder_options=self.conf.srpm_builder_options)
-            try:
-                build_dict.update(builder.build(spec, results_dir, **build_dict))
-                build_dict = self._sanitize_build_dict(build_dict)
-                results_store.set_build_data(version, build_dict)
-            except RebaseHelperError:
-                raise
-            except SourcePackageBuildError as e:
-                build_dict.update(builder.get_logs())
-                build_dict['source_package_build_error'] = six.text_type(e)
+                builds_nowait=self.conf.builds_nowait,
+                build_tasks=self.conf.build_tasks,
+                builder_options=self.conf.builder_options,
+                srpm=results_store.get_build(version).get('srpm'),
+                srpm_logs=results_store.get_build(version).get('logs'))
+
+            # prepare for building
+            builder.prepare(spec, self.conf)
+
+            logger.info('Building binary packages for %s version %s', package_name, package_full_version)
+        else:
+            task_id = self.conf.build_tasks[0] if version == 'old' else self.conf.build_tasks[1]
+
+        return spec, build_dict, task_id, koji_build_id
+
+    def _build_binary_package(self, builder, version, spec, build_dict, task_id, koji_build_id,
+                              concurrent=False):
+        """
+        Makes one attempt to build binary packages of the given version.
+
+        :param builder: Builder instance
+        :param version: 'old' or 'new'
+        :param concurrent: whether the other version is being built at the same time
+        :return: tuple (build_dict, error), error is None if the build succeeded
+        """
+        results_dir = '{}-build'.format(os.path.join(self.results_dir, version))
+        cache_key = None
+        if version == 'old' and self.build_cache and not koji_build_id and not self.conf.builds_nowait:
+            cache_key = self._get_build_cache_key('RPM', self.conf.srpm_buildtool, self.conf.srpm_builder_options,
+                                                  self.conf.buildtool, self.conf.builder_options)
+            cached = self.build_cache.restore(cache_key, results_dir, 'RPM')
+            if cached:
+                logger.info('Using cached binary packages for %s version %s', build_dict['name'], build_dict['version'])
+                build_dict.update(cached)
                 build_dict = self._sanitize_build_dict(build_dict)
                 results_store.set_build_data(version, build_dict)
-                if e.logfile:
-                    msg = 'Building {} SRPM packages failed; see {} for more information'.format(version, e.logfile)
+                return build_dict, None
+        try:
+            if self.conf.build_tasks is None:
+                if koji_build_id:
+                    session = KojiHelper.create_session()
+                    build_dict['rpm'], build_dict['logs'] = KojiHelper.download_build(session,
+                                                                                      koji_build_id,
+                                                                                      results_dir)
                 else:
-                    msg = 'Building {} SRPM packages failed; see logs in {} for more information'.format(
-                        version, os.path.join(results_dir, 'SRPM'))
-                raise RebaseHelperError(msg, logfiles=builder.get_logs().get('logs'))
-            except Exception:
-                raise RebaseHelperError('Building package failed with unknown reason. '
-                                        'Check all available log files.')
+                    build_kwargs = dict(build_dict)
+                    uniqueext = self._get_buildroot_ext(version, concurrent)
+                    if uniqueext:
+                        build_kwargs['uniqueext'] = uniqueext
+                    build_dict.update(builder.build(spec, results_dir, **build_kwargs))
+                    if concurrent:
+                        # logs stored in the build tool class are shared by both builds
+                        build_dict['logs'] = PathHelper.find_all_files(os.path.join(results_dir, 'RPM'), '*.log')
+            if builder.creates_tasks() and task_id and not koji_build_id:
+                if not self.conf.builds_nowait:
+                    build_dict['rpm'], build_dict['logs'] = builder.wait_for_task(build_dict,
+                                                                                  task_id,
+                                                                                  results_dir)
+                elif self.conf.build_tasks:
+                    build_dict['rpm'], build_dict['logs'] = builder.get_detached_task(task_id, results_dir)
+            build_dict = self._sanitize_build_dict(build_dict)
+            results_store.set_build_data(version, build_dict)
+            if cache_key:
+                self.build_cache.store(cache_key, results_dir, 'RPM', build_dict)
+        except (RebaseHelperError, BinaryPackageBuildError) as e:
+            return build_dict, e
+        except Exception:  # pylint: disable=broad-except
+            return build_dict, RebaseHelperError('Building package failed with unknown reason. '
+                                                 'Check all available log files.')
+        return build_dict, None
+
+    def _handle_binary_build_error(self, builder, version, build_dict, error, concurrent=False):
+        """
+        Stores data of a failed build and asks whether to try the build again.
+
+        :param builder: Builder instance
+        :param version: 'old' or 'new'
+        :param build_dict: build data
+        :param error: BinaryPackageBuildError instance
+        :param concurrent: whether the failed build was run at the same time as the other one
+        :return: True if the build should be retried, raises RebaseHelperError otherwise
+        """
+        results_dir = '{}-build'.format(os.path.join(self.results_dir, version))
+        if concurrent:
+            logs = dict(logs=PathHelper.find_all_files(os.path.join(results_dir, 'RPM'), '*.log'))
+        else:
+            logs = builder.get_logs()
+        build_dict.update(logs)
+        build_dict['binary_package_build_error'] = six.text_type(error)
+        build_dict = self._sanitize_build_dict(build_dict)
+        results_store.set_build_data(version, build_dict)
+
+        if error.logfile is None:
+            msg = 'Building {} RPM packages failed; see logs in {} for more information'.format(
+                version, os.path.join(results_dir, 'RPM')
+            )
+        else:
+            msg = 'Building {} RPM packages failed; see {} for more information'.format(version, error.logfile)
+
+        logger.info(msg)
+        if self.rebase_spec_file:
+            # Save current rebase spec file content
+            self.rebase_spec_file.save()
+        if not self.conf.non_interactive and \
+                ConsoleHelper.get_message('Do you want to try it one more time'):
+            return True
+        raise RebaseHelperError(msg, logfiles=logs.get('logs'))
+
+    def _prepare_binary_rebuild(self, version):
+        """Lets user modify the rebase spec file and cleans up results of the failed build."""
+        results_dir = '{}-build'.format(os.path.join(self.results_dir, version))
+        logger.info('Now it is time to make changes to  %s if necessary.', self.rebase_spec_file.path)
+        if not ConsoleHelper.get_message('Do you want to continue with the rebuild now'):
+            raise KeyboardInterrupt
+        # Update rebase spec file content after potential manual modifications
+        self.rebase_spec_file._read_spec_content()  # pylint: disable=protected-access
+        self.rebase_spec_file._update_data()  # pylint: disable=protected-access
+        # clear current version output directories
+        if os.path.exists(os.path.join(results_dir, 'RPM')):
+            shutil.rmtree(os.path.join(results_dir, 'RPM'))
+
+    def _build_binary_packages_concurrently(self, builder, versions):
+        """
+        Builds binary packages of all versions at the same time.
+
+        :param builder: Builder instance
+        :param versions: list of versions to build
+        :return: dict mapping versions to results of the build attempts
+        """
+        # preparation can interact with user, run it sequentially
+        prepared = [self._prepare_binary_build(builder, version) for version in versions]
+
+        def build(args):
+            version, (spec, build_dict, task_id, koji_build_id) = args
+            return self._build_binary_package(builder, version, spec, build_dict, task_id, koji_build_id,
+                                              concurrent=True)
+
+        pool = ThreadPool(len(versions))
+        try:
+            attempts = pool.map(build, list(zip(versions, prepared)))
+        finally:
+            pool.close()
+            pool.join()
+        return dict(zip(versions, attempts))
 
     def build_binary_packages(self):
         """Function calls build class for building packages"""
@@ -563,114 +1011,30 @@ class Application(object):
             raise RebaseHelperError('{}. Supported build tools are {}'.format(
                 six.text_type(e), Builder.get_supported_tools()))
 
-        for version in ['old', 'new']:
-            successful_builds = 0
-            try_build_again = False
-            while successful_builds < 1:
-                results_dir = '{}-build'.format(os.path.join(self.results_dir, version))
-                spec = None
-                task_id = None
-                koji_build_id = None
-                build_dict = {}
-
-                if self.conf.build_tasks is None:
-                    spec = self.spec_file if version == 'old' else self.rebase_spec_file
-                    package_name = spec.get_package_name()
-                    package_version = spec.get_version()
-                    package_full_version = spec.get_full_version()
-
-                    if version == 'old' and self.conf.get_old_build_from_koji:
-                        if KojiHelper.functional:
-                            session = KojiHelper.create_session()
-                            koji_version, koji_build_id = KojiHelper.get_latest_build(session, package_name)
-                            if koji_version:
-                                if koji_version != package_version:
-                                    logger.warning('Version of the latest Koji build (%s) with id (%s) '
-                                                   'differs from version in SPEC file (%s)!',
-                                                   koji_version, koji_build_id, package_version)
-                                package_version = package_full_version = koji_version
-                            else:
-                                logger.warning('Unable to find the latest Koji build!')
-                        else:
-                            logger.warning('Unable to get the latest Koji build!')
-
-                    build_dict = dict(
-                        name=package_name,
-                        version=package_version,
-                        builds_nowait=self.conf.builds_nowait,
-                        build_tasks=self.conf.build_tasks,
-                        builder_options=self.conf.builder_options,
-                        srpm=results_store.get_build(version).get('srpm'),
-                        srpm_logs=results_store.get_build(version).get('logs'))
-
-                    # prepare for building
-                    builder.prepare(spec, self.conf)
-
-                    logger.info('Building binary packages for %s version %s', package_name, package_full_version)
-                else:
-                    task_id = self.conf.build_tasks[0] if version == 'old' else self.conf.build_tasks[1]
-
-                try:
-                    if self.conf.build_tasks is None:
-                        if koji_build_id:
-                            session = KojiHelper.create_session()
-                            build_dict['rpm'], build_dict['logs'] = KojiHelper.download_build(session,
-                                                                                              koji_build_id,
-                                                                                              results_dir)
-                        else:
-                            build_dict.update(builder.build(spec, results_dir, **build_dict))
-                    if builder.creates_tasks() and task_id and not koji_build_id:
-                        if not self.conf.builds_nowait:
-                            build_dict['rpm'], build_dict['logs'] = builder.wait_for_task(build_dict,
-                                                                                          task_id,
-                                                                                          results_dir)
-                        elif self.conf.build_tasks:
-                            build_dict['rpm'], build_dict['logs'] = builder.get_detached_task(task_id, results_dir)
-                    build_dict = self._sanitize_build_dict(build_dict)
-                    results_store.set_build_data(version, build_dict)
-                    successful_builds += 1
-                except RebaseHelperError:
+        versions = ['old', 'new']
+        attempts = {}
+        if self.conf.parallel_builds and self.conf.build_tasks is None and not builder.creates_tasks():
+            logger.info('Building old and new binary packages concurrently')
+            attempts = self._build_binary_packages_concurrently(builder, versions)
+
+        for version in versions:
+            # failures of concurrent builds are handled here one by one, retries are sequential
+            attempt = attempts.get(version)
+            concurrent = attempt is not None
+            while True:
+                if attempt is None:
+                    prepared = self._prepare_binary_build(builder, version)
+                    attempt = self._build_binary_package(builder, version, *prepared)
+                build_dict, error = attempt
+                if error is None:
+                    break
+                if isinstance(error, RebaseHelperError):
                     # Proper RebaseHelperError instance was created already. Re-raise it.
-                    raise
-                except BinaryPackageBuildError as e:
-                    build_dict.update(builder.get_logs())
-                    build_dict['binary_package_build_error'] = six.text_type(e)
-                    build_dict = self._sanitize_build_dict(build_dict)
-                    results_store.set_build_data(version, build_dict)
-
-                    if e.logfile is None:
-                        msg = 'Building {} RPM packages failed; see logs in {} for more information'.format(
-                            version, os.path.join(results_dir, 'RPM')
-                        )
-                    else:
-                        msg = 'Building {} RPM packages failed; see {} for more information'.format(version, e.logfile)
-
-                    logger.info(msg)
-                    if self.rebase_spec_file:
-                        # Save current rebase spec file content
-                        self.rebase_spec_file.save()
-                    if not self.conf.non_interactive and \
-                            ConsoleHelper.get_message('Do you want to try it one more time'):
-                        try_build_again = True
-                    else:
-                        raise RebaseHelperError(msg, logfiles=builder.get_logs().get('logs'))
-                except Exception:
-                    raise RebaseHelperError('Building package failed with unknown reason. '
-                                            'Check all available log files.')
-
-                if try_build_again:
-                    successful_builds = 0
-                    try_build_again = False
-
-                    logger.info('Now it is time to make changes to  %s if necessary.', self.rebase_spec_file.path)
-                    if not ConsoleHelper.get_message('Do you want to continue with the rebuild now'):
-                        raise KeyboardInterrupt
-                    # Update rebase spec file content after potential manual modifications
-                    self.rebase_spec_file._read_spec_content()  # pylint: disable=protected-access
-                    self.rebase_spec_file._update_data()  # pylint: disable=protected-access
-                    # clear current version output directories
-                    if os.path.exists(os.path.join(results_dir, 'RPM')):
-                        shutil.rmtree(os.path.join(results_dir, 'RPM'))
+                    raise error
+                self._handle_binary_build_error(builder, version, build_dict, error, concurrent)
+                self._prepare_binary_rebuild(version)
+                attempt = None
+                concurrent = False
 
         if self.conf.builds_nowait and not self.conf.build_tasks:
             if builder.creates_tasks():
@@ -680,26 +1044,43 @@ class Application(object):
         """
         Runs checkers on packages and stores results in a given directory.
 
+        Checkers are run concurrently, at most --checker-workers of them at the same time.
+
         :param results_dir: Path to directory in which to store the results.
         :type results_dir: str
         :param category: checker type(SOURCE/SRPM/RPM)
         :type category: str
-        :return: None
+        :return: dict of results of the checkers that produced some
         """
-        results = dict()
+        checker_names = list(self.conf.pkgcomparetool or [])
 
-        for checker_name in self.conf.pkgcomparetool:
+        def run(checker_name):
             try:
-                data = checkers_runner.run_checker(os.path.join(results_dir, 'checkers'),
+                return checkers_runner.run_checker(os.path.join(results_dir, 'checkers'),
                                                    checker_name,
                                                    **kwargs)
-                if data:
-                    results[checker_name] = data
             except CheckerNotFoundError:
                 logger.error("Rebase-helper did not find checker '%s'.", checker_name)
+            return None
 
-        for diff_name, result in six.iteritems(results):
-            results_store.set_checker_output(diff_name, result)
+        workers = min(int(self.conf.checker_workers or 0) or len(checker_names), len(checker_names))
+        if workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                results = pool.map(run, checker_names, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [run(checker_name) for checker_name in checker_names]
+
+        # store the results in the order the checkers were specified in
+        outputs = {}
+        for checker_name, data in zip(checker_names, results):
+            if data:
+                results_store.set_checker_output(checker_name, data)
+                outputs[checker_name] = data
+        return outputs
 
     def get_all_log_files(self):
         """
@@ -757,6 +1138,7 @@ class Application(object):
         :return:
         """
         logs = None
+        results_store.set_timings(timings.get_summary())
         # Store rebase helper result exception
         if exception:
             if exception.logfiles:
@@ -773,7 +1155,18 @@ class Application(object):
             self.rebase_spec_file.update_paths_to_patches()
             self.generate_patch()
 
-        output_tools_runner.run_output_tools(logs, self)
+        if self.output_tools_enabled:
+            output_tools_runner.run_output_tools(logs, self)
+
+    def write_trace(self):
+        """Writes durations of stages and helper calls in Chrome trace event format."""
+        path = os.path.join(self.results_dir, constants.TRACE)
+        try:
+            timings.write_chrome_trace(path)
+        except (IOError, OSError) as e:
+            logger.warning("Can not write trace '%s': %s", path, six.text_type(e))
+        else:
+            logger.info('Trace of the rebase written to %s', path)
 
     def print_task_info(self, builder):
         logs = self.get_new_build_logs()['build_ref']
@@ -802,6 +1195,170 @@ class Application(object):
             logger.warning('changes.patch was not applied properly. Please review changes manually.'
                            '\nThe error message is: %s', six.text_type(e))
 
+    def _create_stage(self, name, run, restore, inputs=None, requires=None, report_failure=True):
+        """
+        Creates a stage that is skipped if a previous run completed it with the same inputs.
+
+        :param name: unique name of the stage
+        :param run: callable running the stage, returns JSON serializable data needed to restore its results
+        :param restore: callable restoring results of the stage from the data, returns False
+                        if they can't be restored
+        :param inputs: callable returning tuple (values, files) of inputs of the stage
+        :param requires: list of names of stages that have to finish first
+        :param report_failure: whether failure of the stage should be reported in the rebase summary
+        :return: Stage instance
+        """
+        if self.checkpoint is None:
+            return Stage(name, run, requires, report_failure)
+
+        def function():
+            values, files = inputs() if inputs else ([], [])
+            digest = self.checkpoint.get_digest(name, values, files, requires)
+            data = self.checkpoint.get(name, digest)
+            if data is not None and restore(data):
+                logger.info("Skipping stage '%s' completed by the previous run", name)
+                return
+            self.checkpoint.record(name, digest, run())
+
+        return Stage(name, function, requires, report_failure)
+
+    @staticmethod
+    def _restore_checkers(data):
+        for checker_name, output in six.iteritems(data):
+            results_store.set_checker_output(checker_name, output)
+        return True
+
+    @staticmethod
+    def _restore_builds(data):
+        builds = data['builds']
+        for build in six.itervalues(builds):
+            packages = ([build['srpm']] if 'srpm' in build else []) + build.get('rpm', [])
+            if not packages or not all(os.path.isfile(p) for p in packages):
+                return False
+        for version, build in six.iteritems(builds):
+            results_store.set_build_data(version, build)
+        return True
+
+    def _get_stages(self):
+        """
+        Creates stages of the rebase according to the configuration.
+
+        :return: list of Stage instances
+        """
+        stages = []
+        sources = {}
+        checked_sources = {}
+        sources_stage = None
+
+        def spec_inputs(version, options):
+            spec = self.spec_file if version == 'old' else self.rebase_spec_file
+            values = [''.join(spec.spec_content)] + [getattr(self.conf, o) for o in options]
+            files = spec.get_sources() + [p.get_path() for p in spec.get_patches()]
+            return values, files
+
+        if self.conf.build_tasks is None:
+            def prepare_sources():
+                sources['old'], sources['new'] = self.prepare_sources()
+                checked_sources.update(self._copy_sources_for_checkers(sources, replace=True))
+                return dict(sources)
+
+            def restore_sources(data):
+                # extracted sources are kept in the workspace
+                if not all(os.path.isdir(data[v]) for v in ['old', 'new']):
+                    return False
+                sources.update(data)
+                self._update_setup_dirname(sources['new'])
+                checked_sources.update(self._copy_sources_for_checkers(sources))
+                return True
+
+            stages.append(self._create_stage('prepare_sources', prepare_sources, restore_sources,
+                                             lambda: ([''.join(self.spec_file.spec_content),
+                                                       ''.join(self.rebase_spec_file.spec_content)],
+                                                      [self.old_sources, self.new_sources] +
+                                                      self.old_rest_sources + self.new_rest_sources),
+                                             report_failure=False))
+            stages.append(self._create_stage('source_checkers',
+                                             lambda: self.run_package_checkers(self.results_dir,
+                                                                               category='SOURCE',
+                                                                               old_dir=checked_sources['old'],
+                                                                               new_dir=checked_sources['new']),
+                                             self._restore_checkers,
+                                             lambda: ([self.conf.pkgcomparetool], []),
+                                             requires=['prepare_sources'],
+                                             report_failure=False))
+            sources_stage = 'prepare_sources'
+            if not self.conf.build_only and not self.conf.comparepkgs:
+                def patch_sources():
+                    self.patch_sources([sources['old'], sources['new']])
+                    # rebased patches are overwritten by the original ones on the next run
+                    modified = {}
+                    for patch_name in self.rebased_patches.get('modified', []):
+                        with open(os.path.join(self.rebased_sources_dir, patch_name), 'rb') as f:
+                            modified[patch_name] = base64.b64encode(f.read()).decode('ascii')
+                    return dict(patches=self.rebased_patches, modified=modified)
+
+                def restore_patches(data):
+                    for patch_name, content in six.iteritems(data['modified']):
+                        with open(os.path.join(self.rebased_sources_dir, patch_name), 'wb') as f:
+                            f.write(base64.b64decode(content))
+                    self.rebase_spec_file.update_changelog(self.rebase_spec_file.get_new_log())
+                    self._set_rebased_patches(data['patches'])
+                    return True
+
+                # checkers inspect copies of the sources, so patching doesn't have to wait for them
+                stages.append(self._create_stage('patch_sources', patch_sources, restore_patches,
+                                                 lambda: ([self.conf.disable_inapplicable_patches],
+                                                          [p.get_path() for p in self.spec_file.get_patches()]),
+                                                 requires=['prepare_sources']))
+                sources_stage = 'patch_sources'
+
+        if not self.conf.patch_only and not self.conf.comparepkgs:
+            source_builds = []
+            if self.conf.build_tasks is None:
+                concurrent = bool(self.conf.parallel_builds)
+                srpm_options = ['srpm_buildtool', 'srpm_builder_options']
+
+                def build_srpm(version):
+                    self._build_source_package(self._get_srpm_builder(), version, concurrent=concurrent)
+                    return dict(builds={version: results_store.get_build(version)})
+
+                # the old SRPM needs only the downloaded sources, the new one has to wait for the rebased SPEC file
+                stages.append(self._create_stage('build_old_srpm',
+                                                 lambda: build_srpm('old'),
+                                                 self._restore_builds,
+                                                 lambda: spec_inputs('old', srpm_options),
+                                                 requires=['prepare_sources']))
+                stages.append(self._create_stage('build_new_srpm',
+                                                 lambda: build_srpm('new'),
+                                                 self._restore_builds,
+                                                 lambda: spec_inputs('new', srpm_options),
+                                                 requires=[sources_stage] + ([] if concurrent
+                                                                             else ['build_old_srpm'])))
+                source_builds = ['build_old_srpm', 'build_new_srpm']
+
+            def build_rpms():
+                self.build_binary_packages()
+                return dict(builds={v: results_store.get_build(v) for v in ['old', 'new']})
+
+            stages.append(self._create_stage('srpm_checkers',
+                                             lambda: self.run_package_checkers(self.results_dir, category='SRPM'),
+                                             self._restore_checkers,
+                                             lambda: ([self.conf.pkgcomparetool], []),
+                                             requires=source_builds))
+            stages.append(self._create_stage('build_rpms', build_rpms, self._restore_builds,
+                                             lambda: ([self.conf.buildtool, self.conf.builder_options,
+                                                       self.conf.get_old_build_from_koji], []),
+                                             requires=source_builds))
+            if not self.conf.builds_nowait or self.conf.build_tasks:
+                stages.append(self._create_stage('rpm_checkers',
+                                                 lambda: self.run_package_checkers(self.results_dir,
+                                                                                   category='RPM'),
+                                                 self._restore_checkers,
+                                                 lambda: ([self.conf.pkgcomparetool], []),
+                                                 requires=['build_rpms']))
+
+        return stages
+
     def run(self):
         # Certain options can be used only with specific build tools
         tools_creating_tasks = [k for k, v in six.iteritems(Builder.build_tools) if v.creates_tasks()]
@@ -830,45 +1387,42 @@ class Application(object):
                                         " and ".join(options_used),
                                         ", ".join(tools_accepting_options)))
 
-        if self.conf.build_tasks is None:
-            old_sources, new_sources = self.prepare_sources()
-            self.run_package_checkers(self.results_dir, category='SOURCE', old_dir=old_sources, new_dir=new_sources)
-            if not self.conf.build_only and not self.conf.comparepkgs:
-                try:
-                    self.patch_sources([old_sources, new_sources])
-                except RebaseHelperError as e:
+        try:
+            try:
+                stages = self._get_stages()
+                max_workers = None
+                if self.profiler.enabled:
+                    for stage in stages:
+                        stage.function = self.profiler.wrap(stage.name, stage.function)
+                    # only the thread running a stage is profiled, run stages one by one
+                    max_workers = 1
+                StageScheduler(stages, max_workers).run()
+            except StageFailure as failure:
+                if failure.stage.report_failure and isinstance(failure.exception, RebaseHelperError):
                     # Print summary and return error
-                    self.print_summary(e)
-                    raise
-
-        if not self.conf.patch_only:
-            if not self.conf.comparepkgs:
-                # Build packages
-                try:
-                    if self.conf.build_tasks is None:
-                        self.build_source_packages()
-                    self.run_package_checkers(self.results_dir, category='SRPM')
-                    self.build_binary_packages()
+                    self.print_summary(failure.exception)
+                failure.reraise()
+
+            if not self.conf.patch_only:
+                if not self.conf.comparepkgs:
                     if self.conf.builds_nowait and not self.conf.build_tasks:
                         return
-                    self.run_package_checkers(self.results_dir, category='RPM')
-                # Print summary and return error
-                except RebaseHelperError as e:
-                    self.print_summary(e)
-                    raise
-            else:
-                if self.get_rpm_packages(self.conf.comparepkgs):
-                    self.run_package_checkers(self.results_dir, category='SRPM')
-                    self.run_package_checkers(self.results_dir, category='RPM')
-
-        if not self.conf.keep_workspace:
-            self._delete_workspace_dir()
-
-        if self.debug_log_file:
-            self.print_summary()
-        if self.conf.apply_changes:
-            self.apply_changes()
-        return 0
+                else:
+                    if self.get_rpm_packages(self.conf.comparepkgs):
+                        self.run_package_checkers(self.results_dir, category='SRPM')
+                        self.run_package_checkers(self.results_dir, category='RPM')
+
+            if not self.conf.keep_workspace:
+                self._delete_workspace_dir()
+
+            if self.debug_log_file:
+                self.print_summary()
+            if self.conf.apply_changes:
+                self.apply_changes()
+            return 0
+        finally:
+            if self.conf.trace:
+                self.write_trace()
 
 
 if __name__ == '__main__':
@@ -22,10 +22,15 @@
 
 from __future__ import print_function
 import tarfile
+import tempfile
 import zipfile
 import bz2
 import os
 import shutil
+import struct
+import subprocess
+import threading
+import zlib
 
 import six
 
@@ -34,7 +39,18 @@ try:
 except ImportError:
     from backports import lzma
 
+try:
+    LZMAError = lzma.LZMAError
+except AttributeError:
+    LZMAError = lzma.error
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 from rebasehelper.logger import logger
+from rebasehelper.timing import timings
 
 
 # supported archive types
@@ -46,9 +62,326 @@ def register_archive_type(archive):
     return archive
 
 
+class DecompressedStream(object):
+    """
+    Read-only file-like object reading decompressed data from an iterable of chunks.
+    """
+
+    def __init__(self, chunks, close=None, abort=None):
+        """
+        Constructor of DecompressedStream.
+
+        :param chunks: iterable of chunks of decompressed data
+        :param close: callable releasing resources, called when the stream is closed
+        :param abort: callable stopping the decompression, called before close
+            if the stream is closed before all the needed data were read
+        """
+        self._chunks = iter(chunks)
+        self._close = close
+        self._abort = abort
+        # data are consumed by moving the offset, so that small reads don't copy the rest of the buffer
+        self._buffer = bytearray()
+        self._offset = 0
+        self.closed = False
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) - self._offset < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            if self._offset:
+                del self._buffer[:self._offset]
+                self._offset = 0
+            self._buffer += chunk
+        end = len(self._buffer) if size < 0 else min(self._offset + size, len(self._buffer))
+        data = bytes(self._buffer[self._offset:end])
+        self._offset = end
+        return data
+
+    def close(self, complete=True):
+        """
+        Closes the stream.
+
+        :param complete: whether all the needed data were read, if not, the decompression is aborted
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if not complete and self._abort:
+            self._abort()
+        if self._close:
+            self._close()
+
+
+class StreamTarFile(tarfile.TarFile):
+    """
+    Tar archive read sequentially from a DecompressedStream, which is closed together with the archive.
+    """
+
+    stream = None
+    # whether the end of the archive was reached
+    finished = False
+
+    @classmethod
+    def open_stream(cls, stream):
+        """
+        Opens a tar archive in a stream.
+
+        :param stream: DecompressedStream instance
+        :return: StreamTarFile instance
+        """
+        try:
+            archive = cls.open(mode='r|', fileobj=stream)
+        except BaseException:
+            stream.close()
+            raise
+        archive.stream = stream
+        return archive
+
+    def next(self):
+        tarinfo = super(StreamTarFile, self).next()
+        if tarinfo is None:
+            self.finished = True
+        return tarinfo
+
+    def close(self):
+        try:
+            super(StreamTarFile, self).close()
+        finally:
+            if self.stream:
+                # the rest of the data is needed only if the archive was read completely
+                self.stream.close(complete=self.finished)
+
+
+class DecompressionTools(object):
+    """
+    Class decompressing files by external tools, which usually decompress in multiple threads.
+    """
+
+    # commands decompressing standard input to standard output,
+    # the first available one is used for each compression format
+    TOOLS = {
+        'xz': [['pixz', '-d'], ['xz', '-d', '-c', '-T0']],
+        'bz2': [['lbzip2', '-d', '-c'], ['pbzip2', '-d', '-c']],
+        'gz': [['pigz', '-d', '-c']],
+        'zst': [['zstd', '-d', '-c']],
+        'lz': [['plzip', '-d', '-c'], ['lzip', '-d', '-c']],
+    }
+
+    # magic numbers of the compression formats, files not starting with them (e.g. archives
+    # already decompressed while being downloaded) are left to the Python implementation
+    MAGIC = {
+        'xz': b'\xfd7zXZ\x00',
+        'bz2': b'BZh',
+        'gz': b'\x1f\x8b',
+        'zst': b'\x28\xb5\x2f\xfd',
+        'lz': b'LZIP',
+    }
+
+    BLOCK_SIZE = 1024 * 1024
+
+    # whether the tools can be used, if not, Python implementation is used
+    enabled = True
+    # paths to executables that were looked up already
+    _executables = {}
+
+    @classmethod
+    def find_executable(cls, name):
+        """
+        Finds an executable in PATH.
+
+        :param name: name of the executable
+        :return: full path to the executable or None if it is not available
+        """
+        if name not in cls._executables:
+            cls._executables[name] = None
+            for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+                path = os.path.join(directory, name)
+                if os.path.isfile(path) and os.access(path, os.X_OK):
+                    cls._executables[name] = path
+                    break
+        return cls._executables[name]
+
+    @classmethod
+    def get_command(cls, compression):
+        """
+        Gets command decompressing the specified compression format.
+
+        :param compression: compression format, e.g. 'xz'
+        :return: command as a list or None if no tool is available or the tools are disabled
+        """
+        if not cls.enabled:
+            return None
+        for cmd in cls.TOOLS.get(compression, []):
+            path = cls.find_executable(cmd[0])
+            if path:
+                return [path] + cmd[1:]
+        return None
+
+    @classmethod
+    def open(cls, filename, compression):
+        """
+        Starts decompression of a file.
+
+        :param filename: path to the compressed file
+        :param compression: compression format, e.g. 'xz'
+        :return: DecompressedStream instance or None if no tool is available
+            or the file is not compressed in the specified format
+        """
+        if cls.get_command(compression) is None:
+            return None
+        magic = cls.MAGIC.get(compression, b'')
+        with open(filename, 'rb') as f:
+            if f.read(len(magic)) != magic:
+                logger.debug("'%s' is not compressed by %s, not using a decompression tool", filename, compression)
+                return None
+        with open(filename, 'rb') as f:
+            return cls.decompress(f, compression, filename)
+
+    @classmethod
+    def decompress(cls, fileobj, compression, name):
+        """
+        Starts decompression of data read from a file object.
+
+        :param fileobj: file object with a file descriptor, e.g. read end of a pipe
+        :param compression: compression format, e.g. 'xz'
+        :param name: name of the compressed file used in messages
+        :return: DecompressedStream instance or None if no tool is available
+        """
+        cmd = cls.get_command(compression)
+        if cmd is None:
+            return None
+        logger.debug("Decompressing '%s' with %s", name, cmd[0])
+        stderr = tempfile.TemporaryFile()
+        # the tool must not inherit write end of a pipe it reads from
+        proc = subprocess.Popen(cmd, stdin=fileobj, stdout=subprocess.PIPE, stderr=stderr, close_fds=True)
+
+        def chunks():
+            chunk = proc.stdout.read(cls.BLOCK_SIZE)
+            while chunk:
+                yield chunk
+                chunk = proc.stdout.read(cls.BLOCK_SIZE)
+
+        terminated = []
+
+        def abort():
+            if proc.poll() is None:
+                proc.terminate()
+                terminated.append(True)
+
+        def close():
+            try:
+                if not terminated:
+                    # let the tool finish, tar archives can end before the decompressed data
+                    while proc.stdout.read(cls.BLOCK_SIZE):
+                        pass
+                proc.stdout.close()
+                if proc.wait() != 0 and not terminated:
+                    stderr.seek(0)
+                    raise IOError('{} failed: {}'.format(cmd[0], stderr.read().decode('utf-8', 'replace').strip()))
+            finally:
+                stderr.close()
+
+        return DecompressedStream(chunks(), close, abort)
+
+
+class LzipDecompressor(object):
+    """
+    Pure Python decompressor of lzip files, members of lzip files are raw LZMA streams.
+    """
+
+    MAGIC = b'LZIP'
+    HEADER_SIZE = 6
+    TRAILER_SIZE = 20
+    BLOCK_SIZE = 1024 * 1024
+
+    @classmethod
+    def _get_dict_size(cls, coded):
+        base = 1 << (coded & 0x1f)
+        return base - (base // 16) * ((coded >> 5) & 0x07)
+
+    @classmethod
+    def open(cls, filename):
+        """
+        Starts decompression of a file.
+
+        :param filename: path to the compressed file
+        :return: DecompressedStream instance
+        """
+        f = open(filename, 'rb')
+        return DecompressedStream(cls.decompress(f), f.close)
+
+    @classmethod
+    def decompress(cls, f):
+        """
+        Decompresses all members of a lzip file.
+
+        :param f: file object of the compressed file
+        :return: generator of chunks of decompressed data
+        """
+        pending = b''
+        members = 0
+        while True:
+            header = pending[:cls.HEADER_SIZE]
+            pending = pending[cls.HEADER_SIZE:]
+            header += f.read(cls.HEADER_SIZE - len(header))
+            if not header and members:
+                return
+            if len(header) < cls.HEADER_SIZE or header[:4] != cls.MAGIC or six.indexbytes(header, 4) != 1:
+                raise IOError('Not a valid lzip file')
+            filters = [dict(id=lzma.FILTER_LZMA1, dict_size=cls._get_dict_size(six.indexbytes(header, 5)),
+                            lc=3, lp=0, pb=2)]
+            decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=filters)
+            crc = 0
+            size = 0
+            while not decompressor.eof:
+                data = pending or f.read(cls.BLOCK_SIZE)
+                pending = b''
+                if not data:
+                    raise IOError('Unexpected end of lzip file')
+                chunk = decompressor.decompress(data)
+                if chunk:
+                    crc = zlib.crc32(chunk, crc)
+                    size += len(chunk)
+                    yield chunk
+            pending = decompressor.unused_data
+            trailer = pending[:cls.TRAILER_SIZE]
+            pending = pending[cls.TRAILER_SIZE:]
+            trailer += f.read(cls.TRAILER_SIZE - len(trailer))
+            if len(trailer) < cls.TRAILER_SIZE:
+                raise IOError('Unexpected end of lzip file')
+            expected_crc, expected_size, _ = struct.unpack('<IQQ', trailer)
+            if expected_crc != crc & 0xffffffff or expected_size != size:
+                raise IOError('Corrupted lzip file')
+            members += 1
+
+
+class ArchiveMember(object):
+    """Class representing a member of an archive."""
+
+    def __init__(self, name, size=None, is_dir=False):
+        """
+        Constructor of ArchiveMember.
+
+        :param name: path of the member relative to the extraction directory
+        :param size: size of the member in bytes or None if it's not known without decompression
+        :param is_dir: whether the member is a directory
+        """
+        self.name = name
+        self.size = size
+        self.is_dir = is_dir
+
+    def __repr__(self):
+        return "<ArchiveMember name='{}' size={} is_dir={}>".format(self.name, self.size, self.is_dir)
+
+
 class ArchiveTypeBase(object):
     """ Base class for various archive types """
     EXTENSION = ""
+    # compression format of the archive, see DecompressionTools
+    COMPRESSION = None
+    # whether the archive can be read sequentially, see open_stream()
+    STREAMABLE = False
 
     @classmethod
     def match(cls, filename=None):
@@ -69,6 +402,35 @@ class ArchiveTypeBase(object):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def open_with_tools(cls, filename):
+        """
+        Opens the archive decompressed by an external tool if it is available.
+
+        :param filename: path to the archive
+        :return: StreamTarFile instance or None if no tool is available
+        """
+        stream = DecompressionTools.open(filename, cls.COMPRESSION) if cls.COMPRESSION else None
+        if stream is None:
+            return None
+        return StreamTarFile.open_stream(stream)
+
+    @classmethod
+    def open_stream(cls, fileobj, filename=None):
+        """
+        Opens the archive read sequentially from a file object, e.g. from a pipe.
+
+        :param fileobj: file object of the archive
+        :param filename: name of the archive used in messages
+        :return: archive object that can be passed to extract()
+        """
+        if not cls.STREAMABLE:
+            raise NotImplementedError("Archive type '{}' can't be read sequentially".format(cls.EXTENSION))
+        stream = DecompressionTools.decompress(fileobj, cls.COMPRESSION, filename) if cls.COMPRESSION else None
+        if stream is not None:
+            return StreamTarFile.open_stream(stream)
+        return tarfile.open(mode='r|' + (cls.COMPRESSION or ''), fileobj=fileobj)
+
     @classmethod
     def extract(cls, archive=None, filename=None, path=None):
         """
@@ -79,6 +441,17 @@ class ArchiveTypeBase(object):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def list_members(cls, archive=None, filename=None):
+        """
+        Lists members of the archive by reading tar headers, data of members is skipped.
+
+        :return: list of ArchiveMember instances
+        """
+        if archive is None:
+            raise TypeError("Expected argument 'archive' (pos 1) is missing")
+        return [ArchiveMember(m.name, m.size, m.isdir()) for m in archive]
+
 
 @register_archive_type
 class TarXzArchiveType(ArchiveTypeBase):
@@ -86,11 +459,16 @@ class TarXzArchiveType(ArchiveTypeBase):
     """ .tar.xz archive type """
 
     EXTENSION = ".tar.xz"
+    COMPRESSION = "xz"
+    STREAMABLE = True
 
     @classmethod
     def open(cls, filename=None):
         if filename is None:
             raise TypeError("Expected argument 'filename' (pos 1) is missing")
+        archive = cls.open_with_tools(filename)
+        if archive is not None:
+            return archive
         xz_file = lzma.LZMAFile(filename, "r")
 
         return tarfile.open(mode='r', fileobj=xz_file)
@@ -108,6 +486,7 @@ class Bz2ArchiveType(ArchiveTypeBase):
     """ .bz2 archive type """
 
     EXTENSION = ".bz2"
+    COMPRESSION = "bz2"
 
     @classmethod
     def open(cls, filename=None):
@@ -115,8 +494,14 @@ class Bz2ArchiveType(ArchiveTypeBase):
             raise TypeError("Expected argument 'filename' (pos 1) is missing")
 
         if filename.endswith('.tar.bz2'):
+            archive = cls.open_with_tools(filename)
+            if archive is not None:
+                return archive
             return tarfile.TarFile.open(filename)
         else:
+            stream = DecompressionTools.open(filename, cls.COMPRESSION)
+            if stream is not None:
+                return stream
             return bz2.BZ2File(filename)
 
     @classmethod
@@ -132,6 +517,13 @@ class Bz2ArchiveType(ArchiveTypeBase):
             with open(os.path.join(path, filename[:-4]), 'wb') as f:
                 f.write(data)
 
+    @classmethod
+    def list_members(cls, archive=None, filename=None):
+        if filename.endswith('tar.bz2'):
+            return super(Bz2ArchiveType, cls).list_members(archive, filename)
+        # size of the file is not known without decompressing it
+        return [ArchiveMember(os.path.basename(filename[:-4]))]
+
 
 @register_archive_type
 class TarBz2ArchiveType(Bz2ArchiveType):
@@ -139,6 +531,7 @@ class TarBz2ArchiveType(Bz2ArchiveType):
     """ .tar.bz2 archive type """
 
     EXTENSION = ".tar.bz2"
+    STREAMABLE = True
 
 
 @register_archive_type
@@ -147,12 +540,15 @@ class TarGzArchiveType(TarBz2ArchiveType):
     """ .tar.gz archive type """
 
     EXTENSION = ".tar.gz"
+    COMPRESSION = "gz"
 
     @classmethod
     def open(cls, filename=None):
         if filename is None:
             raise TypeError("Expected argument 'filename' (pos 1) is missing")
-
+        archive = cls.open_with_tools(filename)
+        if archive is not None:
+            return archive
         return tarfile.TarFile.open(filename)
 
     @classmethod
@@ -161,6 +557,11 @@ class TarGzArchiveType(TarBz2ArchiveType):
             raise TypeError("Expected argument 'archive' (pos 1) is missing")
         archive.extractall(path)
 
+    @classmethod
+    def list_members(cls, archive=None, filename=None):
+        # skip handling of plain .bz2 files
+        return super(Bz2ArchiveType, cls).list_members(archive, filename)
+
 
 @register_archive_type
 class TgzArchiveType(TarGzArchiveType):
@@ -172,6 +573,77 @@ class TgzArchiveType(TarGzArchiveType):
 class TarArchiveType(TarGzArchiveType):
     """ .tar archive type """
     EXTENSION = ".tar"
+    COMPRESSION = None
+
+
+@register_archive_type
+class TarZstArchiveType(ArchiveTypeBase):
+    """ .tar.zst archive type """
+    EXTENSION = ".tar.zst"
+    COMPRESSION = "zst"
+    STREAMABLE = True
+
+    @classmethod
+    def _decompress(cls, fileobj, filename, close=None):
+        if zstandard is None:
+            raise IOError("Extracting '{}' requires zstd or the zstandard Python module".format(filename))
+        reader = zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+        def chunks():
+            chunk = reader.read(DecompressionTools.BLOCK_SIZE)
+            while chunk:
+                yield chunk
+                chunk = reader.read(DecompressionTools.BLOCK_SIZE)
+
+        return StreamTarFile.open_stream(DecompressedStream(chunks(), close))
+
+    @classmethod
+    def open(cls, filename=None):
+        if filename is None:
+            raise TypeError("Expected argument 'filename' (pos 1) is missing")
+        archive = cls.open_with_tools(filename)
+        if archive is not None:
+            return archive
+        if zstandard is None:
+            raise IOError("Extracting '{}' requires zstd or the zstandard Python module".format(filename))
+        f = open(filename, 'rb')
+        return cls._decompress(f, filename, f.close)
+
+    @classmethod
+    def open_stream(cls, fileobj, filename=None):
+        stream = DecompressionTools.decompress(fileobj, cls.COMPRESSION, filename)
+        if stream is not None:
+            return StreamTarFile.open_stream(stream)
+        return cls._decompress(fileobj, filename)
+
+    @classmethod
+    def extract(cls, archive=None, filename=None, path=None):
+        if archive is None:
+            raise TypeError("Expected argument 'archive' (pos 1) is missing")
+        archive.extractall(path)
+
+
+@register_archive_type
+class TarLzArchiveType(TarZstArchiveType):
+    """ .tar.lz archive type """
+    EXTENSION = ".tar.lz"
+    COMPRESSION = "lz"
+
+    @classmethod
+    def open(cls, filename=None):
+        if filename is None:
+            raise TypeError("Expected argument 'filename' (pos 1) is missing")
+        archive = cls.open_with_tools(filename)
+        if archive is not None:
+            return archive
+        return StreamTarFile.open_stream(LzipDecompressor.open(filename))
+
+    @classmethod
+    def open_stream(cls, fileobj, filename=None):
+        stream = DecompressionTools.decompress(fileobj, cls.COMPRESSION, filename)
+        if stream is not None:
+            return StreamTarFile.open_stream(stream)
+        return StreamTarFile.open_stream(DecompressedStream(LzipDecompressor.decompress(fileobj)))
 
 
 @register_archive_type
@@ -199,6 +671,13 @@ class ZipArchiveType(ArchiveTypeBase):
             raise TypeError("Expected argument 'archive' (pos 1) is missing")
         archive.extractall(path)
 
+    @classmethod
+    def list_members(cls, archive=None, filename=None):
+        if archive is None:
+            raise TypeError("Expected argument 'archive' (pos 1) is missing")
+        # read from the central directory, there is no need to go through the archive
+        return [ArchiveMember(i.filename, i.file_size, i.filename.endswith('/')) for i in archive.infolist()]
+
 
 @register_archive_type
 class GemPseudoArchiveType(ArchiveTypeBase):
@@ -217,6 +696,87 @@ class GemPseudoArchiveType(ArchiveTypeBase):
         os.makedirs(final_dir)
         shutil.copy(filename, final_dir)
 
+    @classmethod
+    def list_members(cls, archive=None, filename=None):
+        final_dir = os.path.basename(filename.rstrip(cls.EXTENSION))
+        return [
+            ArchiveMember(final_dir, is_dir=True),
+            ArchiveMember(os.path.join(final_dir, os.path.basename(filename)), os.path.getsize(filename)),
+        ]
+
+
+class StreamingExtractor(object):
+    """
+    Writable file-like object extracting an archive from data written to it.
+
+    The archive is read from a pipe and extracted in a separate thread,
+    so that it can be extracted while it is being downloaded.
+    """
+
+    def __init__(self, archive_type, filename, path):
+        """
+        Constructor of StreamingExtractor.
+
+        :param archive_type: archive type class that can read the archive sequentially
+        :param filename: name of the archive
+        :param path: path where to extract the archive to
+        """
+        self.filename = filename
+        self.path = path
+        self._error = None
+        read_fd, write_fd = os.pipe()
+        self._pipe = os.fdopen(write_fd, 'wb')
+        self._thread = threading.Thread(target=self._extract, args=(archive_type, os.fdopen(read_fd, 'rb')))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _extract(self, archive_type, fileobj):
+        try:
+            with timings.measure('extract', 'extract_stream', archive=self.filename):
+                archive = archive_type.open_stream(fileobj, self.filename)
+                try:
+                    archive_type.extract(archive, self.filename, self.path)
+                finally:
+                    archive.close()
+        except Exception as e:  # pylint: disable=broad-except
+            self._error = e
+        finally:
+            # consume the rest of the data, so that the writer is never blocked
+            try:
+                while fileobj.read(DecompressionTools.BLOCK_SIZE):
+                    pass
+            finally:
+                fileobj.close()
+
+    def _close_pipe(self):
+        if self._pipe is None:
+            return
+        try:
+            self._pipe.close()
+        except (IOError, OSError):
+            pass
+        self._pipe = None
+
+    def write(self, data):
+        if self._pipe is None:
+            return
+        try:
+            self._pipe.write(data)
+        except (IOError, OSError):
+            # the data can't be consumed anymore, the error is reported by close()
+            self._close_pipe()
+
+    def close(self):
+        """
+        Finishes the extraction after all data of the archive were written.
+
+        :raises IOError: if the archive couldn't be extracted
+        """
+        self._close_pipe()
+        self._thread.join()
+        if self._error is not None:
+            raise IOError("Archive '{}' can not be extracted: {}".format(self.filename, six.text_type(self._error)))
+
 
 class Archive(object):
 
@@ -235,6 +795,7 @@ class Archive(object):
         if self._archive_type is None:
             raise NotImplementedError("Unsupported archive type")
 
+    @timings.timed('extract', lambda self, *args, **kwargs: dict(archive=self._filename))
     def extract_archive(self, path=None):
         """
         Extracts the archive into the given path
@@ -247,23 +808,91 @@ class Archive(object):
 
         logger.debug("Extracting '%s' into '%s'", self._filename, path)
 
+        archive = self._open()
         try:
-            LZMAError = lzma.LZMAError
-        except AttributeError:
-            LZMAError = lzma.error
+            self._archive_type.extract(archive, self._filename, path)
+        except (tarfile.ReadError, LZMAError) as e:
+            raise IOError(six.text_type(e))
+        finally:
+            # waits for the decompression tool, which reports damaged archives by an IOError
+            self._close(archive)
+
+    def extract_stream(self, path=None):
+        """
+        Starts extraction of the archive from data written to the returned object,
+        so that the archive can be extracted while it is being downloaded.
+
+        :param path: Path where to extract the archive to.
+        :return: StreamingExtractor instance, closing it finishes the extraction
+        :raises NotImplementedError: if the archive can't be read sequentially
+        """
+        if not self._archive_type.STREAMABLE:
+            raise NotImplementedError("Archive '{}' can't be extracted while it's being written".format(
+                self._filename))
+
+        logger.debug("Extracting '%s' into '%s' while it's being written", self._filename, path)
+
+        return StreamingExtractor(self._archive_type, self._filename, path)
 
+    def _open(self):
         try:
-            archive = self._archive_type.open(self._filename)
+            return self._archive_type.open(self._filename)
         except (tarfile.ReadError, LZMAError) as e:
             raise IOError(six.text_type(e))
 
-        self._archive_type.extract(archive, self._filename, path)
+    @staticmethod
+    def _close(archive):
         try:
             archive.close()
         except AttributeError:
             # pseudo archive types don't return real file-like object
             pass
 
+    @timings.timed('list', lambda self, *args, **kwargs: dict(archive=self._filename))
+    def list_members(self):
+        """
+        Lists members of the archive without extracting it.
+
+        Only headers of tar archives and the central directory of zip archives are read,
+        compressed tarballs are decompressed in memory, nothing is written to disk.
+
+        :return: list of ArchiveMember instances, their names are normalized paths
+                 relative to the directory the archive would be extracted into
+        """
+        logger.debug("Listing members of '%s'", self._filename)
+
+        archive = self._open()
+        try:
+            members = self._archive_type.list_members(archive, self._filename)
+        except (tarfile.ReadError, LZMAError) as e:
+            raise IOError(six.text_type(e))
+        finally:
+            self._close(archive)
+        result = []
+        for member in members:
+            name = os.path.normpath(member.name).lstrip(os.sep)
+            if name and name != os.curdir:
+                result.append(ArchiveMember(name, member.size, member.is_dir))
+        return result
+
+    def get_top_level_dir(self, members=None):
+        """
+        Determines the top-level directory of the archive the same way
+        as it would be determined from the extracted sources.
+
+        :param members: list of ArchiveMember instances as returned by list_members(), listed if not given
+        :return: name of the top-level directory or None if the archive doesn't have a single one
+        """
+        if members is None:
+            members = self.list_members()
+        top_level = set(m.name.split(os.sep)[0] for m in members)
+        if len(top_level) != 1:
+            return None
+        name = top_level.pop()
+        if any(m.name != name or m.is_dir for m in members):
+            return name
+        return None
+
     @classmethod
     def get_supported_archives(cls):
         """Return list of supported archive types"""
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+import six
+
+# importing cli loads all plugins, worker processes inherit them
+from rebasehelper.cli import CLI
+from rebasehelper.config import Config
+from rebasehelper.application import Application
+from rebasehelper.logger import logger, main_handler
+from rebasehelper.exceptions import RebaseHelperError
+from rebasehelper.results_store import results_store
+from rebasehelper.utils import LookasideCacheHelper
+from rebasehelper.version import VERSION
+
+
+# pool of mock buildroot slots, a worker process takes one for the time it rebases a package
+_buildroot_slots = None
+
+
+def _init_worker(slots, cache_dir):
+    global _buildroot_slots  # pylint: disable=global-statement
+    _buildroot_slots = slots
+    LookasideCacheHelper.cache_dir = cache_dir
+
+
+def _rebase_package(job):
+    directory, version, args = job
+    slot = _buildroot_slots.get()
+    try:
+        # mock buildroots are reused by packages rebased by the same slot
+        Application.buildroot_id = 'rebase-helper-batch{}'.format(slot)
+        return BatchHelper.rebase_package(directory, version, args)
+    finally:
+        _buildroot_slots.put(slot)
+
+
+class BatchHelper(object):
+
+    """Class for rebasing more packages at once."""
+
+    @staticmethod
+    def build_parser():
+        parser = argparse.ArgumentParser(
+            description='Rebase more packages at once. Arguments following PACKAGES_FILE '
+                        'are passed to rebase-helper.')
+        parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                            help='number of packages rebased at the same time, defaults to %(default)s')
+        parser.add_argument('--summary', default='rebase-helper-batch.json',
+                            help='path to the summary of all rebases, defaults to %(default)s')
+        parser.add_argument('--cache-dir',
+                            default=os.path.expandvars(os.path.join('$HOME', '.cache', 'rebase-helper')),
+                            help='directory with sources shared by all rebases, defaults to %(default)s')
+        parser.add_argument('packages_file', metavar='PACKAGES_FILE',
+                            help='file with a package directory and optionally a version on each line')
+        parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+        return parser
+
+    @staticmethod
+    def rebase_package(directory, version, args):
+        """
+        Rebases a single package, meant to be run in a separate process.
+
+        :param directory: package directory
+        :param version: version to rebase to or None
+        :param args: list of rebase-helper arguments
+        :return: dict with the result of the rebase
+        """
+        result = dict(directory=directory, version=version)
+        try:
+            main_handler.setFormatter(logging.Formatter('%(levelname)s: [{}] %(message)s'.format(
+                os.path.basename(directory))))
+            os.chdir(directory)
+            cli = CLI(args + ([version] if version else []))
+            config = Config(getattr(cli, 'config-file', None))
+            config.merge(cli)
+            if not config.verbose:
+                main_handler.setLevel(logging.INFO)
+            # results of all packages are reported in the summary
+            Application.output_tools_enabled = False
+            execution_dir, results_dir, debug_log_file = Application.setup(config)
+            result['results_dir'] = results_dir
+            result['debug_log'] = debug_log_file
+            app = Application(config, execution_dir, results_dir, debug_log_file)
+            app.run()
+        except KeyboardInterrupt:
+            result['result'] = 'interrupted'
+        except RebaseHelperError as e:
+            result['result'] = 'fail'
+            result['message'] = e.msg if e.msg else six.text_type(e)
+            logger.error('%s', result['message'])
+        except BaseException as e:  # pylint: disable=broad-except
+            logger.error('rebase-helper failed due to an unexpected error: %s', six.text_type(e))
+            logger.trace('', exc_info=1)
+            result['result'] = 'error'
+            result['message'] = six.text_type(e)
+        else:
+            result['result'] = 'success'
+        result['report'] = results_store.get_all()
+        return result
+
+    @staticmethod
+    def read_packages(path):
+        """
+        Reads list of packages to rebase.
+
+        :param path: path to a file with a package directory and optionally a version on each line,
+                     empty lines and lines starting with '#' are ignored
+        :return: list of tuples (absolute path to package directory, version or None)
+        """
+        packages = []
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                directory = os.path.join(base, os.path.expanduser(fields[0]))
+                packages.append((os.path.abspath(directory), fields[1] if len(fields) > 1 else None))
+        return packages
+
+    @staticmethod
+    def rebase(packages, args, jobs, cache_dir=None):
+        """
+        Rebases packages in a pool of worker processes.
+
+        :param packages: list of tuples (package directory, version or None)
+        :param args: list of rebase-helper arguments used for all packages
+        :param jobs: number of packages rebased at the same time
+        :param cache_dir: directory with sources shared by all rebases
+        :return: list of results in the order of packages
+        """
+        if '--non-interactive' not in args:
+            # there is no way to interact with user from a worker process
+            args = args + ['--non-interactive']
+        jobs = max(1, min(jobs, len(packages)))
+        slots = multiprocessing.Queue()
+        for slot in range(jobs):
+            slots.put(slot)
+        # each package gets a fresh process, so that global state doesn't leak between rebases
+        pool = multiprocessing.Pool(jobs, _init_worker, (slots, cache_dir), maxtasksperchild=1)
+        try:
+            results = pool.map(_rebase_package, [(d, v, args) for d, v in packages], chunksize=1)
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+        return results
+
+    @staticmethod
+    def write_summary(path, results):
+        summary = dict(
+            version=VERSION,
+            packages=results,
+            total=len(results),
+        )
+        for state in ['success', 'fail', 'error', 'interrupted']:
+            summary[state] = len([r for r in results if r['result'] == state])
+        with open(path, 'w') as f:
+            json.dump(summary, f, sort_keys=True, indent=4)
+        return summary
+
+    @classmethod
+    def run(cls):
+        parser = cls.build_parser()
+        options = parser.parse_args()
+        args = [a for a in options.args if a != '--']
+        try:
+            packages = cls.read_packages(options.packages_file)
+        except IOError as e:
+            logger.error('Failed to read packages: %s', six.text_type(e))
+            sys.exit(1)
+        if not packages:
+            logger.error('No packages to rebase')
+            sys.exit(1)
+        logger.info('Rebasing %d packages, %d at a time', len(packages), options.jobs)
+        try:
+            results = cls.rebase(packages, args, options.jobs, options.cache_dir)
+        except KeyboardInterrupt:
+            logger.info('Interrupted by user')
+            sys.exit(1)
+        summary = cls.write_summary(options.summary, results)
+        logger.info('%d of %d packages rebased successfully, see %s for details',
+                    summary['success'], summary['total'], options.summary)
+        sys.exit(0 if summary['success'] == summary['total'] else 1)
+
+
+if __name__ == '__main__':
+    BatchHelper.run()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import six
+
+from rebasehelper.logger import logger
+from rebasehelper.utils import FileHelper
+from rebasehelper.version import VERSION
+
+
+class BuildCache(object):
+    """
+    On-disk cache of build results addressed by a digest of the build inputs.
+
+    Each entry contains a directory with build results and build data referring to it.
+    Least recently used entries are evicted when size of the cache exceeds the limit.
+    """
+
+    METADATA = 'build.json'
+    FILES_DIR = 'files'
+    # placeholder of the results directory in paths stored in build data
+    RESULTS_DIR = '@RESULTS_DIR@'
+
+    def __init__(self, path, max_size):
+        """
+        Constructor of BuildCache.
+
+        :param path: directory of the cache
+        :param max_size: maximal size of the cache in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(values, files):
+        """
+        Computes key of a cache entry.
+
+        :param values: list of JSON serializable values the build depends on
+        :param files: list of paths to files the build depends on
+        :return: hex digest
+        """
+        checksum = hashlib.sha256()
+        checksum.update(json.dumps([VERSION] + list(values), sort_keys=True,
+                                   default=six.text_type).encode('utf-8'))
+        for path in files:
+            checksum.update(b'\0' + os.path.basename(path).encode('utf-8') + b'\0')
+            try:
+                FileHelper.update_checksum(checksum, path)
+            except (IOError, OSError):
+                checksum.update(b'\0missing')
+        return checksum.hexdigest()
+
+    @classmethod
+    def _relocate(cls, value, old, new):
+        if isinstance(value, six.string_types):
+            if value == old or value.startswith(old + os.sep):
+                return new + value[len(old):]
+            return value
+        if isinstance(value, list):
+            return [cls._relocate(v, old, new) for v in value]
+        if isinstance(value, dict):
+            return {k: cls._relocate(v, old, new) for k, v in six.iteritems(value)}
+        return value
+
+    @staticmethod
+    def _get_size(path):
+        size = 0
+        for root, _, files in os.walk(path):
+            for f in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, f))
+                except OSError:
+                    pass
+        return size
+
+    def restore(self, key, results_dir, subdir):
+        """
+        Restores results of a build from the cache.
+
+        :param key: key of the cache entry
+        :param results_dir: results directory of the build
+        :param subdir: subdirectory of results_dir containing results of the build
+        :return: build data or None if the build is not cached
+        """
+        entry = os.path.join(self.path, key)
+        destination = os.path.join(results_dir, subdir)
+        try:
+            with open(os.path.join(entry, self.METADATA)) as f:
+                metadata = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            if os.path.isdir(destination):
+                shutil.rmtree(destination)
+            shutil.copytree(os.path.join(entry, self.FILES_DIR), destination)
+            # mark the entry as recently used
+            os.utime(entry, None)
+        except (IOError, OSError, shutil.Error):
+            # the entry was evicted in the meantime, don't leave incomplete results behind
+            shutil.rmtree(destination, ignore_errors=True)
+            return None
+        return self._relocate(metadata['build'], self.RESULTS_DIR, results_dir)
+
+    def store(self, key, results_dir, subdir, build):
+        """
+        Stores results of a build in the cache.
+
+        :param key: key of the cache entry
+        :param results_dir: results directory of the build
+        :param subdir: subdirectory of results_dir containing results of the build
+        :param build: build data
+        """
+        source = os.path.join(results_dir, subdir)
+        if self._get_size(source) > self.max_size:
+            return
+        entry = os.path.join(self.path, key)
+        if os.path.isdir(entry):
+            return
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+        except OSError:
+            # created by another rebase at the same time
+            if not os.path.isdir(self.path):
+                raise
+        # prepare the entry aside, so that it appears complete for other rebases
+        tmp = tempfile.mkdtemp(prefix='.', dir=self.path)
+        try:
+            shutil.copytree(source, os.path.join(tmp, self.FILES_DIR))
+            with open(os.path.join(tmp, self.METADATA), 'w') as f:
+                json.dump(dict(build=self._relocate(build, results_dir, self.RESULTS_DIR)), f,
+                          sort_keys=True, indent=4)
+            os.rename(tmp, entry)
+        except (IOError, OSError, TypeError, ValueError) as e:
+            logger.debug('Failed to store build in cache: %s', six.text_type(e))
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until size of the cache is within the limit."""
+        entries = []
+        for key in os.listdir(self.path):
+            entry = os.path.join(self.path, key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                entries.append((os.path.getmtime(entry), self._get_size(entry), entry))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            logger.debug("Evicting build cache entry '%s'", os.path.basename(entry))
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
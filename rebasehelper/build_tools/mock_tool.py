@@ -40,7 +40,8 @@ class MockBuildTool(BuildToolBase):  # pylint: disable=abstract-method
     logs = []
 
     @classmethod
-    def _build_rpm(cls, srpm, results_dir, rpm_results_dir, root=None, arch=None, builder_options=None):
+    def _build_rpm(cls, srpm, results_dir, rpm_results_dir, root=None, arch=None, builder_options=None,
+                   uniqueext=None):
         """
         Build RPM using mock.
 
@@ -50,6 +51,7 @@ class MockBuildTool(BuildToolBase):  # pylint: disable=abstract-method
         :param root: path to where chroot should be built.
         :param arch: target architectures for the build.
         :param builder_options: builder_options for mock.
+        :param uniqueext: unique extension of the buildroot, allows running more builds at once.
         :return abs paths to RPMs.
         """
         logger.info("Building RPMs")
@@ -60,6 +62,8 @@ class MockBuildTool(BuildToolBase):  # pylint: disable=abstract-method
             cmd.extend(['--root', root])
         if arch is not None:
             cmd.extend(['--arch', arch])
+        if uniqueext is not None:
+            cmd.extend(['--uniqueext', uniqueext])
         if builder_options is not None:
             cmd.extend(builder_options)
 
@@ -137,6 +141,7 @@ class MockBuildTool(BuildToolBase):  # pylint: disable=abstract-method
         :param srpm: absolute path to SRPM
         :param root: mock root used for building
         :param arch: architecture to build the RPM for
+        :param uniqueext: unique extension of the buildroot
         :return: dict with:
                  'rpm' -> list with absolute paths to RPMs
                  'logs' -> list with absolute paths to logs
@@ -148,7 +153,8 @@ class MockBuildTool(BuildToolBase):  # pylint: disable=abstract-method
             env = tmp_env.env()
             tmp_results_dir = env.get(MockTemporaryEnvironment.TEMPDIR_RESULTS)
             rpms = cls._build_rpm(srpm, tmp_results_dir, rpm_results_dir,
-                                  builder_options=cls.get_builder_options(**kwargs))
+                                  builder_options=cls.get_builder_options(**kwargs),
+                                  uniqueext=kwargs.get('uniqueext'))
             # remove SRPM - side product of building RPM
             tmp_srpm = PathHelper.find_first_file(tmp_results_dir, "*.src.rpm")
             if tmp_srpm is not None:
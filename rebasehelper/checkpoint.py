@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import six
+
+from rebasehelper.logger import logger
+from rebasehelper.utils import FileHelper
+from rebasehelper.version import VERSION
+
+
+class CheckpointManifest(object):
+    """
+    Class recording stages of the rebase completed so far, so that a resumed rebase can skip them.
+
+    Every completed stage is recorded together with a digest of its inputs and data needed
+    to restore its results. A recorded stage is considered completed only if the digest
+    of its current inputs matches the recorded one.
+    """
+
+    FILENAME = 'checkpoints.json'
+
+    def __init__(self, results_dir):
+        """
+        Constructor of CheckpointManifest.
+
+        :param results_dir: directory the manifest is stored in
+        """
+        self.path = os.path.join(results_dir, self.FILENAME)
+        self.stages = {}
+        self.digests = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Loads stages recorded by a previous run, ignores invalid manifest."""
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if manifest.get('version') != VERSION:
+            logger.debug('Ignoring checkpoints recorded by a different version of rebase-helper')
+            return
+        self.stages = manifest.get('stages', {})
+
+    def save(self):
+        # write to a temporary file first, so that an interrupted run can't leave the manifest broken
+        fd, path = tempfile.mkstemp(prefix=self.FILENAME, dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(version=VERSION, stages=self.stages), f, sort_keys=True, indent=4)
+            os.rename(path, self.path)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+    def get_digest(self, name, values=None, files=None, requires=None):
+        """
+        Computes digest of inputs of a stage.
+
+        :param name: name of the stage
+        :param values: list of JSON serializable values the stage depends on
+        :param files: list of paths to files the stage depends on
+        :param requires: list of names of stages the stage depends on, their digests have to be computed already
+        :return: hex digest
+        """
+        checksum = hashlib.sha256()
+        checksum.update(json.dumps([name, values or [], sorted(requires or [])],
+                                   sort_keys=True, default=six.text_type).encode('utf-8'))
+        for required in sorted(requires or []):
+            checksum.update(self.digests[required].encode('utf-8'))
+        for path in files or []:
+            checksum.update(b'\0' + os.path.abspath(path).encode('utf-8') + b'\0')
+            try:
+                FileHelper.update_checksum(checksum, path)
+            except (IOError, OSError):
+                checksum.update(b'\0missing')
+        digest = checksum.hexdigest()
+        with self._lock:
+            self.digests[name] = digest
+        return digest
+
+    def get(self, name, digest):
+        """
+        Gets data of a completed stage.
+
+        :param name: name of the stage
+        :param digest: digest of current inputs of the stage
+        :return: recorded data or None if the stage was not completed with the same inputs
+        """
+        with self._lock:
+            entry = self.stages.get(name)
+        if entry and entry.get('digest') == digest:
+            return entry.get('data')
+        return None
+
+    def record(self, name, digest, data):
+        """
+        Records a completed stage and saves the manifest.
+
+        :param name: name of the stage
+        :param digest: digest of inputs of the stage
+        :param data: JSON serializable data needed to restore results of the stage
+        """
+        with self._lock:
+            self.stages[name] = dict(digest=digest, data=data)
+            try:
+                self.save()
+            except (IOError, OSError, TypeError, ValueError) as e:
+                # checkpoints only save time, never fail the rebase because of them
+                del self.stages[name]
+                logger.debug("Failed to record checkpoint of stage '%s': %s", name, six.text_type(e))
@@ -34,9 +34,13 @@ CHECKERS_DIR = 'checkers'
 LOGS_DIR = 'logs'
 DEBUG_LOG = 'debug.log'
 REPORT = 'report'
+TRACE = 'trace.json'
+PROFILE_DIR = 'profile'
 
 OLD_SOURCES_DIR = 'old_sources'
 NEW_SOURCES_DIR = 'new_sources'
+REST_SOURCES_DIR = 'rest_sources'
+CHECKED_SOURCES_DIR = 'checked_sources'
 
 GIT_CONFIG = '.gitconfig'
 
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+from __future__ import print_function
+import argparse
+import errno
+import json
+import logging
+import os
+import socket
+import sys
+
+import six
+
+from six.moves import socketserver
+
+# importing batch loads all plugins, rpm, git, koji and copr bindings, jobs inherit them
+from rebasehelper.batch import BatchHelper
+from rebasehelper.exceptions import RebaseHelperError
+from rebasehelper.logger import logger, logger_output, main_handler, output_tool_handler
+from rebasehelper.utils import RpmHelper
+
+
+class JobLogHandler(logging.Handler):
+    """Logging handler sending log records of a job to the client."""
+
+    def __init__(self, connection):
+        super(JobLogHandler, self).__init__()
+        self.connection = connection
+
+    def emit(self, record):
+        try:
+            DaemonHelper.send(self.connection, dict(type='log', level=record.levelno,
+                                                    message=self.format(record)))
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Handler of a single job, runs in a process forked from the daemon."""
+
+    def handle(self):
+        try:
+            job = json.loads(self.rfile.readline().decode('utf-8'))
+            cwd = job['cwd']
+            args = [six.text_type(a) for a in job.get('args', [])]
+        except (ValueError, KeyError, TypeError) as e:
+            DaemonHelper.send(self.wfile, dict(type='result', result='error',
+                                               message='Invalid job: {}'.format(six.text_type(e))))
+            return
+        # messages of the job go to the client instead of the console of the daemon
+        logger.removeHandler(main_handler)
+        logger_output.removeHandler(output_tool_handler)
+        handler = JobLogHandler(self.wfile)
+        handler.setLevel(logging.DEBUG if job.get('verbose') else logging.INFO)
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        logger.addHandler(handler)
+        output_handler = JobLogHandler(self.wfile)
+        logger_output.addHandler(output_handler)
+        if '--non-interactive' not in args:
+            # there is no terminal to interact with user
+            args.append('--non-interactive')
+        result = BatchHelper.rebase_package(cwd, None, args)
+        logger.removeHandler(handler)
+        logger_output.removeHandler(output_handler)
+        result['type'] = 'result'
+        DaemonHelper.send(self.wfile, result)
+
+
+class DaemonServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """
+    Server accepting rebase jobs on a Unix domain socket.
+
+    Every job runs in a process forked from the daemon, so it starts with the warm state
+    of the daemon and its changes to global state, e.g. results_store, are discarded
+    when it finishes.
+    """
+
+    def __init__(self, path, jobs):
+        self.max_children = jobs
+        socketserver.UnixStreamServer.__init__(self, path, JobHandler)
+
+
+class DaemonHelper(object):
+
+    """Class for running rebase-helper as a daemon and submitting jobs to it."""
+
+    @staticmethod
+    def get_default_socket():
+        runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+        if runtime_dir:
+            return os.path.join(runtime_dir, 'rebase-helper.sock')
+        return os.path.join('/tmp', 'rebase-helper-{}.sock'.format(os.getuid()))
+
+    @staticmethod
+    def build_parser():
+        parser = argparse.ArgumentParser(
+            description='Run rebase-helper as a daemon or submit a job to it. Arguments following '
+                        '--submit are passed to rebase-helper running in the current directory.')
+        parser.add_argument('--socket', default=DaemonHelper.get_default_socket(),
+                            help='path to the socket of the daemon, defaults to %(default)s')
+        parser.add_argument('-j', '--jobs', type=int, default=40,
+                            help='maximal number of jobs running at the same time, defaults to %(default)s')
+        parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                            help='send debug messages of submitted job')
+        parser.add_argument('--submit', default=False, action='store_true',
+                            help='submit a job to the daemon instead of starting it')
+        parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+        return parser
+
+    @staticmethod
+    def send(stream, message):
+        """
+        Sends a message as a single line of JSON.
+
+        :param stream: file-like object of the connection
+        :param message: dict to send
+        """
+        stream.write(json.dumps(message).encode('utf-8') + b'\n')
+        stream.flush()
+
+    @staticmethod
+    def receive(stream):
+        """
+        Receives messages sent by send().
+
+        :param stream: file-like object of the connection
+        :return: generator of received dicts
+        """
+        for line in iter(stream.readline, b''):
+            yield json.loads(line.decode('utf-8'))
+
+    @staticmethod
+    def warm_up():
+        """Does the work shared by all jobs, so that forked jobs don't have to repeat it."""
+        RpmHelper.ARCHES = RpmHelper.get_arches()
+
+    @staticmethod
+    def remove_stale_socket(path):
+        """
+        Removes socket left behind by a daemon that didn't exit cleanly.
+
+        :param path: path to the socket
+        :raises RebaseHelperError: if another daemon is listening on the socket
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except socket.error as e:
+            if e.errno == errno.ENOENT:
+                return
+            if e.errno != errno.ECONNREFUSED:
+                raise RebaseHelperError("Can't use socket '{}': {}".format(path, six.text_type(e)))
+            # nobody is listening
+            os.unlink(path)
+        else:
+            raise RebaseHelperError("Another daemon is already listening on '{}'".format(path))
+        finally:
+            sock.close()
+
+    @classmethod
+    def serve(cls, path, jobs):
+        """
+        Runs the daemon until it is interrupted.
+
+        :param path: path to the socket
+        :param jobs: maximal number of jobs running at the same time
+        :raises RebaseHelperError: if another daemon is listening on the socket
+        """
+        cls.remove_stale_socket(path)
+        cls.warm_up()
+        # only the owner of the daemon can submit jobs
+        umask = os.umask(0o077)
+        try:
+            server = DaemonServer(path, jobs)
+        finally:
+            os.umask(umask)
+        logger.info('Listening on %s', path)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(path)
+
+    @classmethod
+    def submit(cls, path, cwd, args, verbose=False):
+        """
+        Submits a job to the daemon and logs messages of the job as they come.
+
+        :param path: path to the socket of the daemon
+        :param cwd: package directory
+        :param args: list of rebase-helper arguments
+        :param verbose: whether to receive debug messages
+        :return: dict with the result of the rebase
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        stream = sock.makefile('rwb')
+        try:
+            cls.send(stream, dict(cwd=cwd, args=args, verbose=verbose))
+            for message in cls.receive(stream):
+                if message['type'] == 'log':
+                    print(message['message'])
+                elif message['type'] == 'result':
+                    return message
+        finally:
+            stream.close()
+            sock.close()
+        return dict(result='error', message='Connection to the daemon was closed unexpectedly')
+
+    @classmethod
+    def run(cls):
+        parser = cls.build_parser()
+        options = parser.parse_args()
+        if options.submit:
+            args = [a for a in options.args if a != '--']
+            try:
+                result = cls.submit(options.socket, os.getcwd(), args, options.verbose)
+            except socket.error as e:
+                logger.error('Failed to connect to the daemon: %s', six.text_type(e))
+                sys.exit(1)
+            sys.exit(0 if result['result'] == 'success' else 1)
+        try:
+            cls.serve(options.socket, options.jobs)
+        except KeyboardInterrupt:
+            logger.info('Interrupted by user')
+        except RebaseHelperError as e:
+            logger.error('%s', e.msg if e.msg else six.text_type(e))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    DaemonHelper.run()
@@ -23,8 +23,6 @@
 import logging
 import six
 
-import rebasehelper.utils
-
 
 class CustomLogger(logging.Logger):
 
@@ -178,3 +176,6 @@ logger_upstream = LoggerHelper.get_basic_logger('rebase-helper-upstream')
 output_tool_handler = LoggerHelper.add_stream_handler(logger_output)
 formatter = logging.Formatter("%(levelname)s: %(message)s")
 main_handler = LoggerHelper.add_stream_handler(logger, logging.DEBUG, formatter)
+
+# imported last, rebasehelper.utils needs the loggers defined above
+import rebasehelper.utils  # pylint: disable=wrong-import-position
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import re
+
+
+class MacroParser(object):
+    """
+    Parser of strings containing RPM macros.
+
+    Parsing produces a tree of nodes, each node is a tuple starting with node type:
+
+    - (TEXT, text) for plain text
+    - (MACRO, name) for %name or %{name}
+    - (CONDITIONAL, condition, children) for %{condition:children}, condition being
+      the name of the macro including any leading '?' and '!'
+    """
+
+    TEXT = 't'
+    MACRO = 'm'
+    CONDITIONAL = 'c'
+
+    MACRO_RE = re.compile(r'%(?P<brace>{\??)?(?P<name>\w+)(?(brace)})')
+
+    @classmethod
+    def parse(cls, s):
+        """
+        Parses a string in time linear to its length.
+
+        :param s: string to parse
+        :return: list of nodes
+        """
+        tree, _ = cls._parse(s, 0, False)
+        return tree
+
+    @classmethod
+    def _parse(cls, s, pos, nested):
+        tree = []
+        text = []
+
+        def flush():
+            if text:
+                tree.append((cls.TEXT, ''.join(text)))
+                del text[:]
+
+        length = len(s)
+        while pos < length:
+            c = s[pos]
+            pos += 1
+            if c == '%' and pos < length:
+                c = s[pos]
+                pos += 1
+                if c == '%':
+                    text.append(c)
+                elif c == '{':
+                    flush()
+                    end = pos
+                    while end < length and s[end] not in ':}':
+                        end += 1
+                    if end == length:
+                        # unterminated macro, ignore it
+                        return tree, length
+                    name = s[pos:end]
+                    pos = end + 1
+                    if s[end] == ':':
+                        children, pos = cls._parse(s, pos, True)
+                        tree.append((cls.CONDITIONAL, name, children))
+                    else:
+                        tree.append((cls.MACRO, name))
+                elif c.isalnum() or c == '_':
+                    flush()
+                    start = pos - 1
+                    while pos < length and (s[pos].isalnum() or s[pos] == '_'):
+                        pos += 1
+                    tree.append((cls.MACRO, s[start:pos]))
+                else:
+                    text.append('%')
+                    text.append(c)
+            elif c == '}' and nested:
+                flush()
+                return tree, pos
+            else:
+                text.append(c)
+        flush()
+        return tree, pos
+
+    @classmethod
+    def find_macros(cls, s, names):
+        """
+        Finds macros present in a string.
+
+        :param s: string to search
+        :param names: container of names of macros to look for, e.g. SpecContent.macro_definitions
+        :return: list of tuples (name, span) in order of appearance
+        """
+        return [(m.group('name'), m.span()) for m in cls.MACRO_RE.finditer(s) if m.group('name') in names]
+
+    @classmethod
+    def expand_definitions(cls, s, definitions):
+        """
+        Recursively replaces macros whose values contain other defined macros with their values,
+        so that the result contains only macros with values not referencing any other defined macro.
+
+        :param s: string to expand
+        :param definitions: mapping of names of defined macros to their raw values
+        :return: expanded string
+        """
+        # expansion of each macro is computed only once, this also stops infinite recursion
+        expansions = {}
+
+        def expand(s):
+            replace = []
+            for name, span in cls.find_macros(s, definitions):
+                if name not in expansions:
+                    expansions[name] = None
+                    value = definitions.get(name)
+                    if value:
+                        rep = expand(value)
+                        if cls.find_macros(rep, definitions):
+                            expansions[name] = rep
+                if expansions[name] is not None:
+                    replace.append((expansions[name], span))
+            for rep, span in reversed(replace):
+                s = s[:span[0]] + rep + s[span[1]:]
+            return s
+
+        return expand(s)
@@ -111,6 +111,21 @@ OPTIONS = [
         "type": lambda s: s.split(','),
         "help": "set of tools to use for package comparison, defaults to %(default)s",
     },
+    {
+        "name": ["--checker-workers"],
+        "default": 0,
+        "type": int,
+        "metavar": "N",
+        "help": "maximal number of checkers to run at the same time, 0 means no limit, defaults to %(default)s",
+    },
+    {
+        "name": ["--extraction-workers"],
+        "default": 0,
+        "type": int,
+        "metavar": "N",
+        "help": "maximal number of source archives to extract at the same time, "
+                "0 means number of CPUs, defaults to %(default)s",
+    },
     {
         "name": ["--outputtool"],
         "choices": BaseOutputTool.get_supported_tools(),
@@ -183,6 +198,61 @@ OPTIONS = [
         "switch": True,
         "help": "force rebase even if current version is newer than requested version",
     },
+    {
+        "name": ["--parallel-builds"],
+        "default": False,
+        "switch": True,
+        "help": "build old and new packages at the same time, binary packages only with local build tools",
+    },
+    {
+        "name": ["--trace"],
+        "default": False,
+        "switch": True,
+        "help": "write durations of rebase stages and helper calls to trace.json in results directory, "
+                "in Chrome trace event format",
+    },
+    {
+        "name": ["--profile"],
+        "default": False,
+        "switch": True,
+        "help": "profile each rebase stage separately, stages are run one by one, "
+                "reports are written to profile directory in results directory",
+    },
+    {
+        "name": ["--build-cache-dir"],
+        "default": None,
+        "metavar": "DIR",
+        "help": "cache results of old builds in %(metavar)s and reuse them while the package doesn't change",
+    },
+    {
+        "name": ["--build-cache-size"],
+        "default": 4096,
+        "type": int,
+        "metavar": "MIB",
+        "help": "maximal size of the build cache in MiB, least recently used builds are removed "
+                "when it is exceeded, defaults to %(default)s",
+    },
+    {
+        "name": ["--extract-while-downloading"],
+        "default": False,
+        "switch": True,
+        "help": "extract the new sources archive while it is being downloaded",
+    },
+    {
+        "name": ["--source-cache-dir"],
+        "default": None,
+        "metavar": "DIR",
+        "help": "cache extracted source archives in %(metavar)s and reuse them instead of extracting "
+                "the same archives again",
+    },
+    {
+        "name": ["--source-cache-size"],
+        "default": 4096,
+        "type": int,
+        "metavar": "MIB",
+        "help": "maximal size of the source cache in MiB, least recently used sources are removed "
+                "when it is exceeded, defaults to %(default)s",
+    },
     {
         "name": ["--update-sources"],
         "default": False,
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import itertools
+import os
+import shlex
+
+from rebasehelper.utils import SilentArgumentParser, ParseError
+
+
+class PrepIndex(object):
+    """
+    Class representing commands of an expanded %prep section.
+
+    All lines are tokenized and parsed just once, when the index is created. The index maps
+    names of patch files to strip levels of commands applying them and names of archives
+    to directories they are extracted to by 'tar' or 'unzip' commands.
+    """
+
+    def __init__(self, lines, builddir):
+        """
+        Constructor of PrepIndex.
+
+        :param lines: lines of expanded %prep section, lines split by backslash already joined
+        :param builddir: expanded value of %{_builddir}
+        """
+        # maps names of patch files to strip levels
+        self.strip_options = {}
+        # list of tuples (line, target) of lines extracting archives
+        self.extractions = []
+        # maps names of tokens on lines extracting archives to indexes of the first such line
+        self._extraction_tokens = {}
+        self._build(lines, builddir)
+
+    def _build(self, lines, builddir):
+        patch_parser = SilentArgumentParser()
+        patch_parser.add_argument('-p', type=int, default=0)
+        cd_parser = SilentArgumentParser()
+        cd_parser.add_argument('dir', default=os.environ.get('HOME', ''))
+        extract_parsers = {}
+        extract_parsers['tar'] = SilentArgumentParser()
+        extract_parsers['tar'].add_argument('-C', default='.', dest='target')
+        extract_parsers['unzip'] = SilentArgumentParser()
+        extract_parsers['unzip'].add_argument('-d', default='.', dest='target')
+        basedir = builddir
+        for line in lines:
+            tokens = shlex.split(line, comments=True)
+            if not tokens:
+                continue
+            try:
+                ns, rest = patch_parser.parse_known_args(tokens[1:])
+            except ParseError:
+                pass
+            else:
+                for arg in rest:
+                    self.strip_options[os.path.basename(arg)] = ns.p
+            target = None
+            # split tokens by pipe
+            for group in [list(g) for k, g in itertools.groupby(tokens, lambda t: t == '|') if not k]:
+                cmd, args = os.path.basename(group[0]), group[1:]
+                if cmd == 'cd':
+                    # keep track of current directory
+                    try:
+                        ns, _ = cd_parser.parse_known_args(args)
+                    except ParseError:
+                        pass
+                    else:
+                        basedir = ns.dir if os.path.isabs(ns.dir) else os.path.join(basedir, ns.dir)
+                elif cmd in extract_parsers and target is None:
+                    try:
+                        ns, _ = extract_parsers[cmd].parse_known_args(args)
+                    except ParseError:
+                        continue
+                    target = os.path.normpath(os.path.join(os.path.relpath(basedir, builddir), ns.target))
+            if target is not None:
+                for token in tokens:
+                    self._extraction_tokens.setdefault(os.path.basename(token), len(self.extractions))
+                self.extractions.append((line, target))
+
+    def get_strip_option(self, patch):
+        """
+        Gets strip level of a command applying the specified patch.
+
+        :param patch: name of the patch file
+        :return: strip level or None if the patch is not applied
+        """
+        return self.strip_options.get(patch)
+
+    def get_archive_target(self, archive):
+        """
+        Gets target directory of the first command extracting the specified archive.
+
+        :param archive: path to the archive
+        :return: target path relative to builddir or None if not determined
+        """
+        archive = os.path.basename(archive)
+        index = self._extraction_tokens.get(archive, len(self.extractions))
+        # the archive can be mentioned on an earlier line without being a separate argument
+        for line, target in self.extractions[:index]:
+            if archive in line:
+                return target
+        if index < len(self.extractions):
+            return self.extractions[index][1]
+        return None
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import cProfile
+import contextlib
+import functools
+import os
+
+import six
+
+try:
+    import tracemalloc
+except ImportError:
+    # not available in Python 2
+    tracemalloc = None
+
+from rebasehelper.logger import logger
+
+
+class StageProfiler(object):
+    """
+    Class profiling stages of the rebase, each one separately.
+
+    For every stage, cProfile statistics are written to <stage>.pstats and, where tracemalloc
+    is available, the top memory allocations done by the stage to <stage>-memory.txt.
+    Only the thread running the stage is profiled by cProfile.
+    """
+
+    # number of allocation sites in memory reports
+    TOP_ALLOCATIONS = 25
+
+    def __init__(self, path, enabled=True):
+        """
+        Constructor of StageProfiler.
+
+        :param path: directory to write the reports to
+        :param enabled: whether to profile at all
+        """
+        self.path = path
+        self.enabled = enabled
+
+    @contextlib.contextmanager
+    def profile(self, name):
+        """
+        Context manager profiling the enclosed block as a stage.
+
+        :param name: name of the stage
+        """
+        if not self.enabled:
+            yield
+            return
+        trace_memory = tracemalloc is not None and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            snapshot = None
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+            self._write_reports(name, profiler, snapshot)
+
+    def wrap(self, name, function):
+        """
+        Wraps a function so that each of its calls is profiled as a stage.
+
+        :param name: name of the stage
+        :param function: function running the stage
+        :return: wrapped function
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.profile(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def _write_reports(self, name, profiler, snapshot):
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            profiler.dump_stats(os.path.join(self.path, '{}.pstats'.format(name)))
+            if snapshot is not None:
+                snapshot = snapshot.filter_traces([
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                ])
+                statistics = snapshot.statistics('lineno')[:self.TOP_ALLOCATIONS]
+                with open(os.path.join(self.path, '{}-memory.txt'.format(name)), 'w') as f:
+                    f.write('Top {} allocations of stage {}:\n'.format(len(statistics), name))
+                    for stat in statistics:
+                        f.write('{}\n'.format(stat))
+        except (IOError, OSError) as e:
+            logger.warning("Can not write profile of stage '%s': %s", name, six.text_type(e))
+        else:
+            logger.debug("Profile of stage '%s' written to %s", name, self.path)
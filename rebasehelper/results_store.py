@@ -32,6 +32,7 @@ class ResultsStore(object):
     RESULTS_PATCHES = 'patches'
     RESULTS_CHANGES_PATCH = 'changes_patch'
     RESULTS_SUCCESS = 'result'
+    RESULTS_TIMINGS = 'timings'
 
     def __init__(self):
         self._data_store = dict()
@@ -46,7 +47,8 @@ class ResultsStore(object):
                 self.RESULTS_BUILDS,
                 self.RESULTS_PATCHES,
                 self.RESULTS_CHANGES_PATCH,
-                self.RESULTS_SUCCESS
+                self.RESULTS_SUCCESS,
+                self.RESULTS_TIMINGS
         ):
             raise ValueError('Trying to set unsupported type of results: %s!' % results_type)
 
@@ -75,6 +77,9 @@ class ResultsStore(object):
     def set_result_message(self, text, data):
         self.set_results(self.RESULTS_SUCCESS, {text: data})
 
+    def set_timings(self, data_dict):
+        self.set_results(self.RESULTS_TIMINGS, data_dict)
+
     def get_all(self):
         return copy.deepcopy(self._data_store)
 
@@ -106,6 +111,9 @@ class ResultsStore(object):
     def get_result_message(self):
         return self._data_store.get(self.RESULTS_SUCCESS, None)
 
+    def get_timings(self):
+        return self._data_store.get(self.RESULTS_TIMINGS, None)
+
 
 # global results store
 results_store = ResultsStore()
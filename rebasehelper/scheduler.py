@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import sys
+import threading
+
+import six
+
+from six.moves import queue
+
+from rebasehelper.logger import logger
+from rebasehelper.timing import timings, TimingRecorder
+
+
+class Stage(object):
+    """Class representing a single stage of the rebase."""
+
+    def __init__(self, name, function, requires=None, report_failure=True):
+        """
+        Constructor of Stage class.
+
+        :param name: unique name of the stage
+        :param function: callable running the stage
+        :param requires: list of names of stages that have to finish first
+        :param report_failure: whether failure of the stage should be reported in the rebase summary
+        """
+        self.name = name
+        self.function = function
+        self.requires = list(requires or [])
+        self.report_failure = report_failure
+
+    def __repr__(self):
+        return "<Stage name='{}' requires={}>".format(self.name, self.requires)
+
+
+class StageFailure(Exception):
+    """
+    Error indicating failure of a stage, wraps the original exception.
+    """
+
+    def __init__(self, stage, exc_info):
+        """
+        Constructor of StageFailure.
+
+        :param stage: Stage instance which failed
+        :param exc_info: exception info of the original exception as returned by sys.exc_info()
+        """
+        super(StageFailure, self).__init__()
+        self.stage = stage
+        self.exc_info = exc_info
+
+    @property
+    def exception(self):
+        return self.exc_info[1]
+
+    def reraise(self):
+        """Re-raises the original exception."""
+        six.reraise(*self.exc_info)
+
+
+class StageScheduler(object):
+    """
+    Class running stages of the rebase according to their dependencies.
+
+    A stage is started as soon as all stages it requires are finished, so independent
+    stages run concurrently in separate threads. If only a single stage can run,
+    it is run in the calling thread.
+    """
+
+    def __init__(self, stages, max_workers=None):
+        """
+        Constructor of StageScheduler.
+
+        :param stages: list of Stage instances, their order determines the order stages are started in
+        :param max_workers: maximal number of stages running at the same time, no limit if None
+        :raises ValueError: if the dependencies are not satisfiable
+        """
+        self.stages = list(stages)
+        self.max_workers = max_workers
+        self._check_dependencies()
+
+    def _check_dependencies(self):
+        names = [s.name for s in self.stages]
+        if len(set(names)) != len(names):
+            raise ValueError('Stage names are not unique: {}'.format(', '.join(names)))
+        for stage in self.stages:
+            unknown = [r for r in stage.requires if r not in names]
+            if unknown:
+                raise ValueError("Stage '{}' requires unknown stages: {}".format(stage.name, ', '.join(unknown)))
+        # remove stages with satisfied requirements until nothing is left
+        finished = set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [s for s in remaining if set(s.requires).issubset(finished)]
+            if not ready:
+                raise ValueError('Stages have circular dependencies: {}'.format(
+                    ', '.join(s.name for s in remaining)))
+            finished.update(s.name for s in ready)
+            remaining = [s for s in remaining if s not in ready]
+
+    @staticmethod
+    def _run_stage(stage):
+        logger.debug("Running stage '%s'", stage.name)
+        try:
+            with timings.measure(TimingRecorder.STAGE, stage.name):
+                stage.function()
+        except BaseException:  # pylint: disable=broad-except
+            logger.debug("Stage '%s' failed", stage.name)
+            return StageFailure(stage, sys.exc_info())
+        logger.debug("Stage '%s' finished", stage.name)
+        return None
+
+    def run(self):
+        """
+        Runs all stages.
+
+        No more stages are started after a stage fails. Stages that are already running
+        are waited for.
+
+        :raises StageFailure: for the first of the failed stages in order of definition
+        """
+        finished = set()
+        failures = {}
+        running = set()
+        pending = list(self.stages)
+        results = queue.Queue()
+
+        def worker(stage):
+            results.put((stage, self._run_stage(stage)))
+
+        while True:
+            if not failures:
+                ready = [s for s in pending if set(s.requires).issubset(finished)]
+                if ready and not running and (len(ready) == 1 or self.max_workers == 1):
+                    # nothing to run concurrently, run the stage directly
+                    stage = ready[0]
+                    pending.remove(stage)
+                    failure = self._run_stage(stage)
+                    if failure:
+                        failures[stage.name] = failure
+                    else:
+                        finished.add(stage.name)
+                    continue
+                for stage in ready:
+                    if self.max_workers and len(running) >= self.max_workers:
+                        break
+                    pending.remove(stage)
+                    running.add(stage.name)
+                    thread = threading.Thread(target=worker, args=(stage,), name=stage.name)
+                    thread.daemon = True
+                    thread.start()
+            if not running:
+                break
+            # wait with a timeout so that the main thread can be interrupted
+            while True:
+                try:
+                    stage, failure = results.get(True, 0.1)
+                    break
+                except queue.Empty:
+                    continue
+            running.remove(stage.name)
+            if failure:
+                failures[stage.name] = failure
+            else:
+                finished.add(stage.name)
+
+        for stage in self.stages:
+            if stage.name in failures:
+                raise failures[stage.name]
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import six
+
+from rebasehelper.logger import logger
+from rebasehelper.utils import FileHelper
+from rebasehelper.version import VERSION
+
+
+class SourceCache(object):
+    """
+    On-disk cache of extracted source archives addressed by a digest of the archive.
+
+    Cached trees are materialized by cloning files, so that extracting the same archive again
+    costs almost nothing. Files are cloned with reflinks where the filesystem supports them,
+    otherwise they are hardlinked if allowed, or copied. Reflinks are copy-on-write, hardlinks
+    are not, so they can be allowed only if files of materialized trees are never modified
+    in place. Least recently used entries are evicted when size of the cache exceeds the limit.
+    """
+
+    METADATA = 'tree.json'
+    FILES_DIR = 'files'
+    # ioctl request cloning a whole file, see ioctl_ficlone(2)
+    FICLONE = 0x40049409
+
+    def __init__(self, path, max_size, hardlinks=False):
+        """
+        Constructor of SourceCache.
+
+        :param path: directory of the cache
+        :param max_size: maximal size of the cache in bytes
+        :param hardlinks: whether files can be hardlinked if reflinks are not supported
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hardlinks = hardlinks
+        # None until the first attempt to create a reflink
+        self.reflinks = None
+
+    @staticmethod
+    def get_key(archive_path):
+        """
+        Computes key of a cache entry.
+
+        :param archive_path: path to an archive
+        :return: hex digest or None if the archive can't be read
+        """
+        checksum = hashlib.sha256()
+        # extraction of some archive types depends on the file name
+        checksum.update(json.dumps([VERSION, os.path.basename(archive_path)]).encode('utf-8'))
+        try:
+            FileHelper.update_checksum(checksum, archive_path)
+        except (IOError, OSError):
+            return None
+        return checksum.hexdigest()
+
+    def _reflink(self, source, destination):
+        if self.reflinks is False:
+            return False
+        with open(source, 'rb') as src:
+            with open(destination, 'wb') as dst:
+                try:
+                    fcntl.ioctl(dst.fileno(), self.FICLONE, src.fileno())
+                except (IOError, OSError) as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.EPERM):
+                        raise
+                    # not supported by the filesystem or across filesystems
+                    self.reflinks = False
+                    return False
+        self.reflinks = True
+        return True
+
+    def _clone_file(self, source, destination):
+        try:
+            if self._reflink(source, destination):
+                shutil.copystat(source, destination)
+                return
+        except (IOError, OSError):
+            pass
+        if self.hardlinks:
+            try:
+                if os.path.lexists(destination):
+                    os.unlink(destination)
+                os.link(source, destination)
+                return
+            except OSError:
+                pass
+        shutil.copy2(source, destination)
+
+    def clone_tree(self, source, destination):
+        """
+        Clones a directory tree.
+
+        :param source: path to the directory to clone
+        :param destination: path to the clone, must not exist
+        :return: total size of cloned files in bytes
+        """
+        size = 0
+        os.makedirs(destination)
+        for root, dirs, files in os.walk(source):
+            target = os.path.join(destination, os.path.relpath(root, source))
+            for d in list(dirs):
+                path = os.path.join(root, d)
+                if os.path.islink(path):
+                    # os.walk doesn't descend into links to directories
+                    os.symlink(os.readlink(path), os.path.join(target, d))
+                    continue
+                os.mkdir(os.path.join(target, d))
+            for f in files:
+                path = os.path.join(root, f)
+                if os.path.islink(path):
+                    os.symlink(os.readlink(path), os.path.join(target, f))
+                    continue
+                self._clone_file(path, os.path.join(target, f))
+                size += os.path.getsize(path)
+        # set permissions and times of directories after their content is created
+        for root, dirs, _ in os.walk(source, topdown=False):
+            for d in dirs:
+                path = os.path.join(root, d)
+                if not os.path.islink(path):
+                    shutil.copystat(path, os.path.join(destination, os.path.relpath(path, source)))
+        shutil.copystat(source, destination)
+        return size
+
+    def restore(self, key, destination):
+        """
+        Materializes a cached tree.
+
+        :param key: key of the cache entry
+        :param destination: path to a directory the tree is materialized into, must not exist
+        :return: whether the tree was cached
+        """
+        if not key:
+            return False
+        entry = os.path.join(self.path, key)
+        if os.path.lexists(destination) or not os.path.isfile(os.path.join(entry, self.METADATA)):
+            return False
+        try:
+            self.clone_tree(os.path.join(entry, self.FILES_DIR), destination)
+            # mark the entry as recently used
+            os.utime(entry, None)
+        except (IOError, OSError, shutil.Error):
+            # the entry was evicted in the meantime, don't leave incomplete tree behind
+            shutil.rmtree(destination, ignore_errors=True)
+            return False
+        return True
+
+    def store(self, key, source):
+        """
+        Stores an extracted tree in the cache.
+
+        :param key: key of the cache entry
+        :param source: path to the extracted tree
+        """
+        if not key:
+            return
+        entry = os.path.join(self.path, key)
+        if os.path.isdir(entry):
+            return
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+        except OSError:
+            # created by another rebase at the same time
+            if not os.path.isdir(self.path):
+                raise
+        # prepare the entry aside, so that it appears complete for other rebases
+        tmp = tempfile.mkdtemp(prefix='.', dir=self.path)
+        try:
+            size = self.clone_tree(source, os.path.join(tmp, self.FILES_DIR))
+            if size > self.max_size:
+                shutil.rmtree(tmp)
+                return
+            with open(os.path.join(tmp, self.METADATA), 'w') as f:
+                json.dump(dict(size=size), f)
+            os.rename(tmp, entry)
+        except (IOError, OSError, shutil.Error) as e:
+            logger.debug('Failed to store extracted sources in cache: %s', six.text_type(e))
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def _get_size(self, entry):
+        try:
+            with open(os.path.join(entry, self.METADATA)) as f:
+                return json.load(f)['size']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return 0
+
+    def evict(self):
+        """Removes least recently used entries until size of the cache is within the limit."""
+        entries = []
+        for key in os.listdir(self.path):
+            entry = os.path.join(self.path, key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                entries.append((os.path.getmtime(entry), self._get_size(entry), entry))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            logger.debug("Evicting source cache entry '%s'", os.path.basename(entry))
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import bisect
+import fnmatch
+import re
+
+import six
+
+
+class SpecContent(list):
+    """
+    Class representing lines of a SPEC file with indexes of significant lines.
+
+    Lines are stored exactly as they are, so the content can be written back without any change.
+    Tags, macro definitions, %setup and %patch lines and section headers are indexed, so they can
+    be looked up without scanning the whole content. Indexes are kept up-to-date on every
+    modification, replacing a line only reindexes that line, inserting or removing lines
+    only shifts the indexes following it.
+    """
+
+    TAG = 'tag'
+    MACRO_DEFINITION = 'macro_definition'
+    SETUP = 'setup'
+    PATCH = 'patch'
+    SECTION = 'section'
+
+    SECTIONS = ['%package',
+                '%description',
+                '%prep',
+                '%build',
+                '%install',
+                '%check',
+                '%files',
+                '%changelog']
+
+    TAG_RE = re.compile(r'^(?P<name>\w+)\s*:\s*(?P<value>.+)$')
+    MACRO_DEFINITION_RE = re.compile(
+        r'''
+        ^
+        (?P<cond>%{!?\?\w+:\s*)?
+        (?(cond)%global|%(global|define))
+        \s+
+        (?P<name>\w+)
+        (?P<options>\(.+?\))?
+        \s+
+        (?P<value>.+)
+        (?(cond)})
+        $
+        ''',
+        re.VERBOSE)
+    SETUP_RE = re.compile(r'^%(?P<name>setup|autosetup)')
+    PATCH_RE = re.compile(r'^%patch(?P<number>\d*)')
+
+    def __init__(self, lines=()):
+        super(SpecContent, self).__init__(lines)
+        self._indexes = {}
+        self._reindex()
+        self.macro_definitions = MacroDefinitions(self)
+
+    @classmethod
+    def classify(cls, line):
+        """
+        Finds out what kind of significant line a line is.
+
+        :param line: line of a SPEC file
+        :return: list of tuples (kind, key), empty if the line is not significant
+        """
+        if not line:
+            return []
+        if line[0] != '%':
+            match = cls.TAG_RE.match(line)
+            return [(cls.TAG, match.group('name'))] if match else []
+        match = cls.MACRO_DEFINITION_RE.match(line)
+        if match:
+            return [(cls.MACRO_DEFINITION, match.group('name'))]
+        match = cls.SETUP_RE.match(line)
+        if match:
+            return [(cls.SETUP, match.group('name'))]
+        match = cls.PATCH_RE.match(line)
+        if match:
+            return [(cls.PATCH, match.group('number'))]
+        lowered = line.lower()
+        return [(cls.SECTION, s) for s in cls.SECTIONS if lowered.startswith(s)]
+
+    def _reindex(self):
+        self._indexes = {}
+        for index, line in enumerate(self):
+            self._add(index, line)
+
+    def _add(self, index, line):
+        for kind, key in self.classify(line):
+            bisect.insort(self._indexes.setdefault(kind, {}).setdefault(key, []), index)
+
+    def _remove(self, index, line):
+        for kind, key in self.classify(line):
+            indexes = self._indexes[kind][key]
+            indexes.remove(index)
+            if not indexes:
+                del self._indexes[kind][key]
+
+    def _shift(self, start, delta):
+        """Shifts indexes of all lines starting at start by delta."""
+        for keys in six.itervalues(self._indexes):
+            for indexes in six.itervalues(keys):
+                for i in range(bisect.bisect_left(indexes, start), len(indexes)):
+                    indexes[i] += delta
+
+    def find(self, kind, key=None):
+        """
+        Finds significant lines.
+
+        :param kind: kind of significant lines, one of TAG, MACRO_DEFINITION, SETUP, PATCH or SECTION
+        :param key: name of a tag or a macro, 'setup' or 'autosetup', patch number as string
+                    or section header, None means any
+        :return: sorted list of indexes of matching lines
+        """
+        keys = self._indexes.get(kind, {})
+        if key is not None:
+            return list(keys.get(key, []))
+        return sorted(i for indexes in six.itervalues(keys) for i in indexes)
+
+    def find_first(self, kind, key=None):
+        """
+        Finds the first significant line.
+
+        :param kind: kind of significant lines, see find()
+        :param key: key of significant lines, see find()
+        :return: index of the first matching line or None
+        """
+        indexes = self.find(kind, key)
+        return indexes[0] if indexes else None
+
+    def get_macro_value(self, name):
+        """
+        Gets raw value of a macro defined in the content.
+
+        :param name: name of the macro
+        :return: value from the first definition of the macro or None if it is not defined
+        """
+        index = self.find_first(self.MACRO_DEFINITION, name)
+        if index is None:
+            return None
+        return self.MACRO_DEFINITION_RE.match(self[index]).group('value')
+
+    def split_sections(self):
+        """
+        Splits the content to sections in a single pass over section headers.
+
+        :return: SpecSections instance, the header of the SPEC file is under key 0,
+                 sections follow in order of appearance
+        """
+        starts = self.find(self.SECTION)
+        sections = SpecSections()
+        # the SPEC header is everything until the beginning of the first section
+        sections[0] = ('%header', self[:starts[0] if starts else len(self)])
+        for i, start in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else len(self)
+            sections[i + 1] = (self[start].strip(), self[start + 1:end])
+        return sections
+
+    def get_keys(self, kind):
+        """
+        Gets keys of all significant lines of a kind, e.g. names of all defined macros.
+
+        :param kind: kind of significant lines, see find()
+        :return: set of keys
+        """
+        return set(self._indexes.get(kind, {}))
+
+    # list modifications
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            super(SpecContent, self).__setitem__(index, value)
+            self._reindex()
+            return
+        if index < 0:
+            index += len(self)
+        self._remove(index, self[index])
+        super(SpecContent, self).__setitem__(index, value)
+        self._add(index, value)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            super(SpecContent, self).__delitem__(index)
+            self._reindex()
+            return
+        self.pop(index)
+
+    def __setslice__(self, i, j, sequence):
+        # Python 2 only
+        self.__setitem__(slice(i, j), sequence)
+
+    def __delslice__(self, i, j):
+        # Python 2 only
+        self.__delitem__(slice(i, j))
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        super(SpecContent, self).__imul__(n)
+        self._reindex()
+        return self
+
+    def append(self, line):
+        super(SpecContent, self).append(line)
+        self._add(len(self) - 1, line)
+
+    def extend(self, lines):
+        start = len(self)
+        super(SpecContent, self).extend(lines)
+        for index in range(start, len(self)):
+            self._add(index, self[index])
+
+    def insert(self, index, line):
+        if index < 0:
+            index = max(0, index + len(self))
+        index = min(index, len(self))
+        super(SpecContent, self).insert(index, line)
+        self._shift(index, 1)
+        self._add(index, line)
+
+    def pop(self, index=-1):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('pop index out of range')
+        self._remove(index, self[index])
+        line = super(SpecContent, self).pop(index)
+        self._shift(index + 1, -1)
+        return line
+
+    def remove(self, line):
+        self.pop(self.index(line))
+
+    def sort(self, *args, **kwargs):
+        super(SpecContent, self).sort(*args, **kwargs)
+        self._reindex()
+
+    def reverse(self):
+        super(SpecContent, self).reverse()
+        self._reindex()
+
+
+class MacroDefinitions(object):
+    """
+    Read-only mapping of names of macros defined in SpecContent to their raw values.
+
+    It is backed by the index of macro definitions, so it always reflects the current content.
+    """
+
+    def __init__(self, content):
+        self._content = content
+
+    def _get_names(self):
+        return self._content._indexes.get(SpecContent.MACRO_DEFINITION, {})  # pylint: disable=protected-access
+
+    def __contains__(self, name):
+        return name in self._get_names()
+
+    def __iter__(self):
+        return iter(list(self._get_names()))
+
+    def __len__(self):
+        return len(self._get_names())
+
+    def __getitem__(self, name):
+        value = self._content.get_macro_value(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def get(self, name, default=None):
+        value = self._content.get_macro_value(name)
+        return default if value is None else value
+
+
+class SpecSections(dict):
+    """
+    Dictionary of sections of a SPEC file.
+
+    Keys are positions of sections, values are tuples (section header, list of lines).
+    Keys are indexed by lowercase section header and by section type (e.g. '%files'
+    for '%files devel'), the indexes are kept up-to-date when sections are modified.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SpecSections, self).__init__(*args, **kwargs)
+        self._names = {}
+        self._types = {}
+        for key, value in six.iteritems(self):
+            self._add(key, value)
+
+    @staticmethod
+    def _get_name_and_type(header):
+        name = header.lower()
+        tokens = name.split()
+        return name, tokens[0] if tokens else name
+
+    def _add(self, key, value):
+        name, section_type = self._get_name_and_type(value[0])
+        bisect.insort(self._names.setdefault(name, []), key)
+        bisect.insort(self._types.setdefault(section_type, []), key)
+
+    def _remove(self, key, value):
+        name, section_type = self._get_name_and_type(value[0])
+        for index, k in [(self._names, name), (self._types, section_type)]:
+            index[k].remove(key)
+            if not index[k]:
+                del index[k]
+
+    def find(self, name):
+        """
+        Finds sections by header.
+
+        :param name: section header, e.g. '%files devel', case insensitive
+        :return: sorted list of keys of matching sections
+        """
+        return list(self._names.get(name.lower(), []))
+
+    def find_type(self, section_type):
+        """
+        Finds sections by type.
+
+        :param section_type: section type, e.g. '%files', case insensitive
+        :return: sorted list of keys of matching sections
+        """
+        return list(self._types.get(section_type.lower(), []))
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self._remove(key, self[key])
+        super(SpecSections, self).__setitem__(key, value)
+        self._add(key, value)
+
+    def __delitem__(self, key):
+        self._remove(key, self[key])
+        super(SpecSections, self).__delitem__(key)
+
+    def pop(self, key, *args):
+        if key in self:
+            self._remove(key, self[key])
+        return super(SpecSections, self).pop(key, *args)
+
+    def popitem(self):
+        key, value = super(SpecSections, self).popitem()
+        self._remove(key, value)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in six.iteritems(dict(*args, **kwargs)):
+            self[key] = value
+
+    def clear(self):
+        super(SpecSections, self).clear()
+        self._names = {}
+        self._types = {}
+
+
+class FilesIndex(object):
+    """
+    Index of entries of a %files section.
+
+    Maps paths listed in the section to indexes of lines listing them. Directives like
+    %doc or %attr(...) are not considered paths, commented out lines are not indexed.
+    Glob patterns naming specific files, like %{_libdir}/libfoo.so.1*, are kept aside
+    and matched with fnmatch, patterns matching any file in a directory, like %{_bindir}/*,
+    are ignored, a single path never stands for all of them.
+    """
+
+    DIRECTIVES_RE = re.compile(r'^\s*(%[a-z]+(\([^)]*\))?\s+)*')
+    GLOB_CHARS = '*?['
+
+    def __init__(self, lines):
+        """
+        Constructor of FilesIndex.
+
+        :param lines: lines of the section
+        """
+        self._paths = {}
+        self._globs = []
+        for index, line in enumerate(lines):
+            for path in self.get_paths(line):
+                if not any(c in path for c in self.GLOB_CHARS):
+                    self._paths.setdefault(path, []).append(index)
+                elif path.rsplit('/', 1)[-1][:1] not in self.GLOB_CHARS:
+                    self._globs.append((path, index))
+
+    @classmethod
+    def get_paths(cls, line):
+        """
+        Gets paths listed on a line of %files section.
+
+        :param line: line to parse
+        :return: list of paths
+        """
+        if line.lstrip().startswith('#'):
+            return []
+        return cls.DIRECTIVES_RE.sub('', line, count=1).split()
+
+    def find(self, path):
+        """
+        Finds lines listing a path.
+
+        :param path: path as listed in the section
+        :return: sorted list of indexes of lines
+        """
+        indexes = self._paths.get(path, [])
+        matching = [i for pattern, i in self._globs if i not in indexes and fnmatch.fnmatchcase(path, pattern)]
+        if not matching:
+            return indexes
+        return sorted(set(indexes + matching))
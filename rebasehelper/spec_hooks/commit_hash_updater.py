@@ -23,6 +23,7 @@
 import re
 
 from rebasehelper.specfile import BaseSpecHook
+from rebasehelper.spec_content import SpecContent
 from rebasehelper.logger import logger
 from rebasehelper.utils import DownloadHelper
 
@@ -121,6 +122,6 @@ class CommitHashUpdaterHook(BaseSpecHook):
                 return
             source = source.replace(hashes[0], new_commit)
         tag = 'Source0'
-        if [l for l in rebase_spec_file.spec_content if re.match(r'^Source\s*:.*', l)]:
+        if rebase_spec_file.spec_content.find_first(SpecContent.TAG, 'Source') is not None:
             tag = 'Source'
         rebase_spec_file.set_tag(tag, source, preserve_macros=True)
@@ -21,13 +21,15 @@
 #          Tomas Hozza <thozza@redhat.com>
 
 from __future__ import print_function
+import collections
+import contextlib
+import hashlib
 import os
 import re
 import shutil
+import sys
 import rpm
-import argparse
 import shlex
-import itertools
 
 import pkg_resources
 
@@ -39,11 +41,14 @@ from operator import itemgetter
 
 from six.moves import urllib
 
-from rebasehelper.utils import DownloadHelper, DownloadError, MacroHelper, GitHelper, RpmHelper
+from rebasehelper.utils import DownloadHelper, DownloadError, MacroHelper, GitHelper, RpmHelper, rpm_lock
 from rebasehelper.utils import LookasideCacheHelper, LookasideCacheError, SilentArgumentParser, ParseError, defenc
 from rebasehelper.logger import logger
 from rebasehelper import constants
 from rebasehelper.archive import Archive
+from rebasehelper.macro_parser import MacroParser
+from rebasehelper.prep_index import PrepIndex
+from rebasehelper.spec_content import SpecContent, SpecSections, FilesIndex
 from rebasehelper.exceptions import RebaseHelperError
 
 
@@ -105,25 +110,28 @@ class SpecFile(object):
 
     path = ''
     download = False
-    spec_content = []
+    _spec_content = SpecContent()
     spc = None
     hdr = None
     extra_version = None
     category = None
     sources = None
     patches = None
-    rpm_sections = {}
+    rpm_sections = SpecSections()
     prep_section = []
+    _prep_index = None
     removed_patches = []
 
-    defined_sections = ['%package',
-                        '%description',
-                        '%prep',
-                        '%build',
-                        '%install',
-                        '%check',
-                        '%files',
-                        '%changelog']
+    # maximal number of parse results kept in memory
+    PARSE_CACHE_SIZE = 16
+    # results of parsing SPEC files shared by all instances, see _parse_spec()
+    _parse_cache = collections.OrderedDict()
+    # nesting level of edit() contexts
+    _edit_depth = 0
+    # whether saving was deferred by edit()
+    _save_pending = False
+
+    defined_sections = SpecContent.SECTIONS
 
     def __init__(self, path, changelog_entry, sources_location='', download=True):
         self.path = path
@@ -137,11 +145,22 @@ class SpecFile(object):
         self.removed_patches = []
         self._update_data()
 
-    def download_remote_sources(self):
+    @property
+    def spec_content(self):
+        """Lines of the SPEC file, a SpecContent instance."""
+        return self._spec_content
+
+    @spec_content.setter
+    def spec_content(self, lines):
+        self._spec_content = SpecContent(lines)
+
+    def download_remote_sources(self, extract_archive_to=None):
         """
         Method that iterates over all sources and downloads ones, which contain URL instead of just a file.
 
-        :return: None
+        :param extract_archive_to: path to a directory the archive (Source0) is extracted into
+                                   while it's being downloaded
+        :return: whether the archive was extracted into extract_archive_to
         """
         try:
             # try to download old sources from Fedora lookaside cache
@@ -152,16 +171,47 @@ class SpecFile(object):
 
         # filter out only sources with URL
         remote_files = [source for source in self.sources if bool(urllib.parse.urlparse(source).scheme)]
+        archive = self.get_sources()[0] if self.sources else None
+        extracted = False
         # download any sources that are not yet downloaded
         for remote_file in remote_files:
             local_file = os.path.join(self.sources_location, os.path.basename(remote_file))
             if not os.path.isfile(local_file):
                 logger.debug("File '%s' doesn't exist locally, downloading it.", local_file)
+                extractor = None
+                if extract_archive_to and local_file == archive:
+                    try:
+                        extractor = Archive(local_file).extract_stream(extract_archive_to)
+                    except NotImplementedError as e:
+                        logger.debug('%s', six.text_type(e))
+                downloaded = False
                 try:
-                    DownloadHelper.download_file(remote_file, local_file)
+                    downloaded = DownloadHelper.download_file(remote_file, local_file, tee=extractor)
                 except DownloadError as e:
                     raise RebaseHelperError("Failed to download file from URL {}. "
                                             "Reason: '{}'. ".format(remote_file, str(e)))
+                finally:
+                    if extractor:
+                        extracted = self._finish_extraction(extractor, downloaded)
+        return extracted
+
+    @staticmethod
+    def _finish_extraction(extractor, complete):
+        """
+        Finishes extraction of a downloaded archive, removes extracted files if it's not complete.
+
+        :param extractor: StreamingExtractor instance
+        :param complete: whether the whole archive was downloaded
+        :return: whether the archive was extracted
+        """
+        try:
+            extractor.close()
+        except IOError as e:
+            logger.debug('Extraction of the downloaded archive failed: %s', six.text_type(e))
+            complete = False
+        if not complete:
+            shutil.rmtree(extractor.path, ignore_errors=True)
+        return complete
 
     def _guess_category(self):
         def _decode(s):
@@ -191,40 +241,100 @@ class SpecFile(object):
 
         :return:
         """
-        def replace_macro(macro, value):
-            m = '%{{{}}}'.format(macro)
-            while MacroHelper.expand(m, m) != m:
-                rpm.delMacro(macro)
-            rpm.addMacro(macro, value)
-        # ensure that %{_sourcedir} macro is set to proper location
-        replace_macro('_sourcedir', self.sources_location)
-        # explicitly discard old instance to prevent rpm from destroying
-        # "sources" and "patches" lua tables after new instance is created
-        self.spc = None
-        # load rpm information
+        # the SPEC file is parsed in the rpm macro context shared by all threads
+        with rpm_lock:
+            if self._save_pending:
+                # parse the current content, not the one written to the disc last time
+                self._save_pending = False
+                self._write_spec_file_to_disc()
+            def replace_macro(macro, value):
+                m = '%{{{}}}'.format(macro)
+                if MacroHelper.expand(m, m) == value:
+                    return
+                while MacroHelper.expand(m, m) != m:
+                    MacroHelper.undefine(macro)
+                MacroHelper.define(macro, value)
+            # ensure that %{_sourcedir} macro is set to proper location
+            replace_macro('_sourcedir', self.sources_location)
+            # explicitly discard old instance to prevent rpm from destroying
+            # "sources" and "patches" lua tables after new instance is created
+            self.spc = None
+            # load rpm information
+            self.spc, self.macros = self._parse_spec()
+            self.category = self._guess_category()
+            self.sources = self._get_spec_sources_list(self.spc)
+            self.prep_section = self.spc.prep
+            self._prep_index = None
+            # HEADER of SPEC file
+            self.hdr = self.spc.sourceHeader
+            self.rpm_sections = self._split_sections()
+            # determine the extra_version
+            logger.debug("Updating the extra version")
+            _, self.extra_version, separator = SpecFile.extract_version_from_archive_name(
+                self.get_archive(),
+                self._get_raw_source_string(0))
+            self.set_extra_version_separator(separator)
+
+            self.patches = self._get_initial_patches_list()
+
+    @staticmethod
+    def _get_macro_state(names):
+        return [(n, MacroHelper.expand('%{{{}}}'.format(n))) for n in names]
+
+    @staticmethod
+    def _get_files_state(paths):
+        state = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                state.append((path, None, None))
+            else:
+                state.append((path, st.st_size, st.st_mtime))
+        return state
+
+    def _parse_spec(self):
+        """
+        Parses the SPEC file, reusing the result of a previous parse if possible.
+
+        Parsing is skipped if the same content was already parsed with the same %{_sourcedir},
+        all macros defined in the SPEC file still have the values the parse left behind
+        and none of the sources and patches appeared, disappeared or changed since, so the rpm
+        macro context and expanded %prep section are the same as if the SPEC file was parsed again.
+
+        :return: tuple (rpm.spec instance, MacroTable instance)
+        """
         try:
-            self.spc = RpmHelper.parse_spec(self.path, flags=rpm.RPMSPEC_ANYARCH)
+            with open(self.path, 'rb') as f:
+                content = f.read()
+        except IOError:
+            raise RebaseHelperError("Unable to open and read SPEC file '%s'" % self.path)
+        key = hashlib.sha256(content + b'\0' + self.sources_location.encode('utf-8')).hexdigest()
+        entry = self._parse_cache.pop(key, None)
+        if (entry and self._get_macro_state(n for n, _ in entry['state']) == entry['state'] and
+                self._get_files_state(p for p, _, _ in entry['files']) == entry['files']):
+            logger.debug("Reusing parsed SPEC file '%s'", self.path)
+            self._parse_cache[key] = entry
+            return entry['spc'], entry['macros']
+        # evict before parsing, destroying an old instance would destroy lua tables of the new one
+        while len(self._parse_cache) >= self.PARSE_CACHE_SIZE:
+            self._parse_cache.popitem(last=False)
+        try:
+            spc = RpmHelper.parse_spec(self.path, flags=rpm.RPMSPEC_ANYARCH)
         except ValueError:
             try:
                 # try again with RPMSPEC_FORCE flag (the default)
-                self.spc = RpmHelper.parse_spec(self.path)
+                spc = RpmHelper.parse_spec(self.path)
             except ValueError:
                 raise RebaseHelperError("Problem with parsing SPEC file '%s'" % self.path)
-        self.category = self._guess_category()
-        self.sources = self._get_spec_sources_list(self.spc)
-        self.prep_section = self.spc.prep
-        # HEADER of SPEC file
-        self.hdr = self.spc.sourceHeader
-        self.rpm_sections = self._split_sections()
-        # determine the extra_version
-        logger.debug("Updating the extra version")
-        _, self.extra_version, separator = SpecFile.extract_version_from_archive_name(
-            self.get_archive(),
-            self._get_raw_source_string(0))
-        self.set_extra_version_separator(separator)
-
-        self.patches = self._get_initial_patches_list()
-        self.macros = MacroHelper.dump()
+        macros = MacroHelper.get_table()
+        # macros defined in the SPEC file, including %{name} and %{version}
+        names = set(m['name'] for m in macros.filter(min_level=-3))
+        # expansion of %prep depends on presence of the files, e.g. %{uncompress:...}
+        files = [os.path.join(self.sources_location, os.path.basename(s[0])) for s in spc.sources]
+        self._parse_cache[key] = dict(spc=spc, macros=macros, state=self._get_macro_state(sorted(names)),
+                                      files=self._get_files_state(files))
+        return spc, macros
 
     ###########################
     # SOURCES RELATED METHODS #
@@ -275,9 +385,10 @@ class SpecFile(object):
         """
         source_re_str = r'^Source0?\s*:\s*(.*?)$' if source_num == 0 else r'^Source{0}\s*:\s*(.*?)$'.format(source_num)
         source_re = re.compile(source_re_str)
+        tags = ['Source', 'Source0'] if source_num == 0 else ['Source{0}'.format(source_num)]
 
-        for line in self.spec_content:
-            match = source_re.search(line)
+        for index in sorted(i for t in tags for i in self.spec_content.find(SpecContent.TAG, t)):
+            match = source_re.search(self.spec_content[index])
             if match:
                 return match.group(1)
 
@@ -286,9 +397,14 @@ class SpecFile(object):
     ###########################
 
     def _get_initial_patches_list(self):
-        """Method returns a list of patches from a spec file"""
+        """
+        Method returns lists of applied and not applied patches from a spec file
+
+        All patches are also indexed by their number under the 'index' key.
+        """
         patches_applied = []
         patches_not_used = []
+        patches_index = {}
         patches_list = [p for p in self.spc.sources if p[2] == 2]
         strip_options = self._get_patch_strip_options(patches_list)
 
@@ -299,11 +415,14 @@ class SpecFile(object):
                 continue
             patch_num = num
             if patch_num in strip_options:
-                patches_applied.append(PatchObject(patch_path, patch_num, strip_options[patch_num]))
+                patch = PatchObject(patch_path, patch_num, strip_options[patch_num])
+                patches_applied.append(patch)
             else:
-                patches_not_used.append(PatchObject(patch_path, patch_num, None))
+                patch = PatchObject(patch_path, patch_num, None)
+                patches_not_used.append(patch)
+            patches_index[int(patch_num)] = patch
         patches_applied = sorted(patches_applied, key=lambda x: x.get_index())
-        return {"applied": patches_applied, "not_applied": patches_not_used}
+        return {"applied": patches_applied, "not_applied": patches_not_used, "index": patches_index}
 
     def _get_patch_strip_options(self, patches):
         """
@@ -312,22 +431,12 @@ class SpecFile(object):
         This should work reliably in most cases except when a list of patches
         is read from a file (netcf, libvirt).
         """
-        parser = SilentArgumentParser()
-        parser.add_argument('-p', type=int, default=0)
+        prep_index = self.get_prep_index()
         result = {}
-        for line in self.get_prep_section():
-            tokens = shlex.split(line, comments=True)
-            if not tokens:
-                continue
-            args = tokens[1:]
-            try:
-                ns, rest = parser.parse_known_args(args)
-            except ParseError:
-                continue
-            rest = [os.path.basename(a) for a in rest]
-            indexes = [p[1] for p in patches if p[0] in rest]
-            for idx in indexes:
-                result[idx] = ns.p
+        for filename, num, _ in patches:
+            strip = prep_index.get_strip_option(filename)
+            if strip is not None:
+                result[num] = strip
         return result
 
     def _get_patch_number(self, fields):
@@ -377,38 +486,34 @@ class SpecFile(object):
         if remove_patches is None:
             remove_patches = []
 
-        for index, line in enumerate(self.spec_content):
-            #  if patch is applied on the line, try to check if it should be commented out
-            if line.startswith('%patch'):
-                #  check patch numbers
-                for num in comment_out:
-                    #  if the line should be commented out
-                    if line.startswith('%patch{0}'.format(num)):
-                        comment = '# Following patch contains conflicts\n'
-                        if disable_inapplicable_patches:
-                            self.spec_content[index] = '{}#%{}'.format(comment, line)
-                        else:
-                            self.spec_content[index] = '{}{}'.format(comment, line)
-                        #  remove the patch number from list
-                        comment_out.remove(num)
-                        break
-                for num in remove_patches:
-                    #  if the line should be removed
-                    if line.startswith('%patch{0}'.format(num)):
-                        self.spec_content[index] = ''
-                        #  remove the patch number from list
-                        remove_patches.remove(num)
-                        break
+        #  find lines applying the patches first, modifications don't affect the original lines
+        comment_out = [self.spec_content.find_first(SpecContent.PATCH, str(num)) for num in comment_out]
+        remove_patches = [self.spec_content.find_first(SpecContent.PATCH, str(num)) for num in remove_patches]
+        for index in comment_out:
+            if index is None:
+                continue
+            line = self.spec_content[index]
+            comment = '# Following patch contains conflicts\n'
+            if disable_inapplicable_patches:
+                self.spec_content[index] = '{}#%{}'.format(comment, line)
+            else:
+                self.spec_content[index] = '{}{}'.format(comment, line)
+        for index in remove_patches:
+            if index is not None:
+                self.spec_content[index] = ''
 
     def update_paths_to_patches(self):
         # Fix paths in rebase_spec_file to patches to current directory
         rebased_sources_path = os.path.join(constants.RESULTS_DIR, constants.REBASED_SOURCES_DIR)
-        for index, line in enumerate(self.spec_content):
-            if line.startswith('Patch'):
-                mod_line = re.sub(rebased_sources_path + os.path.sep, '', line)
-                self.spec_content[index] = mod_line
+        for index in self._get_patch_tags():
+            mod_line = re.sub(rebased_sources_path + os.path.sep, '', self.spec_content[index])
+            self.spec_content[index] = mod_line
         self.save()
 
+    def _get_patch_tags(self):
+        """Returns sorted list of indexes of lines with Patch tags."""
+        return [i for i in self.spec_content.find(SpecContent.TAG) if self.spec_content[i].startswith('Patch')]
+
     def write_updated_patches(self, patches, disable_inapplicable):
         """Function writes the patches to -rebase.spec file"""
         if not patches:
@@ -417,47 +522,39 @@ class SpecFile(object):
         removed_patches = []
         inapplicable_patches = []
         modified_patches = []
-
-        for index, line in enumerate(self.spec_content):
-            if line.startswith('Patch'):
-                fields = line.strip().split()
-                patch_name = fields[1]
-                patch_num = self._get_patch_number(fields)
-                # We check if patch is mentioned in SPEC file but not used.
-                # We comment out the patch
-                check_not_applied = [x for x in self.get_not_used_patches() if
-                                     int(x.get_index()) == int(patch_num)]
-
-                if 'deleted' in patches:
-                    patch_removed = [x for x in patches['deleted'] if patch_name in x]
-                else:
-                    patch_removed = None
-                if 'inapplicable' in patches:
-                    patch_inapplicable = [x for x in patches['inapplicable'] if patch_name in x]
-                else:
-                    patch_inapplicable = None
-
-                if patch_removed or check_not_applied:
-                    # remove the line of the patch that was removed
-                    self.removed_patches.append(patch_name)
-                    removed_patches.append(patch_num)
-                    self.spec_content[index] = ''
-
-                if patch_inapplicable:
-                    if disable_inapplicable:
-                        # comment out line if the patch was not applied
-                        self.spec_content[index] = '#{0} {1}\n'.format(' '.join(fields[:-1]),
-                                                                       os.path.basename(patch_name))
-                    inapplicable_patches.append(patch_num)
-
-                if 'modified' in patches:
-                    patch = [x for x in patches['modified'] if patch_name in x]
-                else:
-                    patch = None
-                if patch:
-                    fields[1] = os.path.join(constants.RESULTS_DIR, constants.REBASED_SOURCES_DIR, patch_name)
-                    self.spec_content[index] = ' '.join(fields) + '\n'
-                    modified_patches.append(patch_num)
+        # results of patching are lists of names of patch files
+        deleted = set(patches.get('deleted', []))
+        inapplicable = set(patches.get('inapplicable', []))
+        modified = set(patches.get('modified', []))
+
+        for index in self._get_patch_tags():
+            line = self.spec_content[index]
+            fields = line.strip().split()
+            patch_name = fields[1]
+            patch_num = self._get_patch_number(fields)
+            # We check if patch is mentioned in SPEC file but not used.
+            # We comment out the patch
+            patch = self.patches['index'].get(int(patch_num or 0))
+            check_not_applied = patch is not None and patch.get_strip() is None
+            name = os.path.basename(patch_name)
+
+            if name in deleted or check_not_applied:
+                # remove the line of the patch that was removed
+                self.removed_patches.append(patch_name)
+                removed_patches.append(patch_num)
+                self.spec_content[index] = ''
+
+            if name in inapplicable:
+                if disable_inapplicable:
+                    # comment out line if the patch was not applied
+                    self.spec_content[index] = '#{0} {1}\n'.format(' '.join(fields[:-1]),
+                                                                   name)
+                inapplicable_patches.append(patch_num)
+
+            if name in modified:
+                fields[1] = os.path.join(constants.RESULTS_DIR, constants.REBASED_SOURCES_DIR, patch_name)
+                self.spec_content[index] = ' '.join(fields) + '\n'
+                modified_patches.append(patch_num)
 
         self._process_patches(inapplicable_patches, removed_patches, disable_inapplicable)
 
@@ -602,64 +699,68 @@ class SpecFile(object):
 
         logger.debug("Updating extra version in SPEC to '%s'", extra_version)
 
-        #  try to find existing extra version definition
-        for index, line in enumerate(self.spec_content):
-            match = extra_version_re.search(line)
-            if match:
-                extra_version_line_index = index
-                break
+        with self.edit():
+            #  try to find existing extra version definition
+            for index, line in enumerate(self.spec_content):
+                match = extra_version_re.search(line)
+                if match:
+                    extra_version_line_index = index
+                    break
 
-        if extra_version:
-            #  just update the existing extra version
-            if extra_version_line_index is not None:
-                self.spec_content[extra_version_line_index] = new_extra_version_line
-            # we need to create the extra version definition
+            if extra_version:
+                #  just update the existing extra version
+                if extra_version_line_index is not None:
+                    self.spec_content[extra_version_line_index] = new_extra_version_line
+                # we need to create the extra version definition
+                else:
+                    # insert the REBASE_VER and REBASE_EXTRA_VER definitions
+                    logger.debug("Adding new line to spec: %s", rebase_extra_version_def.strip())
+                    self.spec_content.insert(0, rebase_extra_version_def)
+                    logger.debug("Adding new line to spec: %s", new_extra_version_line.strip())
+                    self.spec_content.insert(0, new_extra_version_line)
+
+                    # change Release to 0.1 and append the extra version macro
+                    self.set_release_number('0.1')
+                    self.redefine_release_with_macro(extra_version_macro)
+                    # the archive name has to be expanded with the extra version
+                    self.flush()
+
+                    # change the Source0 definition
+                    source0_re = re.compile(r'^Source0?\s*:.+')
+                    for index, line in enumerate(self.spec_content):
+                        if source0_re.search(line):
+                            # comment out the original Source0 line
+                            logger.debug("Commenting out original Source0 line '%s'", line.strip())
+                            self.spec_content[index] = '#{0}'.format(line)
+                            # construct new Source0 line. The idea is that we use the expanded archive name
+                            # to create new Source0. We used raw original Source0 before, but it didn't work
+                            # reliably.
+                            source0_raw = line
+                            basename_expanded = self.get_archive()
+                            # construct the original version in archive name so that we can replace it
+                            original_version = '{0}{2}{1}'.format(*self.extract_version_from_archive_name(
+                                basename_expanded,
+                                source0_raw)
+                                                                  )
+                            # replace the version with macro
+                            new_basename_with_macro = basename_expanded.replace(original_version, '%{REBASE_VER}')
+                            # replace the name with macro to be cool :)
+                            new_basename_with_macro = new_basename_with_macro.replace(self.get_package_name(),
+                                                                                      '%{name}')
+                            # replace the archive name in old Source0 with new one
+                            new_source0_line = source0_raw.replace(os.path.basename(source0_raw),
+                                                                   new_basename_with_macro)
+                            logger.debug("Inserting new Source0 line '%s'", new_source0_line)
+                            self.spec_content.insert(index + 1, new_source0_line + '\n')
+                            break
             else:
-                # insert the REBASE_VER and REBASE_EXTRA_VER definitions
-                logger.debug("Adding new line to spec: %s", rebase_extra_version_def.strip())
-                self.spec_content.insert(0, rebase_extra_version_def)
-                logger.debug("Adding new line to spec: %s", new_extra_version_line.strip())
-                self.spec_content.insert(0, new_extra_version_line)
-
-                # change Release to 0.1 and append the extra version macro
-                self.set_release_number('0.1')
-                self.redefine_release_with_macro(extra_version_macro)
-
-                # change the Source0 definition
-                source0_re = re.compile(r'^Source0?\s*:.+')
-                for index, line in enumerate(self.spec_content):
-                    if source0_re.search(line):
-                        # comment out the original Source0 line
-                        logger.debug("Commenting out original Source0 line '%s'", line.strip())
-                        self.spec_content[index] = '#{0}'.format(line)
-                        # construct new Source0 line. The idea is that we use the expanded archive name to create
-                        # new Source0. We used raw original Source0 before, but it didn't work reliably.
-                        source0_raw = line
-                        basename_expanded = self.get_archive()
-                        # construct the original version in archive name so that we can replace it
-                        original_version = '{0}{2}{1}'.format(*self.extract_version_from_archive_name(
-                            basename_expanded,
-                            source0_raw)
-                                                              )
-                        # replace the version with macro
-                        new_basename_with_macro = basename_expanded.replace(original_version, '%{REBASE_VER}')
-                        # replace the name with macro to be cool :)
-                        new_basename_with_macro = new_basename_with_macro.replace(self.get_package_name(),
-                                                                                  '%{name}')
-                        # replace the archive name in old Source0 with new one
-                        new_source0_line = source0_raw.replace(os.path.basename(source0_raw),
-                                                               new_basename_with_macro)
-                        logger.debug("Inserting new Source0 line '%s'", new_source0_line)
-                        self.spec_content.insert(index + 1, new_source0_line + '\n')
-                        break
-        else:
-            # set the Release to 1 and revert the redefined Release with macro if needed
-            self.set_release_number('1')
-            self.revert_redefine_release_with_macro(extra_version_macro)
-            # TODO: handle empty extra_version as removal of the definitions!
+                # set the Release to 1 and revert the redefined Release with macro if needed
+                self.set_release_number('1')
+                self.revert_redefine_release_with_macro(extra_version_macro)
+                # TODO: handle empty extra_version as removal of the definitions!
 
-        # save changes
-        self.save()
+            # save changes
+            self.save()
 
     def set_extra_version_separator(self, separator):
         """
@@ -692,141 +793,50 @@ class SpecFile(object):
 
     def set_tag(self, tag, value, preserve_macros=False):
         """Sets value of a tag while trying to preserve macros if requested"""
-        macro_def_re = re.compile(
-            r'''
-            ^
-            (?P<cond>%{!?\?\w+:\s*)?
-            (?(cond)%global|%(global|define))
-            \s+
-            (?P<name>\w+)
-            (?P<options>\(.+?\))?
-            \s+
-            (?P<value>.+)
-            (?(cond)})
-            $
-            ''',
-            re.VERBOSE)
+        macro_def_re = SpecContent.MACRO_DEFINITION_RE
+        definitions = self.spec_content.macro_definitions
 
         def _get_macro_value(macro):
             """Returns raw value of a macro"""
-            for line in self.spec_content:
-                match = macro_def_re.match(line)
-                if not match:
-                    continue
-                if match.group('name') == macro:
-                    return match.group('value')
-            return None
+            return self.spec_content.get_macro_value(macro)
 
         def _redefine_macro(macro, value):
             """Replaces value of an existing macro"""
-            for index, line in enumerate(self.spec_content):
+            index = self.spec_content.find_first(SpecContent.MACRO_DEFINITION, macro)
+            if index is not None:
+                line = self.spec_content[index]
                 match = macro_def_re.match(line)
-                if not match:
-                    continue
-                if match.group('name') != macro:
-                    continue
                 line = line[:match.start('value')] + value + line[match.end('value'):]
                 if match.group('options'):
                     line = line[:match.start('options')] + line[match.end('options'):]
                 self.spec_content[index] = line
-                break
             self.save()
 
         def _find_macros(s):
             """Returns all redefinable macros present in a string"""
-            macro_re = re.compile(r'%(?P<brace>{\??)?(?P<name>\w+)(?(brace)})')
-            macros = []
-            for line in self.spec_content:
-                match = macro_def_re.match(line)
-                if not match:
-                    continue
-                macros.append(match.group('name'))
-            result = []
-            for match in macro_re.finditer(s):
-                if not match:
-                    continue
-                if match.group('name') not in macros:
-                    continue
-                result.append((match.group('name'), match.span()))
-            return result
+            return MacroParser.find_macros(s, definitions)
 
         def _expand_macros(s):
             """Expands all redefinable macros containing redefinable macros"""
-            replace = []
-            for macro, span in _find_macros(s):
-                value = _get_macro_value(macro)
-                if not value:
-                    continue
-                rep = _expand_macros(value)
-                if _find_macros(rep):
-                    replace.append((rep, span))
-            for rep, span in reversed(replace):
-                s = s[:span[0]] + rep + s[span[1]:]
-            return s
+            return MacroParser.expand_definitions(s, definitions)
 
         def _tokenize(s):
             """Removes conditional macros and splits string on macro boundaries"""
-            def parse(inp):
-                tree = []
-                text = ''
-                macro = ''
-                buf = ''
-                while inp:
-                    c = inp.pop(0)
-                    if c == '%':
-                        c = inp.pop(0)
-                        if c == '%':
-                            text += c
-                        elif c == '{':
-                            if text:
-                                tree.append(('t', text))
-                                text = ''
-                            while inp and c not in ':}':
-                                c = inp.pop(0)
-                                buf += c
-                            if c == ':':
-                                tree.append(('c', buf[:-1], parse(inp)))
-                                buf = ''
-                            elif c == '}':
-                                tree.append(('m', buf[:-1]))
-                                buf = ''
-                        else:
-                            if text:
-                                tree.append(('t', text))
-                                text = ''
-                            while inp and (c.isalnum() or c == '_'):
-                                c = inp.pop(0)
-                                macro += c
-                            tree.append(('m', macro))
-                            macro = ''
-                    elif c == '}':
-                        if text:
-                            tree.append(('t', text))
-                        inp.append(c)
-                        return tree
-                    else:
-                        text += c
-                if text:
-                    tree.append(('t', text))
-                return tree
-
             def traverse(tree):
                 result = []
                 for node in tree:
-                    if node[0] == 't':
+                    if node[0] == MacroParser.TEXT:
                         result.append(node[1])
-                    elif node[0] == 'm':
+                    elif node[0] == MacroParser.MACRO:
                         m = '%{{{}}}'.format(node[1])
                         if MacroHelper.expand(m):
                             result.append(m)
-                    elif node[0] == 'c':
+                    elif node[0] == MacroParser.CONDITIONAL:
                         if MacroHelper.expand('%{{{}:1}}'.format(node[1])):
                             result.extend(traverse(node[2]))
                 return result
 
-            inp = list(s)
-            tree = parse(inp)
-            return traverse(tree)
+            return traverse(MacroParser.parse(s))
 
         def _sync_macros(s):
             """Makes all macros present in a string up-to-date in rpm context"""
@@ -835,10 +845,10 @@ class SpecFile(object):
             for macro in macros:
                 m = '%{{{}}}'.format(macro)
                 while MacroHelper.expand(m, m) != m:
-                    rpm.delMacro(macro)
+                    MacroHelper.undefine(macro)
                 value = _get_macro_value(macro)
                 if value and MacroHelper.expand(value):
-                    rpm.addMacro(macro, value)
+                    MacroHelper.define(macro, value)
 
         def _process_value(curval, newval):
             """
@@ -923,18 +933,16 @@ class SpecFile(object):
                 return curval
             return result
 
-        tag_re = re.compile(r'^(?P<name>\w+)\s*:\s*(?P<value>.+)$')
-        for index, line in enumerate(self.spec_content):
-            match = tag_re.match(line)
-            if not match:
-                continue
-            if match.group('name') != tag:
-                continue
-            if preserve_macros:
-                value = _process_value(match.group('value'), value)
-            self.spec_content[index] = line[:match.start('value')] + value + line[match.end('value'):]
-            break
-        self.save()
+        # macros are kept up-to-date by _sync_macros(), redefining them doesn't need parsing
+        with self.edit():
+            index = self.spec_content.find_first(SpecContent.TAG, tag)
+            if index is not None:
+                match = SpecContent.TAG_RE.match(self.spec_content[index])
+                if preserve_macros:
+                    value = _process_value(match.group('value'), value)
+                line = self.spec_content[index]
+                self.spec_content[index] = line[:match.start('value')] + value + line[match.end('value'):]
+            self.save()
 
     def set_version(self, version):
         """
@@ -1057,33 +1065,7 @@ class SpecFile(object):
         """
         # rpm-python does not provide any directive for getting %files section
         # Therefore we should do that workaround
-        section_headers_re = [re.compile('^{0}.*'.format(x), re.IGNORECASE) for x in self.defined_sections]
-
-        section_starts = []
-        # First of all we need to find beginning of all sections
-        for line_num, line in enumerate(self.spec_content):
-            # it might be a section
-            if line.startswith('%'):
-                # check all possible section headers
-                for section_header in section_headers_re:
-                    if section_header.search(line):
-                        section_starts.append(line_num)
-
-        # determine the SPEC header
-        # it is everything until the beginning the first section
-        header_end = section_starts[0] if section_starts else len(self.spec_content)
-        sections = {0: ('%header', self.spec_content[:header_end])}
-
-        # now determine all previously found sections
-        for i in range(len(section_starts)):
-            # We cut a relevant section to field
-            if i + 1 < len(section_starts):
-                curr_section = self.spec_content[section_starts[i]:section_starts[i+1]]
-            else:
-                curr_section = self.spec_content[section_starts[i]:]
-            sections[i+1] = (curr_section[0].strip(), curr_section[1:])
-
-        return sections
+        return self.spec_content.split_sections()
 
     def get_spec_section(self, section_name):
         """
@@ -1092,9 +1074,10 @@ class SpecFile(object):
         :param section_name: section name to get
         :return: list of lines contained in the selected section
         """
-        for sec_name, section in six.itervalues(self.rpm_sections):
-            if sec_name.lower() == section_name.lower():
-                return section
+        keys = self.rpm_sections.find(section_name)
+        if keys:
+            return self.rpm_sections[keys[0]][1]
+        return None
 
     def set_spec_section(self, section_name, new_section):
         """
@@ -1103,12 +1086,11 @@ class SpecFile(object):
         :param section_name: section name to get
         :return: list of lines contained in the selected section
         """
-        for key, val in six.iteritems(self.rpm_sections):
-            if section_name.lower() in val[0].lower():
-                if isinstance(new_section, str):
-                    self.rpm_sections[key] = (section_name, new_section.split('\n'))
-                else:
-                    self.rpm_sections[key] = (section_name, new_section)
+        for key in self.rpm_sections.find(section_name):
+            if isinstance(new_section, str):
+                self.rpm_sections[key] = (section_name, new_section.split('\n'))
+            else:
+                self.rpm_sections[key] = (section_name, new_section)
 
     def get_prep_section(self):
         """Function returns whole prep section"""
@@ -1122,6 +1104,16 @@ class SpecFile(object):
                 result.append(prep.pop(0))
         return result
 
+    def get_prep_index(self):
+        """
+        Gets index of commands of the expanded %prep section, it is created once per parsed SPEC file.
+
+        :return: PrepIndex instance
+        """
+        if self._prep_index is None:
+            self._prep_index = PrepIndex(self.get_prep_section(), MacroHelper.expand('%{_builddir}', ''))
+        return self._prep_index
+
     #############################################
     # SPEC CONTENT MANIPULATION RELATED METHODS #
     #############################################
@@ -1160,12 +1152,51 @@ class SpecFile(object):
 
     def save(self):
         """Save changes made to the spec_content to the disc and update internal variables"""
-        # TODO: Create a decorator from this method
+        if self._edit_depth:
+            # deferred until the outermost edit() context exits
+            self._save_pending = True
+            return
         #  Write changes to the disc
         self._write_spec_file_to_disc()
         #  Update internal variables
         self._update_data()
 
+    @contextlib.contextmanager
+    def edit(self):
+        """
+        Context manager deferring saving of changes.
+
+        Inside the context save() only marks the SPEC file as modified, changes are written
+        to the disc and parsed once, when the outermost context exits. Until then, data obtained
+        by parsing the SPEC file (sources, patches, header, macros, ...) are not updated,
+        flush() can be used to update them explicitly. Edits can redefine macros, so the rpm macro
+        context is locked inside the context.
+
+        :return: the SpecFile instance
+        """
+        with rpm_lock:
+            self._edit_depth += 1
+            try:
+                yield self
+            except BaseException:
+                exc_info = sys.exc_info()
+                self._edit_depth -= 1
+                if not self._edit_depth:
+                    # don't let a failure to save the changes hide the original exception
+                    try:
+                        self.flush()
+                    except Exception as e:  # pylint: disable=broad-except
+                        logger.error('Failed to save changes to SPEC file: %s', six.text_type(e))
+                six.reraise(*exc_info)
+            self._edit_depth -= 1
+            if not self._edit_depth:
+                self.flush()
+
+    def flush(self):
+        """Saves changes deferred by edit(), if there are any."""
+        if self._save_pending:
+            self._update_data()
+
     ####################
     # UNSORTED METHODS #
     ####################
@@ -1219,27 +1250,9 @@ class SpecFile(object):
         :param files: list of absolute paths
         :return: modified list of paths with RPM macros
         """
-        # TODO: move this to RpmHelper?
-        macro_mapping = {'/usr/lib64': '%{_libdir}',
-                         '/usr/libexec': '%{_libexecdir}',
-                         '/usr/lib/systemd/system': '%{_unitdir}',
-                         '/usr/lib': '%{_libdir}',
-                         '/usr/bin': '%{_bindir}',
-                         '/usr/sbin': '%{_sbindir}',
-                         '/usr/include': '%{_includedir}',
-                         '/usr/share/man': '%{_mandir}',
-                         '/usr/share/info': '%{_infodir}',
-                         '/usr/share/doc': '%{_docdir}',
-                         '/usr/share': '%{_datarootdir}',
-                         '/var/lib': '%{_sharedstatedir}',
-                         '/var/tmp': '%{_tmppath}',
-                         '/var': '%{_localstatedir}',
-                         }
+        resolver = MacroHelper.get_path_resolver()
         for index, filename in enumerate(files):
-            for abs_path, macro in sorted(six.iteritems(macro_mapping), reverse=True):
-                if filename.startswith(abs_path):
-                    files[index] = filename.replace(abs_path, macro)
-                    break
+            files[index] = resolver.resolve(filename)
         return files
 
     @staticmethod
@@ -1259,40 +1272,40 @@ class SpecFile(object):
 
     def _correct_missing_files(self, missing):
         sep = '\n'
-        for key, value in six.iteritems(self.rpm_sections):
-            sec_name, sec_content = value
-            match = re.search(r'^%files\s*$', sec_name)
-            if match:
-                if constants.BEGIN_COMMENT in sec_content:
-                    # We need only files which are not included yet.
-                    upd_files = [f for f in missing if f not in sec_content]
-                    regex = re.compile(r'(' + constants.BEGIN_COMMENT + r'\s*)')
-                    sec_content = regex.sub('\\1' + '\n'.join(upd_files) + sep,
-                                            sec_content)
-                else:
-                    # This code adds begin_comment, files and end_comment
-                    # with separator
-                    sec_content = SpecFile.construct_string_with_comment(missing) + sec_content
-                self.rpm_sections[key] = (sec_name, sec_content)
-                break
+        for key in self.rpm_sections.find('%files'):
+            sec_name, sec_content = self.rpm_sections[key]
+            if constants.BEGIN_COMMENT in sec_content:
+                # We need only files which are not included yet.
+                present = set(sec_content)
+                upd_files = [f for f in missing if f not in present]
+                regex = re.compile(r'(' + constants.BEGIN_COMMENT + r'\s*)')
+                sec_content = regex.sub('\\1' + '\n'.join(upd_files) + sep,
+                                        sec_content)
+            else:
+                # This code adds begin_comment, files and end_comment
+                # with separator
+                sec_content = SpecFile.construct_string_with_comment(missing) + sec_content
+            self.rpm_sections[key] = (sec_name, sec_content)
+            break
 
     def _correct_removed_files(self, sources):
-        for key, value in six.iteritems(self.rpm_sections):
-            sec_name, sec_content = value
-            # Only sections %files are interesting
-            match = re.search(r'^%files', sec_name)
-            if match:
-                # Check what files are in section
-                # and comment only relevant
-                f_exists = [f for f in sources for sec in sec_content if os.path.basename(f) in sec]
-                if not f_exists:
-                    continue
-                for f in f_exists:
-                    for index, row in enumerate(sec_content):
-                        if f in row:
-                            sec_content[index: index+1] = SpecFile.construct_string_with_comment('#' + row)
-                            break
-                self.rpm_sections[key] = (sec_name, sec_content)
+        # Only sections %files are interesting
+        for key in self.rpm_sections.find_type('%files'):
+            sec_name, sec_content = self.rpm_sections[key]
+            # Check what files are in section
+            # and comment only relevant
+            files_index = FilesIndex(sec_content)
+            rows = set()
+            for f in sources:
+                indexes = files_index.find(f)
+                if indexes:
+                    rows.add(indexes[0])
+            if not rows:
+                continue
+            # replace rows from the end, so that indexes of the remaining ones don't change
+            for index in sorted(rows, reverse=True):
+                sec_content[index:index + 1] = SpecFile.construct_string_with_comment('#' + sec_content[index])
+            self.rpm_sections[key] = (sec_name, sec_content)
 
     def modify_spec_files_section(self, files):
         """
@@ -1376,19 +1389,18 @@ class SpecFile(object):
         """
         parser = self._get_setup_parser()
 
-        for line in self.spec_content:
-            if line.startswith('%setup') or line.startswith('%autosetup'):
-                line = MacroHelper.expand(line, '')
+        for index in self.spec_content.find(SpecContent.SETUP):
+            line = MacroHelper.expand(self.spec_content[index], '')
 
-                # parse macro arguments
-                try:
-                    ns, _ = parser.parse_known_args(shlex.split(line)[1:])
-                except ParseError:
-                    continue
+            # parse macro arguments
+            try:
+                ns, _ = parser.parse_known_args(shlex.split(line)[1:])
+            except ParseError:
+                continue
 
-                # check if this macro instance is extracting Source0
-                if not ns.T or ns.a == 0 or ns.b == 0:
-                    return ns.n
+            # check if this macro instance is extracting Source0
+            if not ns.T or ns.a == 0 or ns.b == 0:
+                return ns.n
 
         return None
 
@@ -1400,9 +1412,10 @@ class SpecFile(object):
         """
         parser = self._get_setup_parser()
 
-        for index, line in enumerate(self.spec_content):
-            if line.startswith('%setup') or line.startswith('%autosetup'):
-                line = MacroHelper.expand(line, '')
+        with self.edit():
+            # go backwards, so that inserted lines don't shift lines yet to be processed
+            for index in reversed(self.spec_content.find(SpecContent.SETUP)):
+                line = MacroHelper.expand(self.spec_content[index], '')
 
                 args = shlex.split(line)
                 macro = args[0]
@@ -1470,44 +1483,7 @@ class SpecFile(object):
         :param archive: Path to archive
         :return: Target path relative to builddir or None if not determined
         """
-        cd_parser = SilentArgumentParser()
-        cd_parser.add_argument('dir', default=os.environ.get('HOME', ''))
-        tar_parser = argparse.ArgumentParser()
-        tar_parser.add_argument('-C', default='.', dest='target')
-        unzip_parser = argparse.ArgumentParser()
-        unzip_parser.add_argument('-d', default='.', dest='target')
-        archive = os.path.basename(archive)
-        builddir = MacroHelper.expand('%{_builddir}', '')
-        basedir = builddir
-        for line in self.get_prep_section():
-            tokens = shlex.split(line, comments=True)
-            if not tokens:
-                continue
-            # split tokens by pipe
-            for tokens in [list(group) for k, group in itertools.groupby(tokens, lambda t: t == '|') if not k]:
-                cmd, args = os.path.basename(tokens[0]), tokens[1:]
-                if cmd == 'cd':
-                    # keep track of current directory
-                    try:
-                        ns, _ = cd_parser.parse_known_args(args)
-                    except ParseError:
-                        pass
-                    else:
-                        basedir = ns.dir if os.path.isabs(ns.dir) else os.path.join(basedir, ns.dir)
-                if archive in line:
-                    if cmd == 'tar':
-                        parser = tar_parser
-                    elif cmd == 'unzip':
-                        parser = unzip_parser
-                    else:
-                        continue
-                    try:
-                        ns, _ = parser.parse_known_args(args)
-                    except ParseError:
-                        continue
-                    basedir = os.path.relpath(basedir, builddir)
-                    return os.path.normpath(os.path.join(basedir, ns.target))
-        return None
+        return self.get_prep_index().get_archive_target(archive)
 
 
 class BaseSpecHook(object):
@@ -1528,6 +1504,9 @@ class BaseSpecHook(object):
         """
         Runs a spec hook.
 
+        Spec hooks are run inside rebase_spec_file.edit(), data obtained by parsing the rebased
+        SPEC file reflect changes made by previous spec hooks only after rebase_spec_file.flush().
+
         :param spec_file: Original spec file object
         :param rebase_spec_file: Rebased spec file object
         :param kwargs: Keyword arguments from Application instance
@@ -1571,13 +1550,15 @@ class SpecHooksRunner(object):
         """
         blacklist = kwargs.get("spec_hook_blacklist", [])
 
-        for name, spec_hook in six.iteritems(self.spec_hooks):
-            if spec_hook.__name__ in blacklist:
-                continue
-            categories = spec_hook.get_categories()
-            if not categories or spec_file.category in categories:
-                logger.info("Running '%s' spec hook", name)
-                spec_hook.run(spec_file, rebase_spec_file, **kwargs)
+        # changes made by all spec hooks are saved at once
+        with rebase_spec_file.edit():
+            for name, spec_hook in six.iteritems(self.spec_hooks):
+                if spec_hook.__name__ in blacklist:
+                    continue
+                categories = spec_hook.get_categories()
+                if not categories or spec_file.category in categories:
+                    logger.info("Running '%s' spec hook", name)
+                    spec_hook.run(spec_file, rebase_spec_file, **kwargs)
 
 
 # Global instance of SpecHooksRunner. It is enough to load it once per application run.
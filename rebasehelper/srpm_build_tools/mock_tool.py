@@ -43,7 +43,7 @@ class MockSRPMBuildTool(SRPMBuildToolBase):
         return cls.DEFAULT
 
     @classmethod
-    def _build_srpm(cls, spec, workdir, results_dir, srpm_results_dir, srpm_builder_options):
+    def _build_srpm(cls, spec, workdir, results_dir, srpm_results_dir, srpm_builder_options, uniqueext=None):
         """
         Build SRPM using mock.
 
@@ -53,6 +53,7 @@ class MockSRPMBuildTool(SRPMBuildToolBase):
         :param results_dir: abs path to dir where the log should be placed.
         :param srpm_results_dir: path to directory where SRPM will be placed.
         :param srpm_builder_options: list of additional options for mock build tool(eg. '-r fedora-XX-x86_64').
+        :param uniqueext: unique extension of the buildroot, allows running more builds at once.
         :return:  abs path to built SRPM.
         """
         logger.info("Building SRPM")
@@ -62,6 +63,8 @@ class MockSRPMBuildTool(SRPMBuildToolBase):
         path_to_sources = os.path.join(workdir, 'SOURCES')
 
         cmd = ['mock', '--old-chroot', '--buildsrpm']
+        if uniqueext is not None:
+            cmd.extend(['--uniqueext', uniqueext])
         if srpm_builder_options is not None:
             cmd.extend(srpm_builder_options)
         cmd.extend(['--spec', spec])
@@ -112,7 +115,8 @@ class MockSRPMBuildTool(SRPMBuildToolBase):
                 MockTemporaryEnvironment.TEMPDIR_RESULTS)
 
             srpm = cls._build_srpm(tmp_spec, tmp_dir, tmp_results_dir, srpm_results_dir,
-                                   srpm_builder_options=srpm_builder_options)
+                                   srpm_builder_options=srpm_builder_options,
+                                   uniqueext=kwargs.get('uniqueext'))
 
         logger.info("Building SRPM finished successfully")
 
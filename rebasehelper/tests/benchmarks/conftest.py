@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import datetime
+import io
+import json
+import os
+import platform
+import tarfile
+import timeit
+
+import pytest
+
+from rebasehelper.version import VERSION
+
+
+class BenchmarkRecorder(object):
+
+    """Class measuring benchmarks and collecting their results."""
+
+    def __init__(self):
+        self.results = []
+
+    def measure(self, name, function, setup=None, rounds=3):
+        """
+        Measures duration of a function.
+
+        :param name: name of the benchmark
+        :param function: function to measure
+        :param setup: function preparing arguments of a round, its duration is not measured
+        :param rounds: number of times the function is run
+        :return: result of the last round
+        """
+        durations = []
+        result = None
+        for _ in range(rounds):
+            args = setup() if setup else ()
+            start = timeit.default_timer()
+            result = function(*args)
+            durations.append(timeit.default_timer() - start)
+        durations.sort()
+        self.results.append(dict(
+            name=name,
+            rounds=rounds,
+            min=durations[0],
+            max=durations[-1],
+            mean=sum(durations) / rounds,
+            median=durations[rounds // 2],
+        ))
+        return result
+
+    def write(self, path, scale):
+        with open(path, 'w') as f:
+            json.dump(dict(
+                version=VERSION,
+                python=platform.python_version(),
+                timestamp=datetime.datetime.utcnow().isoformat(),
+                scale=scale,
+                benchmarks=sorted(self.results, key=lambda r: r['name']),
+            ), f, indent=4, sort_keys=True)
+
+
+@pytest.yield_fixture(scope='session')
+def benchmark_recorder(request):
+    recorder = BenchmarkRecorder()
+    yield recorder
+    if recorder.results:
+        recorder.write(request.config.getoption('benchmark_json'), request.config.getoption('benchmark_scale'))
+
+
+@pytest.fixture
+def benchmark(request, benchmark_recorder):
+    """Measures a function under the name of the current benchmark."""
+    def measure(function, setup=None, rounds=3):
+        return benchmark_recorder.measure(request.node.name, function, setup, rounds)
+    return measure
+
+
+@pytest.fixture(scope='session')
+def scale(request):
+    return request.config.getoption('benchmark_scale')
+
+
+def scaled(count, factor):
+    return max(1, int(count * factor))
+
+
+@pytest.fixture(scope='session')
+def large_spec(tmpdir_factory, scale):
+    """SPEC file with 2,000 patches and 50,000 lines of changelog, returns its directory."""
+    path = tmpdir_factory.mktemp('large_spec').strpath
+    patches = scaled(2000, scale)
+    changelog_entries = scaled(50000, scale) // 3
+    lines = [
+        'Name: large\n',
+        'Version: 1.0\n',
+        'Release: 1%{?dist}\n',
+        'Summary: Package with a lot of patches\n',
+        'License: GPLv2+\n',
+        'URL: https://example.com/large\n',
+        'Source0: https://example.com/large/%{name}-%{version}.tar.gz\n',
+    ]
+    for i in range(patches):
+        lines.append('Patch{0}: large-{0}.patch\n'.format(i))
+        with open(os.path.join(path, 'large-{}.patch'.format(i)), 'w') as f:
+            f.write('--- a/file{0}.txt\n+++ b/file{0}.txt\n@@ -1 +1 @@\n-old\n+new\n'.format(i))
+    lines.extend(['\n', '%description\n', 'Package with a lot of patches.\n', '\n', '%prep\n', '%setup -q\n'])
+    lines.extend('%patch{0} -p1\n'.format(i) for i in range(patches))
+    lines.extend(['\n', '%build\n', '%configure\n', 'make %{?_smp_mflags}\n', '\n',
+                  '%install\n', '%make_install\n', '\n',
+                  '%files\n', '%license COPYING\n', '%{_bindir}/large\n', '\n', '%changelog\n'])
+    for i in range(changelog_entries):
+        lines.append('* Mon Jan 01 2018 Packager <packager@example.com> - 1.0-{}\n'.format(changelog_entries - i))
+        lines.append('- Change number {}\n'.format(i))
+        lines.append('\n')
+    with open(os.path.join(path, 'large.spec'), 'w') as f:
+        f.writelines(lines)
+    with tarfile.open(os.path.join(path, 'large-1.0.tar.gz'), 'w:gz') as tar:
+        data = b'large\n'
+        info = tarfile.TarInfo('large-1.0/COPYING')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+@pytest.fixture(scope='session')
+def large_archive(tmpdir_factory, scale):
+    """Tarball with 100,000 small files, returns its path."""
+    path = os.path.join(tmpdir_factory.mktemp('large_archive').strpath, 'large-1.0.tar.gz')
+    with tarfile.open(path, 'w:gz') as tar:
+        for i in range(scaled(100000, scale)):
+            data = 'file {}\n'.format(i).encode('ascii')
+            info = tarfile.TarInfo('large-1.0/dir{}/file{}.txt'.format(i // 1000, i))
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import os
+import shutil
+import tempfile
+
+import pytest
+import six
+
+from rebasehelper.archive import Archive
+from rebasehelper.checker import checkers_runner
+from rebasehelper.patch_helper import GitPatchTool
+from rebasehelper.specfile import SpecFile, PatchObject
+
+from ..conftest import TEST_FILES_DIR
+from .conftest import scaled
+
+
+class TestSpecFileBenchmarks(object):
+    TEST_FILES = [
+        'test.spec',
+        'test-1.0.2.tar.xz',
+        'test-source.sh',
+        'source-tests.sh',
+        'file.txt.bz2',
+        'documentation.tar.xz',
+        'misc.zip',
+        'positional-1.1.0.tar.gz',
+        'test-testing.patch',
+        'test-testing2.patch',
+        'test-testing3.patch',
+        'test-testing4.patch',
+    ]
+
+    @staticmethod
+    def _copy_large_spec(large_spec, workdir):
+        path = os.path.join(workdir, 'large.spec')
+        shutil.copy(os.path.join(large_spec, 'large.spec'), path)
+        return path
+
+    @staticmethod
+    def _clear_parse_cache():
+        # measure actual parsing, not the parse cache
+        SpecFile._parse_cache.clear()  # pylint: disable=protected-access
+        return ()
+
+    def test_init(self, benchmark, workdir):
+        benchmark(lambda: SpecFile('test.spec', '', workdir, download=False), self._clear_parse_cache, rounds=10)
+
+    def test_init_large(self, benchmark, workdir, large_spec):
+        path = self._copy_large_spec(large_spec, workdir)
+        spec = benchmark(lambda: SpecFile(path, '', large_spec, download=False), self._clear_parse_cache)
+        assert spec.get_applied_patches()
+
+    def test_set_tag(self, benchmark, workdir, large_spec):
+        path = self._copy_large_spec(large_spec, workdir)
+        spec = SpecFile(path, '', large_spec, download=False)
+        benchmark(lambda: spec.set_tag('Version', '1.1'), rounds=10)
+
+    def test_split_sections(self, benchmark, workdir, large_spec):
+        path = self._copy_large_spec(large_spec, workdir)
+        spec = SpecFile(path, '', large_spec, download=False)
+        benchmark(spec._split_sections, rounds=10)  # pylint: disable=protected-access
+
+    def test_write_updated_patches(self, benchmark, workdir, large_spec):
+        path = self._copy_large_spec(large_spec, workdir)
+
+        def setup():
+            spec = SpecFile(path, '', large_spec, download=False)
+            names = [os.path.basename(p.get_path()) for p in spec.get_applied_patches()]
+            patches = dict(deleted=names[0::3], modified=names[1::3], inapplicable=names[2::3])
+            return spec, patches
+
+        benchmark(lambda spec, patches: spec.write_updated_patches(patches, True), setup)
+
+
+class TestArchiveBenchmarks(object):
+
+    @pytest.mark.parametrize('archive', [
+        'archive.tar.gz',
+        'archive.tar.bz2',
+        'archive.tar.xz',
+        'archive.tar.zst',
+        'archive.tar.lz',
+        'archive.zip',
+        'test-1.0.2.tar.xz',
+    ])
+    def test_extract_archive(self, benchmark, workdir, archive):
+        def setup():
+            return tempfile.mkdtemp(dir=workdir),
+
+        benchmark(Archive(os.path.join(TEST_FILES_DIR, archive)).extract_archive, setup, rounds=10)
+
+    def test_extract_large_archive(self, benchmark, workdir, large_archive):
+        def setup():
+            return tempfile.mkdtemp(dir=workdir),
+
+        benchmark(Archive(large_archive).extract_archive, setup)
+
+
+class TestPatchingBenchmarks(object):
+
+    PATCH = """From 0000000000000000000000000000000000000000 Mon Sep 17 00:00:00 2001
+From: Packager <packager@example.com>
+Date: Mon, 1 Jan 2018 00:00:00 +0000
+Subject: [PATCH] Change file {0}
+
+---
+ file{0}.txt | 2 +-
+ 1 file changed, 1 insertion(+), 1 deletion(-)
+
+diff --git a/file{0}.txt b/file{0}.txt
+--- a/file{0}.txt
++++ b/file{0}.txt
+@@ -1,3 +1,3 @@
+ first line
+-second line
++patched line {0}
+ third line
+"""
+
+    def test_run_patch(self, benchmark, workdir, scale):
+        count = scaled(100, scale)
+        for version in ['old', 'new']:
+            os.makedirs(os.path.join('sources', version))
+            for i in range(count):
+                with open(os.path.join('sources', version, 'file{}.txt'.format(i)), 'w') as f:
+                    f.write('first line\nsecond line\nthird line\n')
+        with open(os.path.join('sources', 'new', 'NEWS'), 'w') as f:
+            f.write('new version\n')
+        patches = []
+        for i in range(count):
+            path = os.path.join(workdir, 'file{}.patch'.format(i))
+            with open(path, 'w') as f:
+                f.write(self.PATCH.format(i))
+            patches.append(PatchObject(path, i, 1))
+
+        def setup():
+            round_dir = tempfile.mkdtemp(dir=workdir)
+            for version in ['old', 'new']:
+                shutil.copytree(os.path.join('sources', version), os.path.join(round_dir, version))
+            os.makedirs(os.path.join(round_dir, 'rebased-sources'))
+            return round_dir,
+
+        def run_patch(round_dir):
+            return GitPatchTool.run_patch(os.path.join(round_dir, 'old'), os.path.join(round_dir, 'new'), [], patches,
+                                          rebased_sources_dir=os.path.join(round_dir, 'rebased-sources'),
+                                          non_interactive=True, **{'continue': False})
+
+        result = benchmark(run_patch, setup)
+        assert result['untouched']
+
+
+class TestCheckerBenchmarks(object):
+
+    def test_pkgdiff_fill_dictionary(self, benchmark, workdir, scale):
+        with open('files.xml', 'w') as f:
+            for tag in ['added', 'removed', 'changed', 'moved', 'renamed']:
+                f.write('<{}>\n'.format(tag))
+                for i in range(scaled(20000, scale)):
+                    f.write('    /usr/lib64/pkg-1.0.1/{}-{}.so\n'.format(tag, i))
+                f.write('</{}>\n'.format(tag))
+        pkgdiff = checkers_runner.plugin_classes['pkgdiff']
+        pkgdiff.results_dir = workdir
+        benchmark(lambda: pkgdiff.fill_dictionary(workdir, old_version='1.0.1', new_version='1.0.2'))
+        assert pkgdiff.results_dict['added']
+
+    def test_rpmdiff_analyze_logs(self, benchmark, scale):
+        count = scaled(2000, scale)
+        output = []
+        for i in range(count):
+            output.append('removed     /usr/lib64/libold{}.so.1\n'.format(i))
+            output.append('added       /usr/lib64/libnew{}.so.2\n'.format(i))
+            output.append('S.5........ /usr/share/doc/file{}.txt\n'.format(i))
+        rpmdiff = checkers_runner.plugin_classes['rpmdiff']
+
+        def analyze():
+            results = rpmdiff._analyze_logs(  # pylint: disable=protected-access
+                output, dict(added=[], removed=[], changed=[]))
+            return rpmdiff.update_added_removed(results)
+
+        results = benchmark(analyze)
+        assert len(results['changed']) == count
+
+    def test_abipkgdiff_parse_abi_logs(self, benchmark, workdir, scale):
+        reports = {}
+        for i in range(scaled(1000, scale)):
+            name = 'package{}'.format(i)
+            with open('{}.txt'.format(name), 'w') as f:
+                f.write('================ changes of \'lib{}.so\'===============\n'.format(i))
+                f.write('  Functions changes summary: 3 Removed, 1 Changed, 2 Added functions (4 filtered out)\n')
+                f.write('  Variables changes summary: 0 Removed, 0 Changed, 1 Added variable\n')
+            reports[name] = 1
+        abipkgdiff = checkers_runner.plugin_classes['abipkgdiff']
+        abipkgdiff.results_dir = workdir
+        results = benchmark(lambda: abipkgdiff.parse_abi_logs(reports))
+        assert all(six.itervalues(results))
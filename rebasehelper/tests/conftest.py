@@ -30,6 +30,13 @@ TESTS_DIR = os.path.dirname(__file__)
 TEST_FILES_DIR = os.path.join(TESTS_DIR, 'testing_files')
 
 
+def pytest_addoption(parser):
+    parser.addoption('--benchmark-json', default='benchmarks.json', metavar='PATH',
+                     help='file to write benchmark results to, defaults to %(default)s')
+    parser.addoption('--benchmark-scale', default=1.0, type=float,
+                     help='scale of inputs generated for benchmarks, defaults to %(default)s')
+
+
 @pytest.yield_fixture(autouse=True)
 def workdir(request, tmpdir_factory):
     with tmpdir_factory.mktemp('workdir').as_cwd():
@@ -46,5 +53,7 @@ def pytest_collection_modifyitems(items):
         # https://github.com/pytest-dev/pytest/blob/master/_pytest/python.py
         if 'functional' in item.fspath.strpath:
             item.add_marker(pytest.mark.functional)
+        elif 'benchmarks' in item.fspath.strpath:
+            item.add_marker(pytest.mark.benchmark)
         else:
             item.add_marker(pytest.mark.standard)
@@ -21,12 +21,20 @@
 #          Tomas Hozza <thozza@redhat.com>
 
 import os
+import threading
 
 import pytest
 
 from rebasehelper.cli import CLI
 from rebasehelper.config import Config
 from rebasehelper.application import Application
+from rebasehelper.build_helper import SRPMBuilder, SourcePackageBuildError, Builder, BinaryPackageBuildError
+from rebasehelper.checker import checkers_runner
+from rebasehelper.exceptions import RebaseHelperError, CheckerNotFoundError
+from rebasehelper.results_store import results_store
+from rebasehelper.scheduler import StageScheduler
+from rebasehelper.source_cache import SourceCache
+from rebasehelper.timing import timings
 from rebasehelper import constants
 
 
@@ -109,6 +117,141 @@ class TestApplication(object):
         for key, val in app.kwargs.items():
             if key in expected_dict:
                 assert val == expected_dict[key]
+        # rest of source archives is moved from where it was extracted
+        workspace_dir = os.path.join(workdir, constants.WORKSPACE_DIR)
+        assert os.path.isdir(os.path.join(workspace_dir, constants.OLD_SOURCES_DIR, 'test-1.0.2', 'misc'))
+        assert not os.path.exists(os.path.join(workspace_dir, constants.REST_SOURCES_DIR))
+
+    def test_extract_archives(self, workdir):
+        jobs = [(self.OLD_SOURCES, os.path.join(workdir, 'old')), (self.NEW_SOURCES, os.path.join(workdir, 'new'))]
+        timings.clear()
+        Application.extract_archives(jobs, 2)
+        for _, destination in jobs:
+            # archives without top-level directory
+            assert Application.get_sources_dir(destination) == destination
+            assert os.path.isfile(os.path.join(destination, 'file.txt'))
+        # timings of extractions are recorded in worker processes
+        assert timings.get_summary()['calls']['extract']['count'] == 2
+        with pytest.raises(RebaseHelperError):
+            Application.extract_archives([(self.SPEC_FILE, os.path.join(workdir, 'spec'))] + jobs, 2)
+
+    def test_extract_archives_cached(self, workdir):
+        cache = SourceCache(os.path.join(workdir, 'cache'), 1024 * 1024)
+        jobs = [(self.OLD_SOURCES, os.path.join(workdir, 'old')), (self.NEW_SOURCES, os.path.join(workdir, 'new'))]
+        Application.extract_archives(jobs, 2, cache)
+        assert len(os.listdir(os.path.join(workdir, 'cache'))) == 2
+        timings.clear()
+        jobs = [(a, d + '-cached') for a, d in jobs]
+        Application.extract_archives(jobs, 2, cache)
+        for _, destination in jobs:
+            assert os.path.isfile(os.path.join(destination, 'file.txt'))
+        # cached archives are not extracted again
+        assert 'extract' not in timings.get_summary()['calls']
+
+    def test_parallel_source_package_builds(self, workdir, monkeypatch):
+        def build(self, spec, results_dir, **kwargs):  # pylint: disable=unused-argument
+            version = 'old' if spec.get_version() == '1.0.2' else 'new'
+            assert kwargs['uniqueext'] == 'rebase-helper-{}'.format(version)
+            if version == 'old':
+                raise SourcePackageBuildError('Building SRPM failed!', logfile='build.log')
+            return dict(srpm=os.path.join(results_dir, 'SRPM', 'test-1.0.3-1.src.rpm'), logs=[])
+
+        monkeypatch.setattr(SRPMBuilder, 'build', build)
+        cli = CLI(self.cmd_line_args + ['--parallel-builds'])
+        config = Config()
+        config.merge(cli)
+        execution_dir, results_dir, debug_log_file = Application.setup(config)
+        app = Application(config, execution_dir, results_dir, debug_log_file)
+        with pytest.raises(RebaseHelperError) as e:
+            app.build_source_packages()
+        assert e.value.msg == 'Building old SRPM packages failed; see build.log for more information'
+        assert results_store.get_old_build()['source_package_build_error'] == 'Building SRPM failed!'
+        assert results_store.get_new_build()['srpm'] == os.path.join(results_dir, 'new-build', 'SRPM',
+                                                                      'test-1.0.3-1.src.rpm')
+
+    def test_parallel_binary_package_builds(self, workdir, monkeypatch):
+        def build(self, spec, results_dir, srpm, **kwargs):  # pylint: disable=unused-argument
+            version = 'old' if spec.get_version() == '1.0.2' else 'new'
+            assert kwargs['uniqueext'] == 'rebase-helper-{}'.format(version)
+            if version == 'new':
+                raise BinaryPackageBuildError('Building RPMs failed!', results_dir, logfile='build.log')
+            return dict(rpm=[os.path.join(results_dir, 'RPM', 'test-1.0.2-1.x86_64.rpm')], logs=[])
+
+        monkeypatch.setattr(Builder, 'build', build)
+        cli = CLI(self.cmd_line_args + ['--parallel-builds', '--non-interactive', '--buildtool', 'mock'])
+        config = Config()
+        config.merge(cli)
+        execution_dir, results_dir, debug_log_file = Application.setup(config)
+        app = Application(config, execution_dir, results_dir, debug_log_file)
+        for version in ['old', 'new']:
+            results_store.set_build_data(version, dict(srpm='test.src.rpm', logs=[]))
+        with pytest.raises(RebaseHelperError) as e:
+            app.build_binary_packages()
+        assert e.value.msg == 'Building new RPM packages failed; see build.log for more information'
+        assert results_store.get_old_build()['rpm'] == [os.path.join(results_dir, 'old-build', 'RPM',
+                                                                     'test-1.0.2-1.x86_64.rpm')]
+        assert results_store.get_new_build()['binary_package_build_error'] == 'Building RPMs failed!'
+
+    def test_concurrent_checkers(self, workdir, monkeypatch):
+        def run_checker(results_dir, checker_name, **kwargs):  # pylint: disable=unused-argument
+            if checker_name == 'abipkgdiff':
+                raise CheckerNotFoundError
+            return {'path': os.path.join(results_dir, checker_name)}
+
+        monkeypatch.setattr(checkers_runner, 'run_checker', run_checker)
+        cli = CLI(self.cmd_line_args + ['--pkgcomparetool', 'rpmdiff,pkgdiff,abipkgdiff', '--checker-workers', '2'])
+        config = Config()
+        config.merge(cli)
+        execution_dir, results_dir, debug_log_file = Application.setup(config)
+        app = Application(config, execution_dir, results_dir, debug_log_file)
+        app.run_package_checkers(results_dir, category='RPM')
+        assert results_store.get_checkers() == {
+            'rpmdiff': {'path': os.path.join(results_dir, 'checkers', 'rpmdiff')},
+            'pkgdiff': {'path': os.path.join(results_dir, 'checkers', 'pkgdiff')},
+        }
+
+    def test_stages_overlap(self, workdir, monkeypatch):
+        overlapping = ['source_checkers', 'patch_sources', 'build_old_srpm']
+        started = []
+        all_started = threading.Event()
+        passed = {}
+
+        def wait(name):
+            started.append(name)
+            if set(overlapping).issubset(started):
+                all_started.set()
+            # the stages have to run at the same time, otherwise the event is not set in time
+            passed[name] = all_started.wait(5)
+
+        def prepare_sources(self):  # pylint: disable=unused-argument
+            for version in ['old', 'new']:
+                os.makedirs(os.path.join(workdir, version))
+            return [os.path.join(workdir, 'old'), os.path.join(workdir, 'new')]
+
+        def run_package_checkers(self, results_dir, **kwargs):  # pylint: disable=unused-argument
+            if kwargs['category'] == 'SOURCE':
+                # checkers inspect copies of the sources, which are not being patched
+                assert kwargs['old_dir'] != os.path.join(workdir, 'old')
+                assert os.path.isdir(kwargs['old_dir'])
+                wait('source_checkers')
+
+        def build_source_package(self, builder, version, concurrent=False):  # pylint: disable=unused-argument
+            if version == 'old':
+                wait('build_old_srpm')
+
+        monkeypatch.setattr(Application, 'prepare_sources', prepare_sources)
+        monkeypatch.setattr(Application, 'patch_sources', lambda self, sources: wait('patch_sources'))
+        monkeypatch.setattr(Application, 'run_package_checkers', run_package_checkers)
+        monkeypatch.setattr(Application, '_get_srpm_builder', lambda self: None)
+        monkeypatch.setattr(Application, '_build_source_package', build_source_package)
+        monkeypatch.setattr(Application, 'build_binary_packages', lambda self: None)
+        cli = CLI(self.cmd_line_args + ['--pkgcomparetool', 'licensecheck'])
+        config = Config()
+        config.merge(cli)
+        execution_dir, results_dir, debug_log_file = Application.setup(config)
+        app = Application(config, execution_dir, results_dir, debug_log_file)
+        StageScheduler(app._get_stages()).run()  # pylint: disable=protected-access
+        assert passed == {name: True for name in overlapping}
 
     @pytest.mark.parametrize('gitignore, sources, result', [
         (
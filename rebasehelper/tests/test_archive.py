@@ -21,10 +21,13 @@
 #          Tomas Hozza <thozza@redhat.com>
 
 import os
+import signal
+import subprocess
+import tarfile
 
 import pytest
 
-from rebasehelper.archive import Archive
+from rebasehelper.archive import Archive, DecompressedStream, DecompressionTools
 
 
 class TestArchive(object):
@@ -32,6 +35,8 @@ class TestArchive(object):
     TGZ = 'archive.tgz'
     TAR_XZ = 'archive.tar.xz'
     TAR_BZ2 = 'archive.tar.bz2'
+    TAR_ZST = 'archive.tar.zst'
+    TAR_LZ = 'archive.tar.lz'
     ZIP = 'archive.zip'
     BZ2 = 'file.txt.bz2'
     INVALID_TAR_BZ2 = 'archive-invalid.tar.bz2'
@@ -46,14 +51,28 @@ class TestArchive(object):
         TGZ,
         TAR_XZ,
         TAR_BZ2,
+        TAR_ZST,
+        TAR_LZ,
         BZ2,
         ZIP,
         INVALID_TAR_BZ2,
         INVALID_TAR_XZ,
     ]
 
-    @pytest.fixture
-    def extracted_archive(self, archive, workdir):
+    def test_decompressed_stream(self):
+        closed = []
+        stream = DecompressedStream([b'ab', b'cde', b'', b'fgh'], lambda: closed.append(True))
+        assert stream.read(1) == b'a'
+        assert stream.read(3) == b'bcd'
+        assert stream.read(0) == b''
+        assert stream.read() == b'efgh'
+        assert stream.read(5) == b''
+        stream.close()
+        stream.close()
+        assert closed == [True]
+
+    @staticmethod
+    def extract(archive, workdir):
         a = Archive(archive)
         d = os.path.join(workdir, 'dir')
         a.extract_archive(d)
@@ -64,6 +83,8 @@ class TestArchive(object):
         TGZ,
         TAR_XZ,
         TAR_BZ2,
+        TAR_ZST,
+        TAR_LZ,
         BZ2,
         ZIP,
     ], ids=[
@@ -71,10 +92,17 @@ class TestArchive(object):
         'tgz',
         'tar.xz',
         'tar.bz2',
+        'tar.zst',
+        'tar.lz',
         'bz2',
         'zip',
     ])
-    def test_archive(self, extracted_archive):
+    @pytest.mark.parametrize('tools', [True, False], ids=['tools', 'python'])
+    def test_archive(self, archive, tools, workdir, monkeypatch):
+        monkeypatch.setattr(DecompressionTools, 'enabled', tools)
+        if archive == self.TAR_ZST and not (tools and DecompressionTools.get_command('zst')):
+            pytest.importorskip('zstandard')
+        extracted_archive = self.extract(archive, workdir)
         extracted_file = os.path.join(extracted_archive, self.ARCHIVED_FILE)
         #  check if the dir was created
         assert os.path.isdir(extracted_archive)
@@ -84,6 +112,168 @@ class TestArchive(object):
         with open(extracted_file) as f:
             assert f.read().strip() == self.ARCHIVED_FILE_CONTENT
 
+    @pytest.mark.parametrize('archive', [
+        TAR_GZ,
+        TGZ,
+        TAR_XZ,
+        TAR_BZ2,
+        TAR_ZST,
+        TAR_LZ,
+        BZ2,
+        ZIP,
+    ], ids=[
+        'tar.gz',
+        'tgz',
+        'tar.xz',
+        'tar.bz2',
+        'tar.zst',
+        'tar.lz',
+        'bz2',
+        'zip',
+    ])
+    @pytest.mark.parametrize('tools', [True, False], ids=['tools', 'python'])
+    def test_list_members(self, archive, tools, workdir, monkeypatch):
+        monkeypatch.setattr(DecompressionTools, 'enabled', tools)
+        if archive == self.TAR_ZST and not (tools and DecompressionTools.get_command('zst')):
+            pytest.importorskip('zstandard')
+        a = Archive(archive)
+        members = a.list_members()
+        assert [m.name for m in members] == [self.ARCHIVED_FILE]
+        assert not members[0].is_dir
+        if archive != self.BZ2:
+            assert members[0].size == len(self.ARCHIVED_FILE_CONTENT) + 1
+        # nothing is extracted
+        assert sorted(os.listdir(workdir)) == sorted(self.TEST_FILES)
+        # archives without top-level directory
+        assert a.get_top_level_dir(members) is None
+
+    def test_get_top_level_dir(self, workdir):
+        os.makedirs(os.path.join('test-1.0', 'src'))
+        with open(os.path.join('test-1.0', 'src', 'main.c'), 'w') as f:
+            f.write('int main() {}')
+        with tarfile.open('test-1.0.tar.gz', 'w:gz') as tar:
+            tar.add('test-1.0', arcname='./test-1.0')
+        a = Archive('test-1.0.tar.gz')
+        members = a.list_members()
+        assert [(m.name, m.is_dir) for m in members] == [
+            ('test-1.0', True),
+            (os.path.join('test-1.0', 'src'), True),
+            (os.path.join('test-1.0', 'src', 'main.c'), False),
+        ]
+        assert a.get_top_level_dir(members) == 'test-1.0'
+        with tarfile.open('test-1.0.tar', 'w') as tar:
+            tar.add(os.path.join('test-1.0', 'src', 'main.c'), arcname='main.c')
+        assert Archive('test-1.0.tar').get_top_level_dir() is None
+
+    @pytest.mark.parametrize('archive', [
+        TAR_GZ,
+        TGZ,
+        TAR_XZ,
+        TAR_BZ2,
+        TAR_ZST,
+        TAR_LZ,
+    ], ids=[
+        'tar.gz',
+        'tgz',
+        'tar.xz',
+        'tar.bz2',
+        'tar.zst',
+        'tar.lz',
+    ])
+    @pytest.mark.parametrize('tools', [True, False], ids=['tools', 'python'])
+    def test_extract_stream(self, archive, tools, workdir, monkeypatch):
+        monkeypatch.setattr(DecompressionTools, 'enabled', tools)
+        if archive == self.TAR_ZST and not (tools and DecompressionTools.get_command('zst')):
+            pytest.importorskip('zstandard')
+        d = os.path.join(workdir, 'dir')
+        extractor = Archive(archive).extract_stream(d)
+        with open(archive, 'rb') as f:
+            data = f.read()
+        # written in small pieces like downloaded data
+        for i in range(0, len(data), 64):
+            extractor.write(data[i:i + 64])
+        extractor.close()
+        with open(os.path.join(d, self.ARCHIVED_FILE)) as f:
+            assert f.read().strip() == self.ARCHIVED_FILE_CONTENT
+
+    @pytest.mark.parametrize('tools', [True, False], ids=['tools', 'python'])
+    def test_extract_stream_invalid(self, tools, workdir, monkeypatch):
+        monkeypatch.setattr(DecompressionTools, 'enabled', tools)
+        extractor = Archive(self.INVALID_TAR_XZ).extract_stream(os.path.join(workdir, 'dir'))
+        with open(self.INVALID_TAR_XZ, 'rb') as f:
+            extractor.write(f.read())
+        with pytest.raises(IOError):
+            extractor.close()
+        # archives that can't be read sequentially
+        for archive in [self.ZIP, self.BZ2]:
+            with pytest.raises(NotImplementedError):
+                Archive(archive).extract_stream(os.path.join(workdir, 'dir'))
+
+    @pytest.mark.parametrize('compression', ['gz', 'xz', 'bz2'])
+    @pytest.mark.parametrize('tools', [True, False], ids=['tools', 'python'])
+    def test_truncated_archive(self, compression, tools, workdir, monkeypatch):
+        monkeypatch.setattr(DecompressionTools, 'enabled', tools)
+        with open('data', 'wb') as f:
+            f.write(os.urandom(256 * 1024))
+        archive = 'truncated.tar.' + compression
+        with tarfile.open(archive, 'w:' + compression) as tar:
+            tar.add('data')
+        # cut in the middle of the data, after the header
+        with open(archive, 'rb') as f:
+            data = f.read()
+        with open(archive, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        # both are reported as a damaged archive
+        with pytest.raises((IOError, EOFError)):
+            Archive(archive).extract_archive(os.path.join(workdir, 'dir'))
+
+    def test_abort_decompression(self, workdir, monkeypatch):
+        if not DecompressionTools.get_command('xz'):
+            pytest.skip('xz is not available')
+        procs = []
+        popen = subprocess.Popen
+
+        def capturing_popen(*args, **kwargs):
+            proc = popen(*args, **kwargs)
+            procs.append(proc)
+            return proc
+
+        monkeypatch.setattr(subprocess, 'Popen', capturing_popen)
+        with open('data', 'wb') as f:
+            f.write(b'\0' * 16 * 1024 * 1024)
+        with tarfile.open('big.tar.xz', 'w:xz') as tar:
+            tar.add('data')
+        # reading stopped in the middle of the archive, e.g. because extraction failed
+        archive = Archive('big.tar.xz')._open()  # pylint: disable=protected-access
+        archive.next()
+        archive.close()
+        assert procs[-1].returncode == -signal.SIGTERM
+        # the whole archive was read
+        archive = Archive('big.tar.xz')._open()  # pylint: disable=protected-access
+        assert [m.name for m in archive] == ['data']
+        archive.close()
+        assert procs[-1].returncode == 0
+
+    @pytest.mark.parametrize('archive', [
+        'plain.tar.gz',
+        'plain.tgz',
+        'plain.tar.bz2',
+    ])
+    @pytest.mark.parametrize('tools', [True, False], ids=['tools', 'python'])
+    def test_uncompressed_archive(self, archive, tools, workdir, monkeypatch):
+        monkeypatch.setattr(DecompressionTools, 'enabled', tools)
+        # make sure a tool is used even if no parallel one is installed
+        monkeypatch.setitem(DecompressionTools.TOOLS, 'gz', [['gzip', '-d', '-c']])
+        monkeypatch.setitem(DecompressionTools.TOOLS, 'bz2', [['bzip2', '-d', '-c']])
+        with open(self.ARCHIVED_FILE, 'w') as f:
+            f.write(self.ARCHIVED_FILE_CONTENT)
+        # e.g. an archive decompressed by the HTTP client because of Content-Encoding
+        with tarfile.open(archive, 'w') as tar:
+            tar.add(self.ARCHIVED_FILE)
+        Archive(archive).extract_archive(os.path.join(workdir, 'dir'))
+        with open(os.path.join(workdir, 'dir', self.ARCHIVED_FILE)) as f:
+            assert f.read().strip() == self.ARCHIVED_FILE_CONTENT
+
     @pytest.mark.parametrize('archive', [
         INVALID_TAR_BZ2,
         INVALID_TAR_XZ,
@@ -91,8 +281,23 @@ class TestArchive(object):
         'tar.bz2',
         'tar.xz',
     ])
-    def test_invalid_archive(self, archive, workdir):
+    @pytest.mark.parametrize('tools', [True, False], ids=['tools', 'python'])
+    def test_invalid_archive(self, archive, tools, workdir, monkeypatch):
+        monkeypatch.setattr(DecompressionTools, 'enabled', tools)
         a = Archive(archive)
         d = os.path.join(workdir, 'dir')
         with pytest.raises(IOError):
             a.extract_archive(d)
+
+    @pytest.mark.parametrize('archive', [
+        INVALID_TAR_BZ2,
+        INVALID_TAR_XZ,
+    ], ids=[
+        'tar.bz2',
+        'tar.xz',
+    ])
+    @pytest.mark.parametrize('tools', [True, False], ids=['tools', 'python'])
+    def test_list_invalid_archive(self, archive, tools, workdir, monkeypatch):
+        monkeypatch.setattr(DecompressionTools, 'enabled', tools)
+        with pytest.raises(IOError):
+            Archive(archive).list_members()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import json
+import os
+
+from rebasehelper import batch
+from rebasehelper.batch import BatchHelper
+from rebasehelper.exceptions import RebaseHelperError
+from rebasehelper.results_store import results_store
+
+
+class FakeApplication(object):
+
+    buildroot_id = None
+    output_tools_enabled = True
+
+    @staticmethod
+    def setup(config):  # pylint: disable=unused-argument
+        results_dir = os.path.join(os.getcwd(), 'rebase-helper-results')
+        return os.getcwd(), results_dir, os.path.join(results_dir, 'debug.log')
+
+    def __init__(self, cli_conf, execution_dir, results_dir, debug_log_file):
+        self.conf = cli_conf
+
+    def run(self):
+        name = os.path.basename(os.getcwd())
+        results_store.set_info_text('package', name)
+        with open('rebase', 'w') as f:
+            json.dump(dict(buildroot_id=self.buildroot_id, output_tools=self.output_tools_enabled,
+                           version=self.conf.sources), f)
+        if name == 'fail':
+            raise RebaseHelperError('rebase failed')
+        if name == 'error':
+            raise ValueError('unexpected error')
+
+
+class TestBatchHelper(object):
+
+    def test_read_packages(self, workdir):
+        with open('packages', 'w') as f:
+            f.write('# package version\n')
+            f.write('foo 1.2.3\n')
+            f.write('\n')
+            f.write('{}\n'.format(os.path.join(workdir, 'bar')))
+        assert BatchHelper.read_packages('packages') == [
+            (os.path.join(workdir, 'foo'), '1.2.3'),
+            (os.path.join(workdir, 'bar'), None),
+        ]
+
+    def test_write_summary(self, workdir):
+        results = [
+            dict(directory=os.path.join(workdir, 'foo'), version='1.2.3', result='success', report={}),
+            dict(directory=os.path.join(workdir, 'bar'), version=None, result='fail', message='failed',
+                 report={}),
+        ]
+        BatchHelper.write_summary('summary.json', results)
+        with open('summary.json') as f:
+            summary = json.load(f)
+        assert summary['packages'] == results
+        assert summary['total'] == 2
+        assert summary['success'] == 1
+        assert summary['fail'] == 1
+        assert summary['error'] == 0
+
+    def test_rebase(self, workdir, monkeypatch):
+        monkeypatch.setattr(batch, 'Application', FakeApplication)
+        packages = []
+        for name, version in [('foo', '1.0'), ('fail', None), ('error', '2.0'), ('bar', None)]:
+            os.mkdir(name)
+            packages.append((os.path.join(workdir, name), version))
+        results = BatchHelper.rebase(packages, [], 2)
+        assert [(r['directory'], r['version'], r['result']) for r in results] == [
+            (os.path.join(workdir, 'foo'), '1.0', 'success'),
+            (os.path.join(workdir, 'fail'), None, 'fail'),
+            (os.path.join(workdir, 'error'), '2.0', 'error'),
+            (os.path.join(workdir, 'bar'), None, 'success'),
+        ]
+        assert results[1]['message'] == 'rebase failed'
+        assert results[2]['message'] == 'unexpected error'
+        for (directory, version), result in zip(packages, results):
+            assert result['results_dir'] == os.path.join(directory, 'rebase-helper-results')
+            # each package is rebased in a fresh process
+            assert result['report']['information'] == dict(package=os.path.basename(directory))
+            with open(os.path.join(directory, 'rebase')) as f:
+                rebase = json.load(f)
+            assert rebase['version'] == version
+            assert rebase['buildroot_id'] in ['rebase-helper-batch0', 'rebase-helper-batch1']
+            assert not rebase['output_tools']
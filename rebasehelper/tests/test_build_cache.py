@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import os
+import time
+
+from rebasehelper.build_cache import BuildCache
+
+
+class TestBuildCache(object):
+
+    @staticmethod
+    def _build(results_dir, name, size=1000):
+        os.makedirs(os.path.join(results_dir, 'SRPM'))
+        srpm = os.path.join(results_dir, 'SRPM', name)
+        with open(srpm, 'wb') as f:
+            f.write(b'x' * size)
+        return dict(srpm=srpm, logs=[])
+
+    def test_get_key(self, workdir):
+        with open('test.spec', 'w') as f:
+            f.write('Version: 1.0')
+        key = BuildCache.get_key(['mock'], ['test.spec'])
+        assert BuildCache.get_key(['mock'], ['test.spec']) == key
+        assert BuildCache.get_key(['rpmbuild'], ['test.spec']) != key
+        with open('test.spec', 'w') as f:
+            f.write('Version: 1.1')
+        assert BuildCache.get_key(['mock'], ['test.spec']) != key
+
+    def test_store_restore(self, workdir):
+        cache = BuildCache(os.path.join(workdir, 'cache'), 2048)
+        build = self._build(os.path.join(workdir, 'first', 'old-build'), 'test-1.0-1.src.rpm')
+        assert cache.restore('key', os.path.join(workdir, 'second', 'old-build'), 'SRPM') is None
+        cache.store('key', os.path.join(workdir, 'first', 'old-build'), 'SRPM', build)
+        restored = cache.restore('key', os.path.join(workdir, 'second', 'old-build'), 'SRPM')
+        assert restored == dict(srpm=os.path.join(workdir, 'second', 'old-build', 'SRPM', 'test-1.0-1.src.rpm'),
+                                logs=[])
+        assert os.path.isfile(restored['srpm'])
+
+    def test_evict(self, workdir):
+        cache = BuildCache(os.path.join(workdir, 'cache'), 2500)
+        for key in ['first', 'second']:
+            path = os.path.join(workdir, key)
+            cache.store(key, path, 'SRPM', self._build(path, 'test.src.rpm'))
+        # make the second entry the least recently used one
+        past = time.time() - 60
+        os.utime(os.path.join(workdir, 'cache', 'second'), (past, past))
+        assert cache.restore('first', os.path.join(workdir, 'restored'), 'SRPM')
+        cache.store('third', os.path.join(workdir, 'third'), 'SRPM',
+                    self._build(os.path.join(workdir, 'third'), 'test.src.rpm'))
+        assert sorted(os.listdir(os.path.join(workdir, 'cache'))) == ['first', 'third']
+        # builds bigger than the cache are not stored
+        cache.store('big', os.path.join(workdir, 'big'), 'SRPM',
+                    self._build(os.path.join(workdir, 'big'), 'test.src.rpm', size=5000))
+        assert not os.path.exists(os.path.join(workdir, 'cache', 'big'))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import json
+import os
+
+from rebasehelper.checkpoint import CheckpointManifest
+
+
+class TestCheckpointManifest(object):
+
+    def test_record_and_load(self, workdir):
+        with open('source.tar.gz', 'w') as f:
+            f.write('source')
+        manifest = CheckpointManifest(workdir)
+        digest = manifest.get_digest('prepare_sources', ['spec'], ['source.tar.gz'])
+        manifest.record('prepare_sources', digest, dict(old='old', new='new'))
+        assert os.path.isfile(os.path.join(workdir, CheckpointManifest.FILENAME))
+
+        resumed = CheckpointManifest(workdir)
+        resumed.load()
+        digest = resumed.get_digest('prepare_sources', ['spec'], ['source.tar.gz'])
+        assert resumed.get('prepare_sources', digest) == dict(old='old', new='new')
+        assert resumed.get('patch_sources', digest) is None
+
+    def test_changed_inputs(self, workdir):
+        with open('source.tar.gz', 'w') as f:
+            f.write('source')
+        manifest = CheckpointManifest(workdir)
+        first = manifest.get_digest('prepare_sources', ['spec'], ['source.tar.gz'])
+        second = manifest.get_digest('build_srpm', [], [], requires=['prepare_sources'])
+        with open('source.tar.gz', 'w') as f:
+            f.write('modified source')
+        assert manifest.get_digest('prepare_sources', ['spec'], ['source.tar.gz']) != first
+        # digests of dependent stages change with digests of stages they require
+        assert manifest.get_digest('build_srpm', [], [], requires=['prepare_sources']) != second
+        assert manifest.get_digest('prepare_sources', ['modified spec'], ['source.tar.gz']) != first
+
+    def test_invalid_manifest(self, workdir):
+        with open(CheckpointManifest.FILENAME, 'w') as f:
+            f.write('{')
+        manifest = CheckpointManifest(workdir)
+        manifest.load()
+        assert manifest.stages == {}
+        with open(CheckpointManifest.FILENAME, 'w') as f:
+            json.dump(dict(version='0.0.0', stages=dict(prepare_sources=dict(digest='', data={}))), f)
+        manifest.load()
+        assert manifest.stages == {}
+
+    def test_unserializable_data(self, workdir):
+        manifest = CheckpointManifest(workdir)
+        digest = manifest.get_digest('build_srpm')
+        manifest.record('build_srpm', digest, dict(build=object()))
+        assert manifest.get('build_srpm', digest) is None
+        assert os.listdir(workdir) == []
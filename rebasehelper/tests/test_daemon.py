@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import io
+import os
+import socket
+import threading
+
+import pytest
+
+from rebasehelper.batch import BatchHelper
+from rebasehelper.daemon import DaemonHelper, DaemonServer
+from rebasehelper.exceptions import RebaseHelperError
+from rebasehelper.logger import logger
+from rebasehelper.results_store import results_store
+
+
+class TestDaemonHelper(object):
+
+    def test_send_receive(self):
+        stream = io.BytesIO()
+        DaemonHelper.send(stream, dict(type='log', message='foo'))
+        DaemonHelper.send(stream, dict(type='result', result='success'))
+        stream.seek(0)
+        assert list(DaemonHelper.receive(stream)) == [
+            dict(type='log', message='foo'),
+            dict(type='result', result='success'),
+        ]
+
+    def test_submit(self, workdir, monkeypatch):
+        def rebase_package(directory, version, args):
+            logger.info('Rebasing %s', os.path.basename(directory))
+            results_store.set_info_text('args', args)
+            return dict(directory=directory, version=version, result='success',
+                        report=results_store.get_all())
+
+        monkeypatch.setattr(BatchHelper, 'rebase_package', staticmethod(rebase_package))
+        path = os.path.join(workdir, 'daemon.sock')
+        server = DaemonServer(path, 1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            first = DaemonHelper.submit(path, workdir, ['--outputtool', 'json'])
+            second = DaemonHelper.submit(path, workdir, [])
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert first['result'] == 'success'
+        assert first['report']['information']['args'] == ['--outputtool', 'json', '--non-interactive']
+        # jobs don't share results_store
+        assert second['report']['information']['args'] == ['--non-interactive']
+
+    def test_remove_stale_socket(self, workdir):
+        path = os.path.join(workdir, 'daemon.sock')
+        DaemonHelper.remove_stale_socket(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(path)
+            sock.listen(1)
+            # a running daemon keeps its socket
+            with pytest.raises(RebaseHelperError):
+                DaemonHelper.remove_stale_socket(path)
+            assert os.path.exists(path)
+        finally:
+            sock.close()
+        # nobody is listening anymore
+        DaemonHelper.remove_stale_socket(path)
+        assert not os.path.exists(path)
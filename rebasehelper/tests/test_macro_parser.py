@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import pytest
+
+from rebasehelper.macro_parser import MacroParser
+
+
+class TestMacroParser(object):
+
+    @pytest.mark.parametrize('s, tree', [
+        ('1.0', [('t', '1.0')]),
+        ('%{version}.tar.gz', [('m', 'version'), ('t', '.tar.gz')]),
+        ('%version-1', [('m', 'version'), ('t', '-1')]),
+        ('%{name}%version', [('m', 'name'), ('m', 'version')]),
+        ('100%%', [('t', '100%')]),
+        ('1%{?dist}', [('t', '1'), ('m', '?dist')]),
+        ('1%{?prerel:.%{prerel}}.fc', [
+            ('t', '1'),
+            ('c', '?prerel', [('t', '.'), ('m', 'prerel')]),
+            ('t', '.fc'),
+        ]),
+        ('%{?a:%{!?b:x}y}z', [('c', '?a', [('c', '!?b', [('t', 'x')]), ('t', 'y')]), ('t', 'z')]),
+        ('a}b', [('t', 'a}b')]),
+        ('a%{b', [('t', 'a')]),
+    ])
+    def test_parse(self, s, tree):
+        assert MacroParser.parse(s) == tree
+
+    def test_find_macros(self):
+        names = {'version', 'dist'}
+        assert MacroParser.find_macros('%{name}-%version%{?dist}', names) == [('version', (8, 16)),
+                                                                            ('dist', (16, 24))]
+
+    def test_expand_definitions(self):
+        definitions = {
+            'major': '1',
+            'minor': '2',
+            'ver': '%{major}.%{minor}',
+            'full': '%{ver}-%{rel}',
+            'rel': '3',
+            'loop': '%{loop}x',
+        }
+        assert MacroParser.expand_definitions('%{major}', definitions) == '%{major}'
+        assert MacroParser.expand_definitions('v%{ver}', definitions) == 'v%{major}.%{minor}'
+        assert MacroParser.expand_definitions('%{full}', definitions) == '%{major}.%{minor}-%{rel}'
+        # recursive definitions must not cause infinite recursion
+        assert MacroParser.expand_definitions('%{loop}', definitions) == '%{loop}x'
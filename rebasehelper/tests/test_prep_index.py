@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+from rebasehelper.prep_index import PrepIndex
+
+
+class TestPrepIndex(object):
+
+    BUILDDIR = '/builddir/build/BUILD'
+
+    LINES = [
+        'cd \'/builddir/build/BUILD\'',
+        'rm -rf \'test-1.0.2\'',
+        '/usr/bin/mkdir -p test-1.0.2',
+        'cd \'test-1.0.2\'',
+        '/usr/bin/gzip -dc \'/sources/test-1.0.2.tar.gz\' | /usr/bin/tar -xof -',
+        'echo "Patch #1 (test.patch):"',
+        '/usr/bin/patch --no-backup-if-mismatch -p1 --fuzz=0 < /sources/test.patch',
+        '/usr/bin/patch -p0 -b --suffix .testing --fuzz=0 < /sources/test_testing.patch',
+        'cat /sources/build.patch | /usr/bin/patch -s',
+        'mkdir misc',
+        'tar -xf /sources/misc.tar.xz -C misc',
+        'unzip -qq /sources/doc.zip -d doc',
+        'tar -xf /sources/documentation.zip',
+    ]
+
+    def test_strip_options(self):
+        index = PrepIndex(self.LINES, self.BUILDDIR)
+        assert index.get_strip_option('test.patch') == 1
+        assert index.get_strip_option('test_testing.patch') == 0
+        assert index.get_strip_option('build.patch') == 0
+        assert index.get_strip_option('unknown.patch') is None
+
+    def test_archive_targets(self):
+        index = PrepIndex(self.LINES, self.BUILDDIR)
+        assert index.get_archive_target('/sources/test-1.0.2.tar.gz') == 'test-1.0.2'
+        assert index.get_archive_target('misc.tar.xz') == 'test-1.0.2/misc'
+        assert index.get_archive_target('doc.zip') == 'test-1.0.2/doc'
+        assert index.get_archive_target('documentation.zip') == 'test-1.0.2'
+        assert index.get_archive_target('unknown.tar.gz') is None
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import os
+import pstats
+
+import pytest
+import six
+
+from rebasehelper.profiler import StageProfiler
+
+
+class TestStageProfiler(object):
+
+    def test_profile(self, workdir):
+        def prepare_sources():
+            return [str(i) for i in range(10000)]
+
+        def patch_sources():
+            raise RuntimeError
+
+        path = os.path.join(workdir, 'profile')
+        profiler = StageProfiler(path)
+        assert len(profiler.wrap('prepare_sources', prepare_sources)()) == 10000
+        with pytest.raises(RuntimeError):
+            profiler.wrap('patch_sources', patch_sources)()
+        for stage in ['prepare_sources', 'patch_sources']:
+            stats = pstats.Stats(os.path.join(path, '{}.pstats'.format(stage)))
+            assert [f for f in stats.stats if f[2] == stage]
+            if six.PY3:
+                with open(os.path.join(path, '{}-memory.txt'.format(stage))) as f:
+                    assert f.readline().endswith('allocations of stage {}:\n'.format(stage))
+
+    def test_disabled(self, workdir):
+        profiler = StageProfiler(os.path.join(workdir, 'profile'), enabled=False)
+        with profiler.profile('initialization'):
+            pass
+        assert not os.path.exists(os.path.join(workdir, 'profile'))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import threading
+
+import pytest
+
+from rebasehelper.scheduler import Stage, StageScheduler, StageFailure
+
+
+class TestStageScheduler(object):
+
+    def test_dependencies(self):
+        order = []
+        stages = [
+            Stage('c', lambda: order.append('c'), requires=['a', 'b']),
+            Stage('a', lambda: order.append('a')),
+            Stage('b', lambda: order.append('b'), requires=['a']),
+        ]
+        StageScheduler(stages).run()
+        assert order == ['a', 'b', 'c']
+
+    def test_concurrency(self):
+        # both stages have to run at the same time, otherwise the barrier times out
+        barrier = threading.Event()
+        passed = []
+
+        def first():
+            barrier.wait(5)
+            passed.append(barrier.is_set())
+
+        stages = [
+            Stage('first', first),
+            Stage('second', barrier.set),
+        ]
+        StageScheduler(stages).run()
+        assert passed == [True]
+
+    def test_failure(self):
+        order = []
+
+        def fail():
+            raise RuntimeError('failed')
+
+        stages = [
+            Stage('a', fail, report_failure=False),
+            Stage('b', lambda: order.append('b'), requires=['a']),
+        ]
+        with pytest.raises(StageFailure) as e:
+            StageScheduler(stages).run()
+        assert e.value.stage.name == 'a'
+        assert not e.value.stage.report_failure
+        assert isinstance(e.value.exception, RuntimeError)
+        assert order == []
+        with pytest.raises(RuntimeError):
+            e.value.reraise()
+
+    @pytest.mark.parametrize('stages', [
+        [Stage('a', None), Stage('a', None)],
+        [Stage('a', None, requires=['b'])],
+        [Stage('a', None, requires=['b']), Stage('b', None, requires=['a'])],
+    ], ids=[
+        'duplicate',
+        'unknown',
+        'circular',
+    ])
+    def test_invalid_dependencies(self, stages):
+        with pytest.raises(ValueError):
+            StageScheduler(stages)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import os
+import time
+
+import pytest
+
+from rebasehelper.source_cache import SourceCache
+
+
+class TestSourceCache(object):
+
+    @staticmethod
+    def _tree(path, size=1000):
+        os.makedirs(os.path.join(path, 'src'))
+        with open(os.path.join(path, 'src', 'file.c'), 'wb') as f:
+            f.write(b'x' * size)
+        os.chmod(os.path.join(path, 'src', 'file.c'), 0o640)
+        os.symlink('src', os.path.join(path, 'link'))
+        os.makedirs(os.path.join(path, 'empty'))
+
+    def test_get_key(self, workdir):
+        with open('test-1.0.tar.gz', 'wb') as f:
+            f.write(b'1.0')
+        key = SourceCache.get_key('test-1.0.tar.gz')
+        assert SourceCache.get_key('test-1.0.tar.gz') == key
+        with open('test-1.0.tar.gz', 'wb') as f:
+            f.write(b'1.1')
+        assert SourceCache.get_key('test-1.0.tar.gz') != key
+        assert SourceCache.get_key('missing.tar.gz') is None
+
+    @pytest.mark.parametrize('hardlinks', [False, True], ids=['copies', 'hardlinks'])
+    def test_store_restore(self, workdir, hardlinks):
+        cache = SourceCache(os.path.join(workdir, 'cache'), 2048, hardlinks)
+        self._tree(os.path.join(workdir, 'extracted'))
+        assert not cache.restore('key', os.path.join(workdir, 'restored'))
+        cache.store('key', os.path.join(workdir, 'extracted'))
+        assert cache.restore('key', os.path.join(workdir, 'restored'))
+        restored = os.path.join(workdir, 'restored')
+        assert sorted(os.listdir(restored)) == ['empty', 'link', 'src']
+        assert os.readlink(os.path.join(restored, 'link')) == 'src'
+        with open(os.path.join(restored, 'src', 'file.c'), 'rb') as f:
+            assert f.read() == b'x' * 1000
+        assert os.stat(os.path.join(restored, 'src', 'file.c')).st_mode & 0o777 == 0o640
+        # existing destination is never overwritten
+        assert not cache.restore('key', restored)
+        # replacing a materialized file doesn't affect the cache
+        os.unlink(os.path.join(restored, 'src', 'file.c'))
+        with open(os.path.join(restored, 'src', 'file.c'), 'wb') as f:
+            f.write(b'modified')
+        assert cache.restore('key', os.path.join(workdir, 'again'))
+        with open(os.path.join(workdir, 'again', 'src', 'file.c'), 'rb') as f:
+            assert f.read() == b'x' * 1000
+
+    def test_restore_without_hardlinks(self, workdir):
+        cache = SourceCache(os.path.join(workdir, 'cache'), 2048)
+        cache.reflinks = False
+        self._tree(os.path.join(workdir, 'extracted'))
+        cache.store('key', os.path.join(workdir, 'extracted'))
+        assert cache.restore('key', os.path.join(workdir, 'restored'))
+        # files rewritten in place must not share data with the cache
+        with open(os.path.join(workdir, 'restored', 'src', 'file.c'), 'wb') as f:
+            f.write(b'modified')
+        with open(os.path.join(workdir, 'cache', 'key', SourceCache.FILES_DIR, 'src', 'file.c'), 'rb') as f:
+            assert f.read() == b'x' * 1000
+
+    def test_evict(self, workdir):
+        cache = SourceCache(os.path.join(workdir, 'cache'), 2500)
+        for key in ['first', 'second']:
+            self._tree(os.path.join(workdir, key))
+            cache.store(key, os.path.join(workdir, key))
+        # make the second entry the least recently used one
+        past = time.time() - 60
+        os.utime(os.path.join(workdir, 'cache', 'second'), (past, past))
+        assert cache.restore('first', os.path.join(workdir, 'restored'))
+        self._tree(os.path.join(workdir, 'third'))
+        cache.store('third', os.path.join(workdir, 'third'))
+        assert sorted(os.listdir(os.path.join(workdir, 'cache'))) == ['first', 'third']
+        # trees bigger than the cache are not stored
+        self._tree(os.path.join(workdir, 'big'), size=5000)
+        cache.store('big', os.path.join(workdir, 'big'))
+        assert sorted(os.listdir(os.path.join(workdir, 'cache'))) == ['first', 'third']
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import os
+
+from rebasehelper.spec_content import SpecContent, FilesIndex
+from rebasehelper.tests.conftest import TEST_FILES_DIR
+
+
+class TestSpecContent(object):
+
+    LINES = [
+        '%global version_major 1\n',
+        '%{!?specfile: %global specfile spec file}\n',
+        'Name: test\n',
+        'Source0: %{name}-%{version}.tar.gz\n',
+        'Patch1: test.patch\n',
+        'Patch10: test10.patch\n',
+        '%description\n',
+        'Description\n',
+        '%prep\n',
+        '%autosetup -n %{name}\n',
+        '%patch1 -p1\n',
+        '%patch10 -p0\n',
+        '%files\n',
+        '%changelog\n',
+    ]
+
+    @staticmethod
+    def assert_consistent(content):
+        # incrementally updated indexes have to match rebuilt ones
+        rebuilt = SpecContent(list(content))
+        for kind in [SpecContent.TAG, SpecContent.MACRO_DEFINITION, SpecContent.SETUP,
+                     SpecContent.PATCH, SpecContent.SECTION]:
+            assert content.get_keys(kind) == rebuilt.get_keys(kind)
+            for key in content.get_keys(kind):
+                assert content.find(kind, key) == rebuilt.find(kind, key)
+
+    def test_find(self):
+        content = SpecContent(self.LINES)
+        assert content.find(SpecContent.TAG, 'Patch1') == [4]
+        assert content.find_first(SpecContent.TAG, 'Source0') == 3
+        assert content.find_first(SpecContent.TAG, 'Source1') is None
+        assert content.get_keys(SpecContent.MACRO_DEFINITION) == {'version_major', 'specfile'}
+        assert content.find(SpecContent.SETUP) == [9]
+        assert content.find(SpecContent.PATCH, '1') == [10]
+        assert content.find(SpecContent.PATCH) == [10, 11]
+        assert content.find(SpecContent.SECTION) == [6, 8, 12, 13]
+        assert content.find(SpecContent.SECTION, '%files') == [12]
+
+    def test_modifications(self):
+        content = SpecContent(self.LINES)
+        content[10] = '#%patch1 -p1\n'
+        assert content.find(SpecContent.PATCH) == [11]
+        content.insert(2, 'Version: 1.0\n')
+        assert content.find_first(SpecContent.TAG, 'Version') == 2
+        assert content.find(SpecContent.PATCH, '10') == [12]
+        self.assert_consistent(content)
+        assert content.pop(0) == '%global version_major 1\n'
+        assert content.get_keys(SpecContent.MACRO_DEFINITION) == {'specfile'}
+        self.assert_consistent(content)
+        content.append('%check\n')
+        content.extend(['Release: 1\n'])
+        del content[0]
+        content.remove('Name: test\n')
+        self.assert_consistent(content)
+        content[1:3] = ['%build\n']
+        self.assert_consistent(content)
+        assert content.find(SpecContent.SECTION) == [1, 3, 5, 9, 10, 11]
+        assert content.find(SpecContent.TAG) == [0, 2, 12]
+
+    def test_spec_file(self):
+        with open(os.path.join(TEST_FILES_DIR, 'test.spec')) as f:
+            lines = f.readlines()
+        content = SpecContent(lines)
+        assert ''.join(content) == ''.join(lines)
+        for index in content.find(SpecContent.TAG):
+            assert SpecContent.TAG_RE.match(content[index])
+        for index in reversed(content.find(SpecContent.PATCH)):
+            content.insert(index, '# comment\n')
+            self.assert_consistent(content)
+
+    def test_split_sections(self):
+        sections = SpecContent(self.LINES).split_sections()
+        assert sections[0] == ('%header', self.LINES[:6])
+        assert sections[1] == ('%description', ['Description\n'])
+        assert sections[4] == ('%changelog', [])
+        assert sections.find('%PREP') == [2]
+        assert sections.find('%build') == []
+        sections[5] = ('%files devel', ['/usr/lib/test.so\n'])
+        assert sections.find('%files') == [3]
+        assert sections.find_type('%files') == [3, 5]
+        sections[3] = ('%check', [])
+        del sections[5]
+        assert sections.find_type('%files') == []
+        assert sections.find('%check') == [3]
+
+    def test_macro_definitions(self):
+        content = SpecContent(self.LINES)
+        assert 'version_major' in content.macro_definitions
+        assert content.macro_definitions['version_major'] == '1'
+        assert content.get_macro_value('specfile') == 'spec file'
+        assert content.macro_definitions.get('name') is None
+        content[0] = '%global version_major 2\n'
+        assert content.macro_definitions['version_major'] == '2'
+
+
+class TestFilesIndex(object):
+
+    def test_find(self):
+        index = FilesIndex([
+            '%defattr(-,root,root,-)\n',
+            '%doc README COPYING\n',
+            '%attr(0755, root, root) %{_bindir}/test\n',
+            '%config(noreplace) %{_sysconfdir}/test.conf\n',
+            '#%{_bindir}/test\n',
+            '%{_bindir}/test-extra\n',
+            '%{_bindir}/test\n',
+        ])
+        assert index.find('%{_bindir}/test') == [2, 6]
+        assert index.find('COPYING') == [1]
+        assert index.find('%{_sysconfdir}/test.conf') == [3]
+        assert index.find('%defattr(-,root,root,-)') == []
+        assert index.find('%{_libdir}/test.so') == []
+
+    def test_find_glob(self):
+        index = FilesIndex([
+            '%{_libdir}/libfoo.so.1*\n',
+            '%{_mandir}/man1/foo.1*\n',
+            '%{_bindir}/*\n',
+            '%{_libdir}/libfoo.so.1.2\n',
+        ])
+        assert index.find('%{_libdir}/libfoo.so.1.2') == [0, 3]
+        assert index.find('%{_libdir}/libfoo.so.1') == [0]
+        assert index.find('%{_mandir}/man1/foo.1.gz') == [1]
+        assert index.find('%{_mandir}/man1/bar.1.gz') == []
+        # patterns matching whole directories are not considered
+        assert index.find('%{_bindir}/foo') == []
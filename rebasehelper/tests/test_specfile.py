@@ -27,9 +27,11 @@ import re
 import pytest
 
 from rebasehelper.specfile import SpecFile, spec_hooks_runner
+from rebasehelper.exceptions import RebaseHelperError
 from rebasehelper.spec_hooks.typo_fix import TypoFixHook
 from rebasehelper.spec_hooks.pypi_url_fix import PyPIURLFixHook
 from rebasehelper.constants import BEGIN_COMMENT, END_COMMENT
+from rebasehelper.utils import RpmHelper, DownloadHelper, LookasideCacheHelper, LookasideCacheError
 
 
 class TestSpecFile(object):
@@ -145,6 +147,18 @@ class TestSpecFile(object):
             patches[index] = [p.get_path(), p.get_index()]
         assert patches == expected_patches
 
+    def test_write_updated_patches(self, spec_object):
+        patches = dict(deleted=[self.PATCH_2], inapplicable=[self.PATCH_3], modified=[self.PATCH_4])
+        spec_object.write_updated_patches(patches, True)
+        assert 'Patch1: {}\n'.format(self.PATCH_1) in spec_object.spec_content
+        assert '%patch1\n' in spec_object.spec_content
+        assert 'Patch2: {}\n'.format(self.PATCH_2) not in spec_object.spec_content
+        assert '%patch2 -p1\n' not in spec_object.spec_content
+        assert '#Patch3: {}\n'.format(self.PATCH_3) in spec_object.spec_content
+        assert '#%%patch3 -p1 -b .testing3\n' in spec_object.spec_content
+        assert 'Patch4: rebase-helper-results/rebased-sources/{}\n'.format(self.PATCH_4) in spec_object.spec_content
+        assert spec_object.removed_patches == [self.PATCH_2]
+
     def test_get_requires(self, spec_object):
         expected = {'openssl-devel', 'pkgconfig', 'texinfo', 'gettext', 'autoconf'}
         req = spec_object.get_requires()
@@ -419,6 +433,68 @@ class TestSpecFile(object):
         # the line has to be found, fail if not!
         assert False
 
+    def test_parse_cache(self, spec_object, monkeypatch):
+        parse_spec = RpmHelper.parse_spec
+        parsed = []
+
+        def counting_parse_spec(path, flags=None):
+            parsed.append(path)
+            return parse_spec(path, flags)
+
+        monkeypatch.setattr(RpmHelper, 'parse_spec', counting_parse_spec)
+        spec_object.save()
+        assert not parsed
+        spec_object.set_release_number('42')
+        assert len(parsed) == 1
+        assert spec_object.get_release_number() == '42'
+        # back to the original content, it must not be confused with the previous one
+        spec_object.set_release_number('34')
+        assert spec_object.get_release_number() == '34'
+        count = len(parsed)
+        spec_object.save()
+        assert len(parsed) == count
+        # expansion of %prep depends on presence of sources
+        os.remove(self.SOURCE_4)
+        spec_object._update_data()  # pylint: disable=protected-access
+        assert len(parsed) == count + 1
+
+    def test_edit(self, spec_object, monkeypatch):
+        update_data = SpecFile._update_data
+        updates = []
+
+        def counting_update_data(self):
+            updates.append(self.path)
+            update_data(self)
+
+        monkeypatch.setattr(SpecFile, '_update_data', counting_update_data)
+        with open(spec_object.get_path()) as f:
+            original = f.read()
+        with spec_object.edit():
+            spec_object.set_release_number('42')
+            with spec_object.edit():
+                spec_object.set_tag('License', 'MIT')
+            # changes are deferred until the outermost context exits
+            with open(spec_object.get_path()) as f:
+                assert f.read() == original
+            assert not updates
+        assert len(updates) == 1
+        assert spec_object.get_release_number() == '42'
+        with open(spec_object.get_path()) as f:
+            assert 'License: MIT\n' in f.readlines()
+
+    def test_edit_failure(self, spec_object, monkeypatch):
+        def failing_update_data(self):
+            raise RebaseHelperError('parsing failed')
+
+        monkeypatch.setattr(SpecFile, '_update_data', failing_update_data)
+        with pytest.raises(ValueError):
+            with spec_object.edit():
+                spec_object.set_release_number('42')
+                raise ValueError('editing failed')
+        with pytest.raises(RebaseHelperError):
+            with spec_object.edit():
+                spec_object.set_release_number('43')
+
     def test_get_extra_version_not_set(self, spec_object):
         assert spec_object.get_extra_version() == ''
 
@@ -568,3 +644,27 @@ class TestSpecFile(object):
         spec_object.set_tag(tag, value, preserve_macros=preserve_macros)
         for line in lines_preserve if preserve_macros else lines:
             assert line in spec_object.spec_content
+
+    @pytest.mark.parametrize('complete', [True, False], ids=['complete', 'truncated'])
+    def test_download_remote_sources_extract(self, spec_object, workdir, monkeypatch, complete):
+        def download(*args, **kwargs):  # pylint: disable=unused-argument
+            raise LookasideCacheError('Not available')
+
+        def download_file(url, destination_path, blocksize=8192, tee=None):  # pylint: disable=unused-argument
+            with open(self.OLD_ARCHIVE, 'rb') as f:
+                data = f.read()
+            with open(destination_path, 'wb') as f:
+                f.write(data)
+            tee.write(data if complete else data[:100])
+            return True
+
+        monkeypatch.setattr(LookasideCacheHelper, 'download', staticmethod(download))
+        monkeypatch.setattr(DownloadHelper, 'download_file', staticmethod(download_file))
+        spec_object.sources = ['https://example.com/test-1.0.3.tar.xz']
+        destination = os.path.join(workdir, 'new_sources')
+        assert spec_object.download_remote_sources(destination) == complete
+        assert os.path.isfile(os.path.join(workdir, 'test-1.0.3.tar.xz'))
+        assert os.path.isfile(os.path.join(destination, 'file.txt')) == complete
+        if not complete:
+            # incomplete extraction is removed
+            assert not os.path.exists(destination)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import json
+
+import pytest
+
+from rebasehelper.timing import TimingRecorder
+
+
+class TestTimingRecorder(object):
+
+    def test_summary(self):
+        recorder = TimingRecorder()
+
+        @recorder.timed('download', lambda url: dict(url=url))
+        def download(url):
+            return url
+
+        with recorder.measure(TimingRecorder.STAGE, 'prepare_sources'):
+            assert download('https://example.com/test-1.0.tar.gz') == 'https://example.com/test-1.0.tar.gz'
+            download('https://example.com/test-1.1.tar.gz')
+        with pytest.raises(ValueError):
+            with recorder.measure(TimingRecorder.STAGE, 'patch_sources'):
+                raise ValueError
+        summary = recorder.get_summary()
+        assert sorted(summary['stages']) == ['patch_sources', 'prepare_sources']
+        assert summary['calls']['download']['count'] == 2
+        assert [e['args'] for e in recorder.get_events() if e['category'] == 'download'] == [
+            dict(url='https://example.com/test-1.0.tar.gz'),
+            dict(url='https://example.com/test-1.1.tar.gz'),
+        ]
+        recorder.clear()
+        assert recorder.get_summary() == dict(stages={}, calls={})
+
+    def test_write_chrome_trace(self, workdir):
+        recorder = TimingRecorder()
+        with recorder.measure(TimingRecorder.STAGE, 'build_old_srpm'):
+            with recorder.measure('subprocess', 'run_subprocess_cwd_env', cmd='rpmbuild -bs test.spec'):
+                pass
+        recorder.write_chrome_trace('trace.json')
+        with open('trace.json') as f:
+            trace = json.load(f)
+        events = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        assert [(e['cat'], e['name']) for e in events] == [
+            ('subprocess', 'run_subprocess_cwd_env'),
+            ('stage', 'build_old_srpm'),
+        ]
+        assert events[0]['args'] == dict(cmd='rpmbuild -bs test.spec')
+        assert events[1]['ts'] <= events[0]['ts']
+        assert [e['name'] for e in trace['traceEvents'] if e['ph'] == 'M'] == ['thread_name']
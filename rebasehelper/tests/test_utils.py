@@ -38,10 +38,14 @@ from rebasehelper.utils import DownloadHelper
 from rebasehelper.utils import DownloadError
 from rebasehelper.utils import ProcessHelper
 from rebasehelper.utils import PathHelper
+from rebasehelper.utils import FileHelper
 from rebasehelper.utils import TemporaryEnvironment
 from rebasehelper.utils import RpmHelper
 from rebasehelper.utils import MacroHelper
+from rebasehelper.utils import PathMacroResolver
 from rebasehelper.utils import LookasideCacheHelper
+from rebasehelper.utils import KojiHelper
+from rebasehelper.logger import logger
 
 
 class TestGitHelper(object):
@@ -529,6 +533,24 @@ class TestPathHelper(object):
             assert PathHelper.find_first_file(os.path.curdir, "*.spec") == os.path.abspath(filelist[-1])
 
 
+class TestFileHelper(object):
+
+    def test_move_tree(self, workdir):
+        for path, content in [('src/dir/new.txt', 'new'), ('src/dir/file.txt', 'replaced'), ('src/top.txt', 'top'),
+                              ('dst/dir/file.txt', 'original'), ('dst/dir/kept.txt', 'kept')]:
+            path = os.path.join(workdir, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(content)
+        FileHelper.move_tree(os.path.join(workdir, 'src'), os.path.join(workdir, 'dst'))
+        assert os.listdir(os.path.join(workdir, 'src')) == []
+        for path, content in [('dir/new.txt', 'new'), ('dir/file.txt', 'replaced'), ('top.txt', 'top'),
+                              ('dir/kept.txt', 'kept')]:
+            with open(os.path.join(workdir, 'dst', path)) as f:
+                assert f.read() == content
+
+
 class TestTemporaryEnvironment(object):
     """ TemporaryEnvironment class tests. """
 
@@ -664,6 +686,50 @@ class TestMacroHelper(object):
         assert macros[0]['value'] == 'test_macro value'
         assert macros[0]['level'] == -1
 
+    def test_get_table(self):
+        table = MacroHelper.get_table()
+        assert MacroHelper.get_table() is table
+        MacroHelper.define('test_table_macro', 'first')
+        table = MacroHelper.get_table()
+        macros = MacroHelper.filter(table, name='test_table_macro')
+        assert [m['value'] for m in macros] == ['first']
+        MacroHelper.undefine('test_table_macro')
+        assert not MacroHelper.get_table().filter(name='test_table_macro')
+        assert MacroHelper.get_table().filter(level=-1) == MacroHelper.filter(MacroHelper.dump(), level=-1)
+
+    def test_get_path_resolver(self):
+        resolver = MacroHelper.get_path_resolver()
+        assert MacroHelper.get_path_resolver() is resolver
+        libdir = MacroHelper.expand('%{_libdir}')
+        assert resolver.resolve(libdir + '/libtest.so') == '%{_libdir}/libtest.so'
+        MacroHelper.define('_libdir', '/opt/lib')
+        try:
+            assert MacroHelper.get_path_resolver().resolve('/opt/lib/libtest.so') == '%{_libdir}/libtest.so'
+        finally:
+            MacroHelper.undefine('_libdir')
+
+
+class TestPathMacroResolver(object):
+
+    @pytest.mark.parametrize('path, expected', [
+        ('/usr/bin/test', '%{_bindir}/test'),
+        ('/usr/lib/systemd/system/test.service', '%{_unitdir}/test.service'),
+        ('/usr/lib/test.so', '/usr/lib/test.so'),
+        ('/usr/lib64', '%{_libdir}'),
+        ('/usr/lib64test/test.so', '/usr/lib64test/test.so'),
+        ('/var/tmp/test', '%{_tmppath}/test'),
+        ('/var/log/test', '%{_localstatedir}/log/test'),
+        ('%{_bindir}/test', '%{_bindir}/test'),
+    ])
+    def test_resolve(self, path, expected):
+        resolver = PathMacroResolver([('/usr/lib64', '%{_libdir}'),
+                                      ('/usr/bin', '%{_bindir}'),
+                                      ('/usr/lib/systemd/system', '%{_unitdir}'),
+                                      ('/var/tmp', '%{_tmppath}'),
+                                      ('/var', '%{_localstatedir}'),
+                                      ('/var/tmp', '%{_unused}')])
+        assert resolver.resolve(path) == expected
+
 
 class TestLookasideCacheHelper(object):
 
@@ -695,3 +761,32 @@ class TestLookasideCacheHelper(object):
                                               target)
         assert os.path.isfile(target)
         assert LookasideCacheHelper._hash(target, hashtype) == hsh
+
+
+class TestKojiHelper(object):
+
+    def test_update_task(self, monkeypatch):
+        class FakeTaskWatcher(object):
+            def __init__(self, states):
+                self.states = iter(states)
+                self.info = None
+
+            def update(self):
+                last = self.info
+                self.info = dict(state=next(self.states))
+                return last is not None and last['state'] != self.info['state']
+
+            def str(self):
+                return 'build (f28, test.src.rpm)'
+
+            def display_state(self, info):
+                return info['state']
+
+        messages = []
+        monkeypatch.setattr(logger, 'info', lambda msg, *args: messages.append(msg % args))
+        task = FakeTaskWatcher(['open', 'open', 'closed'])
+        assert [KojiHelper.update_task(task) for _ in range(3)] == [False, False, True]
+        assert messages == [
+            'build (f28, test.src.rpm): open',
+            'build (f28, test.src.rpm): open -> closed',
+        ]
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you to rebase package to the latest version
+# Copyright (C) 2013-2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# he Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hracek <phracek@redhat.com>
+#          Tomas Hozza <thozza@redhat.com>
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import six
+
+
+class TimingRecorder(object):
+    """
+    Class recording durations of rebase stages and of time consuming helper calls.
+
+    Recorded events can be summarized for the rebase report or exported
+    in Chrome trace event format, viewable in chrome://tracing.
+    """
+
+    # category of events recorded for rebase stages
+    STAGE = 'stage'
+
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._origin = time.time()
+
+    def clear(self):
+        with self._lock:
+            del self._events[:]
+            self._origin = time.time()
+
+    def record(self, category, name, start, duration, args=None):
+        """
+        Records a finished event.
+
+        :param category: category of the event, e.g. 'stage' or 'download'
+        :param name: name of the event
+        :param start: start time as returned by time.time()
+        :param duration: duration in seconds
+        :param args: dict with additional information about the event
+        """
+        thread = threading.current_thread()
+        with self._lock:
+            self._events.append(dict(category=category, name=name, start=start, duration=duration,
+                                     args=args or {}, thread=(thread.ident, thread.name)))
+
+    @contextlib.contextmanager
+    def measure(self, category, name, **args):
+        """
+        Context manager measuring duration of the enclosed block.
+
+        :param category: category of the event
+        :param name: name of the event
+        :param args: additional information about the event
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(category, name, start, time.time() - start, args)
+
+    def timed(self, category, args=None):
+        """
+        Decorator measuring duration of calls of a function.
+
+        :param category: category of the events
+        :param args: callable getting arguments of the call and returning a dict
+                     with additional information about the event
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*fargs, **fkwargs):
+                with self.measure(category, function.__name__, **(args(*fargs, **fkwargs) if args else {})):
+                    return function(*fargs, **fkwargs)
+            return wrapper
+        return decorator
+
+    def get_events(self):
+        with self._lock:
+            return list(self._events)
+
+    def get_summary(self):
+        """
+        Summarizes recorded events.
+
+        :return: dict with durations of stages in seconds and number and total duration
+                 of calls in each of the other categories
+        """
+        stages = {}
+        calls = {}
+        for event in self.get_events():
+            if event['category'] == self.STAGE:
+                stages[event['name']] = round(event['duration'], 3)
+            else:
+                summary = calls.setdefault(event['category'], dict(count=0, total=0.0))
+                summary['count'] += 1
+                summary['total'] += event['duration']
+        for summary in six.itervalues(calls):
+            summary['total'] = round(summary['total'], 3)
+        return dict(stages=stages, calls=calls)
+
+    def write_chrome_trace(self, path):
+        """
+        Writes recorded events to a file in Chrome trace event format.
+
+        :param path: path to the file
+        """
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for event in self.get_events():
+            tid, thread_name = event['thread']
+            threads[tid] = thread_name
+            events.append(dict(name=event['name'], cat=event['category'], ph='X', pid=pid, tid=tid,
+                               ts=int((event['start'] - self._origin) * 1e6),
+                               dur=int(event['duration'] * 1e6),
+                               args={k: six.text_type(v) for k, v in six.iteritems(event['args'])}))
+        for tid, thread_name in six.iteritems(threads):
+            events.append(dict(name='thread_name', ph='M', pid=pid, tid=tid, args=dict(name=thread_name)))
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f, indent=1)
+
+
+# global timing recorder
+timings = TimingRecorder()
@@ -37,6 +37,7 @@ import subprocess
 import sys
 import tempfile
 import termios
+import threading
 import time
 import tty
 
@@ -56,6 +57,7 @@ from pkg_resources import parse_version
 
 from rebasehelper.exceptions import RebaseHelperError
 from rebasehelper.logger import logger
+from rebasehelper.timing import timings
 
 try:
     from requests_gssapi import HTTPSPNEGOAuth as SPNEGOAuth
@@ -293,6 +295,10 @@ class ConsoleHelper(object):
     class Capturer(object):
         """ContextManager for capturing stdout/stderr"""
 
+        # file descriptors are shared by all threads, only one capture can be active at a time and output
+        # of other threads is captured as well, so it can't be used while other threads write to the streams
+        _lock = threading.RLock()
+
         def __init__(self, stdout=False, stderr=False):
             self.capture_stdout = stdout
             self.capture_stderr = stderr
@@ -306,6 +312,7 @@ class ConsoleHelper(object):
             self._stderr_copy = None
 
         def __enter__(self):
+            self._lock.acquire()
             self._stdout_fileno = sys.__stdout__.fileno()  # pylint: disable=no-member
             self._stderr_fileno = sys.__stderr__.fileno()  # pylint: disable=no-member
 
@@ -324,34 +331,37 @@ class ConsoleHelper(object):
             return self
 
         def __exit__(self, *args):
-            if self._stdout_copy:
-                sys.stdout.flush()
-                os.dup2(self._stdout_copy.fileno(), self._stdout_fileno)
-            if self._stderr_copy:
-                sys.stderr.flush()
-                os.dup2(self._stderr_copy.fileno(), self._stderr_fileno)
-
-            if self._stdout_tmp:
-                self._stdout_tmp.flush()
-                self._stdout_tmp.seek(0, io.SEEK_SET)
-                self.stdout = self._stdout_tmp.read()
-                if six.PY3:
-                    self.stdout = self.stdout.decode(defenc)
-            if self._stderr_tmp:
-                self._stderr_tmp.flush()
-                self._stderr_tmp.seek(0, io.SEEK_SET)
-                self.stderr = self._stderr_tmp.read()
-                if six.PY3:
-                    self.stderr = self.stderr.decode(defenc)
-
-            if self._stdout_tmp:
-                self._stdout_tmp.close()
-            if self._stderr_tmp:
-                self._stderr_tmp.close()
-            if self._stdout_copy:
-                self._stdout_copy.close()
-            if self._stderr_copy:
-                self._stderr_copy.close()
+            try:
+                if self._stdout_copy:
+                    sys.stdout.flush()
+                    os.dup2(self._stdout_copy.fileno(), self._stdout_fileno)
+                if self._stderr_copy:
+                    sys.stderr.flush()
+                    os.dup2(self._stderr_copy.fileno(), self._stderr_fileno)
+
+                if self._stdout_tmp:
+                    self._stdout_tmp.flush()
+                    self._stdout_tmp.seek(0, io.SEEK_SET)
+                    self.stdout = self._stdout_tmp.read()
+                    if six.PY3:
+                        self.stdout = self.stdout.decode(defenc)
+                if self._stderr_tmp:
+                    self._stderr_tmp.flush()
+                    self._stderr_tmp.seek(0, io.SEEK_SET)
+                    self.stderr = self._stderr_tmp.read()
+                    if six.PY3:
+                        self.stderr = self.stderr.decode(defenc)
+
+                if self._stdout_tmp:
+                    self._stdout_tmp.close()
+                if self._stderr_tmp:
+                    self._stderr_tmp.close()
+                if self._stdout_copy:
+                    self._stdout_copy.close()
+                if self._stderr_copy:
+                    self._stderr_copy.close()
+            finally:
+                self._lock.release()
 
 
 class DownloadError(Exception):
@@ -456,14 +466,16 @@ class DownloadHelper(object):
             return None
 
     @staticmethod
-    def download_file(url, destination_path, blocksize=8192):
+    @timings.timed('download', lambda url, *args, **kwargs: dict(url=url))
+    def download_file(url, destination_path, blocksize=8192, tee=None):
         """
         Method for downloading file from HTTP, HTTPS and FTP URL.
 
         :param url: URL from which to download the file
         :param destination_path: path where to store downloaded file
         :param blocksize: size in Bytes of blocks used for downloading the file and reporting progress
-        :return: None
+        :param tee: writable file-like object downloaded data are written to as well as to the file
+        :return: True if the file was downloaded, False if it existed already
         """
         r = DownloadHelper.request(url, stream=True)
         if r is None:
@@ -483,7 +495,7 @@ class DownloadHelper(object):
             else:
                 logger.debug("The destination file '%s' exists, and the size is correct! Skipping download.",
                              destination_path)
-                return
+                return False
         try:
             with open(destination_path, 'wb') as local_file:
                 logger.info('Downloading file from URL %s', url)
@@ -497,6 +509,8 @@ class DownloadHelper(object):
                 for chunk in r.iter_content(chunk_size=blocksize):
                     downloaded += len(chunk)
                     local_file.write(chunk)
+                    if tee:
+                        tee.write(chunk)
 
                     # report progress
                     DownloadHelper.progress(file_size, downloaded, download_start)
@@ -506,6 +520,7 @@ class DownloadHelper(object):
         except KeyboardInterrupt as e:
             os.remove(destination_path)
             raise e
+        return True
 
 
 class ProcessHelper(object):
@@ -563,6 +578,8 @@ class ProcessHelper(object):
                                                     shell=shell)
 
     @staticmethod
+    @timings.timed('subprocess', lambda cmd, *args, **kwargs: dict(
+        cmd=cmd if isinstance(cmd, six.string_types) else ' '.join(six.text_type(c) for c in cmd)))
     def run_subprocess_cwd_env(cmd, cwd=None, env=None, input_file=None, output_file=None, shell=False):
         """
         Runs the passed command as a subprocess in different
@@ -790,6 +807,11 @@ class TemporaryEnvironment(object):
         return self._env.copy()
 
 
+# rpm macro context is global to the process, parsing SPEC files and working with macros
+# must not happen in more threads at the same time
+rpm_lock = threading.RLock()
+
+
 class RpmHelper(object):
 
     """Helper class for doing various tasks with RPM database, packages, ..."""
@@ -868,8 +890,8 @@ class RpmHelper(object):
     def get_arches():
         """Get list of all known architectures"""
         arches = ['aarch64', 'noarch', 'ppc', 'riscv64', 's390', 's390x', 'src', 'x86_64']
-        macros = MacroHelper.dump()
-        macros = [m for m in macros if m['name'] in ('ix86', 'arm', 'mips', 'sparc', 'alpha', 'power64')]
+        table = MacroHelper.get_table()
+        macros = [m for n in ('ix86', 'arm', 'mips', 'sparc', 'alpha', 'power64') for m in table.filter(name=n)]
         for m in macros:
             arches.extend(MacroHelper.expand(m['value'], '').split())
         return arches
@@ -909,57 +931,266 @@ class RpmHelper(object):
                 # remove BuildArch to workaround rpm bug
                 tmp.write(b''.join([l for l in orig.readlines() if not l.startswith(b'BuildArch')]))
                 tmp.flush()
-                with ConsoleHelper.Capturer(stderr=True) as capturer:
-                    result = rpm.spec(tmp.name, flags) if flags is not None else rpm.spec(tmp.name)
-                for line in capturer.stderr.split('\n'):
+                # rpm logs into a file instead of the standard error output shared by all threads
+                with rpm_lock, tempfile.TemporaryFile() as log:
+                    rpm.setLogFile(log)
+                    try:
+                        result = rpm.spec(tmp.name, flags) if flags is not None else rpm.spec(tmp.name)
+                    finally:
+                        rpm.setLogFile(None)
+                        # parsing defines macros
+                        MacroHelper.invalidate()
+                    log.seek(0)
+                    output = log.read().decode(defenc, 'replace')
+                for line in output.split('\n'):
                     if line:
                         logger.debug('rpm: %s', line)
                 return result
 
 
+class MacroTable(object):
+
+    """Table of RPM macros as returned by MacroHelper.dump(), indexed by name and level"""
+
+    def __init__(self, macros):
+        self.macros = list(macros)
+        self._names = {}
+        self._levels = {}
+        for macro in self.macros:
+            self._names.setdefault(macro['name'], []).append(macro)
+            self._levels.setdefault(macro['level'], []).append(macro)
+
+    def __iter__(self):
+        return iter(self.macros)
+
+    def __len__(self):
+        return len(self.macros)
+
+    def filter(self, **kwargs):
+        """
+        Returns all macros satisfying specified filters, see MacroHelper.filter()
+
+        :param kwargs: filters, filtering by name or level uses indexes
+        :return: filtered list of macros
+        """
+        if 'name' in kwargs:
+            macros = self._names.get(kwargs['name'], [])
+        elif 'level' in kwargs:
+            macros = self._levels.get(kwargs['level'], [])
+        else:
+            macros = self.macros
+        return MacroHelper.filter(macros, **kwargs)
+
+
+class PathMacroResolver(object):
+
+    """
+    Resolver replacing leading directories of absolute paths with RPM macros.
+
+    Directories are stored in a trie of path components, resolving a path takes time linear
+    to the number of its components and the deepest matching directory is always used.
+    """
+
+    # macros of standard directories, values of the first ones take precedence
+    MACROS = ['_libdir',
+              '_libexecdir',
+              '_unitdir',
+              '_bindir',
+              '_sbindir',
+              '_includedir',
+              '_mandir',
+              '_infodir',
+              '_docdir',
+              '_datarootdir',
+              '_datadir',
+              '_sysconfdir',
+              '_sharedstatedir',
+              '_tmppath',
+              '_localstatedir']
+
+    # directories used when the corresponding macro is defined differently, e.g. /usr/lib on 64-bit systems
+    FALLBACK_PATHS = {'/usr/lib64': '%{_libdir}',
+                      '/usr/libexec': '%{_libexecdir}',
+                      '/usr/lib/systemd/system': '%{_unitdir}',
+                      '/usr/lib': '%{_libdir}',
+                      '/usr/bin': '%{_bindir}',
+                      '/usr/sbin': '%{_sbindir}',
+                      '/usr/include': '%{_includedir}',
+                      '/usr/share/man': '%{_mandir}',
+                      '/usr/share/info': '%{_infodir}',
+                      '/usr/share/doc': '%{_docdir}',
+                      '/usr/share': '%{_datarootdir}',
+                      '/var/lib': '%{_sharedstatedir}',
+                      '/var/tmp': '%{_tmppath}',
+                      '/var': '%{_localstatedir}',
+                      }
+
+    def __init__(self, paths):
+        """
+        Constructor of PathMacroResolver.
+
+        :param paths: list of tuples (absolute path to a directory, macro), if a directory
+                      is listed multiple times, the first macro is used
+        """
+        # each node is a dict of child nodes by path component, a macro is stored under None
+        self._root = {}
+        for path, macro in paths:
+            node = self._root
+            for component in path.strip('/').split('/'):
+                node = node.setdefault(component, {})
+            node.setdefault(None, macro)
+
+    @classmethod
+    def from_macros(cls, table):
+        """
+        Creates a resolver from current values of macros of standard directories.
+
+        :param table: MacroTable instance
+        :return: PathMacroResolver instance
+        """
+        paths = []
+        for name in cls.MACROS:
+            if not table.filter(name=name):
+                continue
+            macro = '%{{{}}}'.format(name)
+            value = MacroHelper.expand(macro, '')
+            if value.startswith('/'):
+                paths.append((os.path.normpath(value), macro))
+        paths.extend(sorted(six.iteritems(cls.FALLBACK_PATHS)))
+        return cls(paths)
+
+    def resolve(self, path):
+        """
+        Replaces the deepest known directory in an absolute path with its macro.
+
+        :param path: absolute path
+        :return: path with RPM macro or the original path if no directory is known
+        """
+        if not path.startswith('/'):
+            return path
+        components = path.split('/')[1:]
+        node = self._root
+        match = None
+        for depth, component in enumerate(components):
+            node = node.get(component)
+            if node is None:
+                break
+            if None in node:
+                match = depth + 1, node[None]
+        if match is None:
+            return path
+        depth, macro = match
+        return '/'.join([macro] + components[depth:])
+
+
 class MacroHelper(object):
 
     """Helper class for working with RPM macros """
 
+    MACRO_RE = re.compile(
+        r'''
+        ^\s*
+        (?P<level>-?\d+)
+        (?P<used>=|:)
+        [ ]
+        (?P<name>\w+)
+        (?P<options>\(.+?\))?
+        [\t]
+        (?P<value>.*)
+        $
+        ''',
+        re.VERBOSE)
+
+    # table of macros defined the last time it was needed, None if macros changed since then
+    _table = None
+    # resolver created from the table above
+    _path_resolver = None
+
     @staticmethod
     def expand(s, default=None):
         try:
-            return rpm.expandMacro(s)
+            with rpm_lock:
+                return rpm.expandMacro(s)
         except rpm.error:
             return default
 
-    @staticmethod
-    def dump():
+    @classmethod
+    def define(cls, name, value):
+        """
+        Defines a macro.
+
+        :param name: name of the macro
+        :param value: value of the macro
+        """
+        with rpm_lock:
+            rpm.addMacro(name, value)
+            cls.invalidate()
+
+    @classmethod
+    def undefine(cls, name):
+        """
+        Removes the most recent definition of a macro.
+
+        :param name: name of the macro
+        """
+        with rpm_lock:
+            rpm.delMacro(name)
+            cls.invalidate()
+
+    @classmethod
+    def invalidate(cls):
+        """Invalidates the macro table, needed after macros are changed other way than by this class."""
+        cls._table = None
+        cls._path_resolver = None
+
+    @classmethod
+    def get_table(cls):
+        """
+        Returns table of all defined macros. It is computed when needed for the first time
+        and then reused until macros change.
+
+        :return: MacroTable instance
+        """
+        with rpm_lock:
+            table = cls._table
+            if table is None:
+                table = cls._table = MacroTable(cls.dump())
+            return table
+
+    @classmethod
+    def get_path_resolver(cls):
+        """
+        Returns resolver of paths to paths with RPM macros, it is reused until macros change.
+
+        :return: PathMacroResolver instance
+        """
+        with rpm_lock:
+            resolver = cls._path_resolver
+            if resolver is None:
+                resolver = cls._path_resolver = PathMacroResolver.from_macros(cls.get_table())
+            return resolver
+
+    @classmethod
+    def dump(cls):
         """
         Returns list of all defined macros
 
         :return: list of macros
         """
-        macro_re = re.compile(
-            r'''
-            ^\s*
-            (?P<level>-?\d+)
-            (?P<used>=|:)
-            [ ]
-            (?P<name>\w+)
-            (?P<options>\(.+?\))?
-            [\t]
-            (?P<value>.*)
-            $
-            ''',
-            re.VERBOSE)
-
-        with ConsoleHelper.Capturer(stderr=True) as capturer:
+        # %dump can print only to the standard error output, it's captured just for a moment while rpm
+        # is locked, log messages and output of subprocesses go to the standard output, not there
+        with rpm_lock, ConsoleHelper.Capturer(stderr=True) as capturer:
             rpm.expandMacro('%dump')
 
         macros = []
+        # in RPM < 4.13.90 level of some macros is decreased by 1
+        decreased_levels = parse_version(rpm.__version__) < parse_version('4.13.90')
 
         def add_macro(properties):
             macro = dict(properties)
             macro['used'] = macro['used'] == '='
             macro['level'] = int(macro['level'])
-            if parse_version(rpm.__version__) < parse_version('4.13.90'):
-                # in RPM < 4.13.90 level of some macros is decreased by 1
+            if decreased_levels:
                 if macro['level'] == -1:
                     # this could be macro with level -1 or level 0, we can not be sure
                     # so just duplicate the macro for both levels
@@ -976,7 +1207,7 @@ class MacroHelper(object):
                 macros.append(macro)
 
         for line in capturer.stderr.split('\n'):
-            match = macro_re.match(line)
+            match = cls.MACRO_RE.match(line)
             if match:
                 add_macro(match.groupdict())
 
@@ -987,10 +1218,13 @@ class MacroHelper(object):
         """
         Returns all macros satisfying specified filters
 
-        :param macros: list of macros to be filtered
+        :param macros: list of macros or MacroTable instance to be filtered
         :param kwargs: filters
         :return: filtered list of macros
         """
+        if isinstance(macros, MacroTable):
+            return macros.filter(**kwargs)
+
         def _test(macro):
             return all(macro.get(k[4:]) >= v if k.startswith('min_') else
                        macro.get(k[4:]) <= v if k.startswith('max_') else
@@ -1126,6 +1360,28 @@ class KojiHelper(object):
                 # shouldn't happen
                 logger.info('%s has not completed', task_label)
 
+    @staticmethod
+    def update_task(task):
+        """Updates info about a Koji task and logs changes of its state.
+
+        TaskWatcher prints the changes itself if it's not quiet, but the standard output
+        can't be captured while other threads write there.
+
+        Args:
+            task (koji.TaskWatcher): Quiet TaskWatcher instance.
+
+        Returns:
+            bool: Whether the state of the task changed.
+
+        """
+        last = task.info
+        changed = task.update()
+        if last is None:
+            logger.info('%s: %s', task.str(), task.display_state(task.info))
+        elif changed:
+            logger.info('%s: %s -> %s', task.str(), task.display_state(last), task.display_state(task.info))
+        return changed
+
     @classmethod
     def watch_koji_tasks(cls, session, tasklist):
         """Waits for Koji tasks to finish and prints their states.
@@ -1146,15 +1402,11 @@ class KojiHelper(object):
             tasks = {}
             for task_id in tasklist:
                 task_id = int(task_id)
-                tasks[task_id] = TaskWatcher(task_id, session, quiet=False)
+                tasks[task_id] = TaskWatcher(task_id, session, quiet=True)
             while True:
                 all_done = True
                 for task_id, task in list(tasks.items()):
-                    with ConsoleHelper.Capturer(stdout=True) as capturer:
-                        changed = task.update()
-                    for line in capturer.stdout.split('\n'):
-                        if line:
-                            logger.info(line)
+                    changed = cls.update_task(task)
                     info = session.getTaskInfo(task_id)
                     state = task.info['state']
                     if state == koji.TASK_STATES['FAILED']:
@@ -1174,12 +1426,8 @@ class KojiHelper(object):
                     for child in session.getTaskChildren(task_id):
                         child_id = child['id']
                         if child_id not in list(tasks.keys()):
-                            tasks[child_id] = TaskWatcher(child_id, session, task.level + 1, quiet=False)
-                            with ConsoleHelper.Capturer(stdout=True) as capturer:
-                                tasks[child_id].update()
-                            for line in capturer.stdout.split('\n'):
-                                if line:
-                                    logger.info(line)
+                            tasks[child_id] = TaskWatcher(child_id, session, task.level + 1, quiet=True)
+                            cls.update_task(tasks[child_id])
                             info = session.getTaskInfo(child_id)
                             state = task.info['state']
                             if state == koji.TASK_STATES['FAILED']:
@@ -1459,6 +1707,45 @@ class FileHelper(object):
         else:
             return False
 
+    @staticmethod
+    def update_checksum(checksum, filename, blocksize=65536):
+        """
+        Updates a checksum with content of a file.
+
+        :param checksum: hashlib checksum object
+        :param filename: path to the file
+        :param blocksize: size of blocks the file is read in
+        """
+        with open(filename, 'rb') as f:
+            chunk = f.read(blocksize)
+            while chunk:
+                checksum.update(chunk)
+                chunk = f.read(blocksize)
+
+    @staticmethod
+    def move_tree(source, destination):
+        """
+        Moves content of a directory into another one, merging it with existing content.
+        Existing files are replaced, like when an archive is extracted over them.
+
+        :param source: path to the directory to move content of
+        :param destination: path to the target directory, created if it doesn't exist
+        """
+        if not os.path.isdir(destination):
+            os.makedirs(destination)
+        for name in os.listdir(source):
+            src = os.path.join(source, name)
+            dst = os.path.join(destination, name)
+            if os.path.isdir(src) and not os.path.islink(src) and os.path.isdir(dst) and not os.path.islink(dst):
+                FileHelper.move_tree(src, dst)
+                os.rmdir(src)
+                continue
+            if os.path.isdir(dst) and not os.path.islink(dst):
+                shutil.rmtree(dst)
+            elif os.path.lexists(dst):
+                os.unlink(dst)
+            os.rename(src, dst)
+
 
 class LookasideCacheError(Exception):
 
@@ -1472,6 +1759,8 @@ class LookasideCacheHelper(object):
     """Class for downloading files from Fedora/RHEL lookaside cache"""
 
     rpkg_config_dir = '/etc/rpkg'
+    # directory with downloaded sources shared by more rebase-helper processes, disabled if None
+    cache_dir = None
 
     @classmethod
     def _read_config(cls, tool):
@@ -1529,6 +1818,13 @@ class LookasideCacheHelper(object):
                 return
             else:
                 os.unlink(target)
+        cached = None
+        if cls.cache_dir:
+            cached = os.path.join(cls.cache_dir, hashtype, hsh, os.path.basename(filename))
+            if os.path.isfile(cached):
+                logger.debug("Using cached '%s'", cached)
+                shutil.copy(cached, target)
+                return
         if tool == 'fedpkg':
             url = '{}/{}/{}/{}/{}/{}'.format(url, package, filename, hashtype, hsh, filename)
         else:
@@ -1537,6 +1833,22 @@ class LookasideCacheHelper(object):
             DownloadHelper.download_file(url, target)
         except DownloadError as e:
             raise LookasideCacheError(six.text_type(e))
+        if cached and cls._hash(target, hashtype) == hsh:
+            cls._store_cached_source(target, cached)
+
+    @classmethod
+    def _store_cached_source(cls, path, cached):
+        try:
+            os.makedirs(os.path.dirname(cached))
+        except OSError:
+            # the directory could have been created by another process in the meantime
+            if not os.path.isdir(os.path.dirname(cached)):
+                raise
+        # copy the file under a temporary name first, so that other processes never see it incomplete
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cached))
+        os.close(fd)
+        shutil.copy(path, tmp)
+        os.rename(tmp, cached)
 
     @classmethod
     def download(cls, tool, basepath, package):
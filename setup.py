@@ -85,11 +85,14 @@ setup(
         'rebasehelper.versioneers',
         'rebasehelper.tests',
         'rebasehelper.tests.functional',
+        'rebasehelper.tests.benchmarks',
     ],
     include_package_data=True,
     entry_points={
         'console_scripts': [
             'rebase-helper = rebasehelper.cli:CliHelper.run',
+            'rebase-helper-batch = rebasehelper.batch:BatchHelper.run',
+            'rebase-helper-daemon = rebasehelper.daemon:DaemonHelper.run',
         ],
         'rebasehelper.build_tools': [
             'rpmbuild = rebasehelper.build_tools.rpmbuild_tool:RpmbuildBuildTool',